@@ -15,7 +15,13 @@ ALL_MANDATORY_KEYS = [
     "diffractionEngine",
 ]
 
-diffractionEngines = ["fresnel_fourier", "ASM_fourier"]
+diffractionEngines = ["fresnel_fourier", "fresnel_czt", "ASM_fourier", "ASM_bandlimited", "ASM_scaled"]
+
+hankelMethods = ["qdht", "fht"]
+
+msUpsamplingModes = ["nearest", "integer", "cell_aperture"]
+
+calculationDtypes = [tf.float64, tf.float32]
 
 ALL_OPTIONAL_KEYS = {
     "nyquist_modifier": 1,
@@ -23,22 +29,34 @@ ALL_OPTIONAL_KEYS = {
     "radius_m": None,
     "dtype": tf.float64,
     "accurate_measurement": True,
+    "hankel_method": "qdht",
+    "roi_propagation": False,
+    "ms_upsampling": "nearest",
 }
 
 HIDDEN_KEYS = ["_prop_params__verbose"]
 
 ADDED_KEYS = [
     "ms_samplesM",
+    "calc_samplesM",
     "calc_ms_dx_m",
     "padms_half",
+    "padasm_half",
     "calc_samplesN",
     "calc_sensor_dx_m",
+    "calc_sensor_samplesN",
     "ratio_pixel_to_grid",
     "broadband_flag",
     "grid_shape",
 ]
 
 
+def odd_upsampling_factor(ms_dx, calc_dx):
+    # Smallest odd integer number of calculation samples per metasurface cell with a pitch no larger than calc_dx
+    factor = max(int(math.ceil(ms_dx / calc_dx - 1e-9)), 1)
+    return factor + 1 if factor % 2 == 0 else factor
+
+
 def estimateBandwidth(parameters):
     # Compute fresnel number to determine estimate for minimum Whittaker-Shannon lens sampling
     # Use fresnel number to define an approximate fourier bandwidth
@@ -63,6 +81,36 @@ def estimateBandwidth(parameters):
     return np.array(bandwidthxy)
 
 
+def oddFFTLength(min_length):
+    # Smallest odd integer >= min_length with no prime factors other than 3, 5, and 7 (odd grids keep the centred
+    # conventions of the fourier engines while avoiding slow, large-prime FFT lengths)
+    length = int(min_length) + 1 - int(min_length) % 2
+    while True:
+        remainder = length
+        for factor in [3, 5, 7]:
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return length
+        length += 2
+
+
+def sensorWindowSamples(calc_samples, calc_dx, pixel_size, pixel_number, accurate_measurement):
+    # Number of samples in the centred window of the sensor plane grid that the detector measurement uses. The window
+    # covers the detector plus one grid cell on each side. For the box-filter measurement, the grid is instead trimmed
+    # by whole multiples of the rounded pixel ratio so that the filter bins are unchanged
+    if accurate_measurement:
+        required = int(math.ceil(pixel_size * pixel_number / calc_dx)) + 2
+        trim = (calc_samples - required) // 2
+    else:
+        ratio = max(int(np.round(pixel_size / calc_dx)), 1)
+        required = ratio * (pixel_number + 1) - 1
+        box_number = (calc_samples + calc_samples % ratio - ratio) // ratio + 1
+        trim = ratio * min((box_number - pixel_number) // 2, (calc_samples - required) // (2 * ratio))
+
+    return calc_samples - 2 * max(trim, 0)
+
+
 class prop_params(dict):
     """Parameters object (dictionary) used for the propagation in the Fourier layers. Defines the simulation settings.    
     """
@@ -94,8 +142,30 @@ class prop_params(dict):
                     See documentation for valid options. \\
                 (optional) `"radius_m"`: float indicating the radius of a circular field aperture to be placed at the
                      metasurface/input plane. Defaults to None.\\ 
-                (optional) `"dtype"`: tf.dtype to be used during all calculations. Defaults to tf.float64 and should
-                     not be changed in the current version!
+                (optional) `"dtype"`: tf.dtype to be used during all calculations; either tf.float64 or tf.float32 
+                     (complex64 fields), which halves memory and roughly doubles throughput at reduced accuracy. 
+                     Defaults to tf.float64.\\
+                (optional) `"hankel_method"`: Hankel transform used when radial_symmetry is True; either "qdht"
+                     (dense quasi-discrete Hankel transform) or "fht" (O(N log N) FFTLog transform, for large radial 
+                     grids). "fht" is approximate: it matches "qdht" to ~1e-6 of the peak for smooth fields but only
+                     to ~4e-3 for lens fields with sharp edges, so it trades accuracy for speed and memory on large
+                     grids rather than being a drop-in replacement. Defaults to "qdht".\\
+                (optional) `"accurate_measurement"`: Boolean flag; if True, the sensor plane field is integrated over
+                     the detector pixels exactly using area-overlap matrices, supporting fractional ratios of the 
+                     detector pixel size to the sensor plane grid pitch. If False, a box filter with the rounded integer
+                     ratio is used. Defaults to True.\\
+                (optional) `"roi_propagation"`: Boolean flag; if True, the sensor plane field is only evaluated on 
+                     the centred window of the calculation grid that the detector measurement uses 
+                     ("calc_sensor_samplesN"), via a pruned (chirp-z) DFT for the fresnel engines and the scaled ASM 
+                     inverse transform, or by cropping directly after propagation otherwise. Defaults to False.\\
+                (optional) `"ms_upsampling"`: Representation of the metasurface cells on the calculation grid; either 
+                     "nearest" (nearest neighbor upsampling to the sampling required by the propagation), "integer" 
+                     (the calculation pitch is rounded down to an odd integer fraction of ms_dx_m so that each cell is 
+                     upsampled by exact repetition), or "cell_aperture" (no upsampling; the calculation grid is the 
+                     metasurface grid and the rectangular cell aperture is applied as a sinc factor in the frequency 
+                     domain of the propagator). "cell_aperture" is only valid without radial_symmetry and is accurate 
+                     when ms_dx_m resolves the propagation, e.g. for subwavelength cells with the band-limited ASM 
+                     engines. Defaults to "nearest".
         """
         self.__dict__ = deepcopy(input_dict)
         self.__check_mandatory_keys()
@@ -103,6 +173,9 @@ class prop_params(dict):
         self.__check_optional_keys()
         self.__check_unknown_keys()
         self.__check_diffractionEngine_selection()
+        self.__check_hankel_method_selection()
+        self.__check_ms_upsampling_selection()
+        self.__check_dtype_selection()
         self.__regularize_radial_symmetry()
         self.__check_detector_pixel_size()
         self.__add_implied_keys()
@@ -180,7 +253,33 @@ class prop_params(dict):
 
     def __check_diffractionEngine_selection(self):
         if not (self.__dict__["diffractionEngine"] in diffractionEngines):
-            raise ValueError("diffractionEngine selection invalid: must be either 'fresnel_fourier' or 'ASM_fourier'.")
+            raise ValueError(
+                "diffractionEngine selection invalid: must be one of 'fresnel_fourier', 'fresnel_czt', 'ASM_fourier', "
+                + "'ASM_bandlimited', or 'ASM_scaled'."
+            )
+
+        return
+
+    def __check_hankel_method_selection(self):
+        if not (self.__dict__["hankel_method"] in hankelMethods):
+            raise ValueError("hankel_method selection invalid: must be either 'qdht' or 'fht'.")
+
+        return
+
+    def __check_ms_upsampling_selection(self):
+        if not (self.__dict__["ms_upsampling"] in msUpsamplingModes):
+            raise ValueError(
+                "ms_upsampling selection invalid: must be one of 'nearest', 'integer', or 'cell_aperture'."
+            )
+
+        if self.__dict__["ms_upsampling"] == "cell_aperture" and self.__dict__["radial_symmetry"]:
+            raise ValueError("params: ms_upsampling 'cell_aperture' cannot be used with the radial_symmetry flag")
+
+        return
+
+    def __check_dtype_selection(self):
+        if not (self.__dict__["dtype"] in calculationDtypes):
+            raise ValueError("dtype selection invalid: must be either tf.float64 or tf.float32.")
 
         return
 
@@ -303,6 +402,7 @@ class prop_params(dict):
             print("\n", "calc_samplesN: ", calc_samplesN)
             print("\n", "initial_sensor_dx_m: ", initial_sensor_dx_m)
             print("\n", "calc_sensor_dx_m: ", calc_sensor_dx_m)
+            print("\n", "calc_sensor_samplesN: ", self.__dict__["calc_sensor_samplesN"])
             print("\n", "detector pixel size: ", sensor_pixel_size_m)
             print("\n", "detector pixel number: ", sensor_pixel_number)
             print("\n")
@@ -317,13 +417,20 @@ class prop_params(dict):
         # Obtain the max estimated bandwidth required to compute metasurface sampling rate cutoff
         # For the fresnel case, just get estBandwidth from quadratic phase profile
         # For the exact transfer function, we should consider the estBandwidth vs the H bandwidth
-        if diffractionEngine == "fresnel_fourier":
+        if diffractionEngine in ["fresnel_fourier", "fresnel_czt"]:
             estBandwidth = estimateBandwidth(self.__dict__)
         elif diffractionEngine == "ASM_fourier":
             wavelength_m = self.__dict__["wavelength_m"]
             tf_bandwidth = np.array([1 / wavelength_m, 1 / wavelength_m])
             quad_bandwidth = estimateBandwidth(self.__dict__)
             estBandwidth = np.maximum(tf_bandwidth, quad_bandwidth)
+        elif diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+            # The band-limited transfer function is evaluated analytically so the lens sampling only needs to resolve
+            # the field itself, up to the propagating-wave cutoff
+            wavelength_m = self.__dict__["wavelength_m"]
+            tf_bandwidth = np.array([1 / wavelength_m, 1 / wavelength_m])
+            quad_bandwidth = estimateBandwidth(self.__dict__)
+            estBandwidth = np.minimum(tf_bandwidth, quad_bandwidth)
         samplingCutoff = 1 / 2 / estBandwidth * nyquist_modifier
         ms_dx_m = self.__dict__["ms_dx_m"]
         # Print information to the user
@@ -343,23 +450,39 @@ class prop_params(dict):
         # If we are using the transferFunction engine, we should also verify that calc_ms_dx is
         # smaller than the initial_sensor_dx_m requested by the user. This is because the lens sampling will
         # directly equal the sensor plane sampling. To give the user the right value, we will need to interpolate
-        if diffractionEngine == "ASM_fourier":
+        if diffractionEngine in ["ASM_fourier", "ASM_bandlimited"]:
             initial_sensor_dx_m = self.__dict__["initial_sensor_dx_m"]
             if calc_ms_dx > initial_sensor_dx_m["x"]:
                 calc_ms_dx = initial_sensor_dx_m["x"]
             if calc_ms_dy > initial_sensor_dx_m["y"]:
                 calc_ms_dy = initial_sensor_dx_m["y"]
-        self.__dict__["calc_ms_dx_m"] = {"x": calc_ms_dx, "y": calc_ms_dy}
+
+        # The cell aperture is applied in the frequency domain of the propagator so the lens is never upsampled
+        ms_upsampling = self.__dict__["ms_upsampling"]
+        if ms_upsampling == "cell_aperture":
+            calc_ms_dx = ms_dx_m["x"]
+            calc_ms_dy = ms_dx_m["y"]
 
         # add a parameter to reperesent the corresponding number of samples to be used for unpadded, upsampled lens ("M")
         ms_length_m_x = self.__dict__["ms_length_m"]
-        calc_samplesM_x = int(math.ceil(ms_length_m_x["x"] / calc_ms_dx))
-        calc_samplesM_y = int(math.ceil(ms_length_m_x["y"] / calc_ms_dy))
-        # Ensure number of samples for unpadded lens is odd
-        if np.mod(calc_samplesM_x, 2) == 0:
-            calc_samplesM_x += 1
-        if np.mod(calc_samplesM_y, 2) == 0:
-            calc_samplesM_y += 1
+        if ms_upsampling == "integer":
+            # Each cell is split into an odd number of samples so the upsampled lens stays odd and centred
+            ms_samplesM = self.__dict__["ms_samplesM"]
+            factor_x = odd_upsampling_factor(ms_dx_m["x"], calc_ms_dx)
+            factor_y = odd_upsampling_factor(ms_dx_m["y"], calc_ms_dy)
+            calc_ms_dx = ms_dx_m["x"] / factor_x
+            calc_ms_dy = ms_dx_m["y"] / factor_y
+            calc_samplesM_x = ms_samplesM["x"] * factor_x
+            calc_samplesM_y = ms_samplesM["y"] * factor_y
+        else:
+            calc_samplesM_x = int(math.ceil(ms_length_m_x["x"] / calc_ms_dx))
+            calc_samplesM_y = int(math.ceil(ms_length_m_x["y"] / calc_ms_dy))
+            # Ensure number of samples for unpadded lens is odd
+            if np.mod(calc_samplesM_x, 2) == 0:
+                calc_samplesM_x += 1
+            if np.mod(calc_samplesM_y, 2) == 0:
+                calc_samplesM_y += 1
+        self.__dict__["calc_ms_dx_m"] = {"x": calc_ms_dx, "y": calc_ms_dy}
 
         # samples along r is added in for convenience
         calc_samplesM_r = int((calc_samplesM_x - 1) / 2 + 1)
@@ -407,6 +530,19 @@ class prop_params(dict):
             if estN_y > calc_samplesM["y"]:
                 padms_halfy = int(math.ceil((estN_y - calc_samplesM["y"]) / 2))
 
+        # The chirp-z and scaled ASM engines evaluate the sensor plane directly at initial_sensor_dx_m so the lens is
+        # only padded (if at all) until the calculation grid spans the detector
+        if diffractionEngine in ["fresnel_czt", "ASM_scaled"]:
+            sensor_pixel_size_m = self.__dict__["sensor_pixel_size_m"]
+            sensor_pixel_number = self.__dict__["sensor_pixel_number"]
+            estN_x = int(math.ceil(sensor_pixel_size_m["x"] * sensor_pixel_number["x"] / initial_sensor_dx_m["x"]))
+            estN_y = int(math.ceil(sensor_pixel_size_m["y"] * sensor_pixel_number["y"] / initial_sensor_dx_m["y"]))
+
+            if estN_x > calc_samplesM["x"]:
+                padms_halfx = int(math.ceil((estN_x - calc_samplesM["x"]) / 2))
+            if estN_y > calc_samplesM["y"]:
+                padms_halfy = int(math.ceil((estN_y - calc_samplesM["y"]) / 2))
+
         # For the ASM case, we pad to ensure sensor space span
         if diffractionEngine == "ASM_fourier":
             sensor_pixel_size_m = self.__dict__["sensor_pixel_size_m"]
@@ -420,6 +556,18 @@ class prop_params(dict):
             if current_span_y < desired_span_y:
                 padms_halfy = int(math.ceil((desired_span_y - current_span_y) / 2))
 
+        # For the band-limited ASM case, the sensor grid equals the lens grid so pad until it spans the detector
+        if diffractionEngine == "ASM_bandlimited":
+            sensor_pixel_size_m = self.__dict__["sensor_pixel_size_m"]
+            sensor_pixel_number = self.__dict__["sensor_pixel_number"]
+            estN_x = int(math.ceil(sensor_pixel_size_m["x"] * sensor_pixel_number["x"] / calc_ms_dx_m["x"]))
+            estN_y = int(math.ceil(sensor_pixel_size_m["y"] * sensor_pixel_number["y"] / calc_ms_dx_m["y"]))
+
+            if estN_x > calc_samplesM["x"]:
+                padms_halfx = int(math.ceil((estN_x - calc_samplesM["x"]) / 2))
+            if estN_y > calc_samplesM["y"]:
+                padms_halfy = int(math.ceil((estN_y - calc_samplesM["y"]) / 2))
+
         # Update the parameter settings based on new padding settings
         self.__dict__["padms_half"] = {"x": padms_halfx, "y": padms_halfy}
         calc_samplesN_x = padms_halfx * 2 + calc_samplesM["x"]
@@ -435,7 +583,10 @@ class prop_params(dict):
         if diffractionEngine == "fresnel_fourier":
             calc_sensor_dx_m = wavelength_m * sensor_distance_m / calc_ms_dx_m["x"] / calc_samplesN_x
             calc_sensor_dy_m = wavelength_m * sensor_distance_m / calc_ms_dx_m["y"] / calc_samplesN_y
-        elif diffractionEngine == "ASM_fourier":
+        elif diffractionEngine in ["fresnel_czt", "ASM_scaled"]:
+            calc_sensor_dx_m = initial_sensor_dx_m["x"]
+            calc_sensor_dy_m = initial_sensor_dx_m["y"]
+        elif diffractionEngine in ["ASM_fourier", "ASM_bandlimited"]:
             calc_ms_dx_m = self.__dict__["calc_ms_dx_m"]
             calc_sensor_dx_m = calc_ms_dx_m["x"]
             calc_sensor_dy_m = calc_ms_dx_m["y"]
@@ -446,6 +597,57 @@ class prop_params(dict):
             "y": calc_sensor_dy_m,
         }
 
+        # The band-limited ASM engines zero-pad the field only until the circular convolution is free of wrap-around
+        # within the output window, i.e. until the padded grid spans the lens plus the sensor grid (rounded up to a
+        # fast FFT length)
+        padasm_halfx = 0
+        padasm_halfy = 0
+        if diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+            spanP_x = calc_samplesM["x"] + (calc_samplesN_x - 1) * calc_sensor_dx_m / calc_ms_dx_m["x"]
+            spanP_y = calc_samplesM["y"] + (calc_samplesN_y - 1) * calc_sensor_dy_m / calc_ms_dx_m["y"]
+            calc_samplesP_x = oddFFTLength(max(math.ceil(spanP_x - 1e-9), calc_samplesN_x))
+            calc_samplesP_y = oddFFTLength(max(math.ceil(spanP_y - 1e-9), calc_samplesN_y))
+            padasm_halfx = int((calc_samplesP_x - calc_samplesN_x) / 2)
+            padasm_halfy = int((calc_samplesP_y - calc_samplesN_y) / 2)
+        self.__dict__["padasm_half"] = {"x": padasm_halfx, "y": padasm_halfy}
+
+        # Define the window of the sensor plane grid that is evaluated (the full grid unless roi_propagation is used)
+        calc_sensor_samplesN_x = calc_samplesN_x
+        calc_sensor_samplesN_y = calc_samplesN_y
+        if self.__dict__["roi_propagation"]:
+            sensor_pixel_size_m = self.__dict__["sensor_pixel_size_m"]
+            sensor_pixel_number = self.__dict__["sensor_pixel_number"]
+            accurate_measurement = self.__dict__["accurate_measurement"]
+            calc_sensor_samplesN_x = sensorWindowSamples(
+                calc_samplesN_x,
+                calc_sensor_dx_m,
+                sensor_pixel_size_m["x"],
+                sensor_pixel_number["x"],
+                accurate_measurement,
+            )
+            calc_sensor_samplesN_y = sensorWindowSamples(
+                calc_samplesN_y,
+                calc_sensor_dy_m,
+                sensor_pixel_size_m["y"],
+                sensor_pixel_number["y"],
+                accurate_measurement,
+            )
+            # Radial data is converted to 2D before the measurement so the window must cover the detector corners
+            if self.__dict__["radial_symmetry"]:
+                calc_sensor_samplesN_x = sensorWindowSamples(
+                    calc_samplesN_x,
+                    calc_sensor_dx_m,
+                    sensor_pixel_size_m["x"],
+                    int(math.ceil(np.sqrt(2) * max(sensor_pixel_number["x"], sensor_pixel_number["y"]))),
+                    accurate_measurement,
+                )
+                calc_sensor_samplesN_y = calc_sensor_samplesN_x
+        self.__dict__["calc_sensor_samplesN"] = {
+            "x": calc_sensor_samplesN_x,
+            "y": calc_sensor_samplesN_y,
+            "r": int((calc_sensor_samplesN_x - 1) / 2 + 1),
+        }
+
         return
 
     def __setitem__(self, key, item):
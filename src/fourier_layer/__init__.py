@@ -1,6 +1,14 @@
 from fourier_layer.fourier_layers import (
     PSF_Layer,
     PSF_Layer_Mono,
+    PSF_Field_Bank_Layer,
+    OTF_Layer,
     Propagate_Planes_Layer,
     Propagate_Planes_Layer_Mono,
+    Propagate_Focal_Stack_Layer,
+    Propagate_Focal_Stack_Layer_Mono,
+    Propagate_Cascade_Layer,
+    Propagate_Cascade_Layer_Mono,
 )
+from fourier_layer.psf_executor import PSF_Executor
+from fourier_layer.psf_store import psf_store
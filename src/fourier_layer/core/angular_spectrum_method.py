@@ -1,6 +1,9 @@
 import tensorflow as tf
 import numpy as np
-from .hankel import iqdht, qdht, tf_generalSpline_regular1DGrid
+from .hankel import iqdht, qdht, qdht_bessel_roots, qdht_radius_terms, tf_generalSpline_regular1DGrid, safe_angle
+from .hankel import fht_grids, fht_log, fht_radial_grid, ifht_to_radial, radial_to_log_grid
+from .czt import czt_terms, czt2d
+from .calc_ms_regularizer import cell_aperture_spectrum
 
 
 def transfer_function_diffraction(
@@ -14,71 +17,389 @@ def transfer_function_diffraction(
     dtype,
     radial_symmetry,
     optArg=1,
+    plan=None,
+    hankel_method="qdht",
 ):
     """Uses the angular spectrum method to propagate an input complex field to the output plane. 
 
+    This is the amplitude and phase interface to transfer_function_diffraction_complex().
+
     Args:
         `wavefront_ampl` (tf.float): Starting field amplitude, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
             or (batch_size, 1, input_pixel_number['r'])
         `wavefront_phase` (tf.float): Starting field phase, the same shape as wavefront_ampl.
         `wavelength_m` (tf.float): Tf constant defining the wavelength of light for the calculation, in units of m
-        `distance_m` (tf.float64): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
+        `distance_m` (tf.float): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
         `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}. 
         `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
         `output_pixel_size_m` (dict): Unused but kept as input to match the fresnel_diffraction_fft method input arguments.
-        `dtype` (tf.dtype): Datatype for the calculation. Only tf.float64 is currently allowed
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
         `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
         `optArg` (int, optional): Defines an additional length factor for zero-padding the radial data, to be used when
             conducting frequency space transforms. Defaults to 0.
+        `plan` (propagation_plan, optional): Precomputed padded grid and transfer function for this geometry. If None,
+            the transfer function is computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            For "fht", the spectrum and the transfer function live on the log-spaced grids of the fast transform. 
+            Defaults to "qdht".
 
     Returns:
-        `tf.float64`: Field amplitude at the output plane grid, of shape 
+        `tf.float`: Field amplitude at the output plane grid, of shape 
             (batch_size, input_pixel_number['y'], input_pixel_number['x']) or (batch_size, 1, input_pixel_number['r'])
-        `tf.float64`: Field phase at the output plane grid, of shape
+        `tf.float`: Field phase at the output plane grid, of shape
             (batch_size, input_pixel_number['y'], input_pixel_number['x']) or (batch_size, 1, input_pixel_number['r'])
 
     """
-
     TF_ZERO = tf.cast(0.0, dtype=dtype)
+    wavefront = tf.complex(wavefront_ampl, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, wavefront_phase))
+
+    outputwavefront = transfer_function_diffraction_complex(
+        wavefront,
+        wavelength_m,
+        distance_m,
+        input_pixel_size_m,
+        input_pixel_number,
+        output_pixel_size_m,
+        dtype,
+        radial_symmetry,
+        optArg,
+        plan,
+        hankel_method,
+    )
+
+    return tf.math.abs(outputwavefront), safe_angle(outputwavefront)
+
+
+def transfer_function_diffraction_complex(
+    wavefront,
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    optArg=1,
+    plan=None,
+    hankel_method="qdht",
+    cell_size_m=None,
+):
+    """Complex field implementation of transfer_function_diffraction(), taking and returning the field as a single 
+    complex tensor so that no amplitude/phase conversions are made between the stages of a calculation.
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+            or (batch_size, 1, input_pixel_number['r'])
+        `wavelength_m` (tf.float): Tf constant defining the wavelength of light for the calculation, in units of m
+        `distance_m` (tf.float): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}. 
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Unused but kept as input to match the fresnel_diffraction_fft method input arguments.
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `optArg` (int, optional): Defines an additional length factor for zero-padding the radial data, to be used when
+            conducting frequency space transforms. Defaults to 0.
+        `plan` (propagation_plan, optional): Precomputed padded grid and transfer function for this geometry. If None,
+            the transfer function is computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            For "fht", the spectrum and the transfer function live on the log-spaced grids of the fast transform. 
+            Defaults to "qdht".
+        `cell_size_m` (dict, optional): If given, the input samples are the cells of a piecewise-constant field of 
+            this size (via {"x": float, "y": float}) and the cell aperture is applied in frequency space. Only used 
+            when the transfer function is computed on the fly (a plan includes it already). Defaults to None.
+
+    Returns:
+        `tf.complex`: Complex field at the output plane grid, of shape 
+            (batch_size, input_pixel_number['y'], input_pixel_number['x']) or (batch_size, 1, input_pixel_number['r'])
+    """
 
     ### Enable padding for frequency transforms if requested
     padFactor = optArg
-    padhalfx = tf.cast(input_pixel_number["x"] * padFactor, tf.int32)
-    padhalfy = tf.cast(input_pixel_number["y"] * padFactor, tf.int32)
-    paddings = tf.cond(
+    padhalf = {"x": int(input_pixel_number["x"] * padFactor), "y": int(input_pixel_number["y"] * padFactor)}
+    if radial_symmetry:
+        paddings = [[0, 0], [0, 0], [0, padhalf["x"]]]
+    else:
+        paddings = [[0, 0], [padhalf["y"], padhalf["y"]], [padhalf["x"], padhalf["x"]]]
+
+    ### Define the grid space and the transfer function (or reuse the precomputed terms)
+    if plan is None:
+        x, H = asm_transfer_function_terms(
+            wavelength_m,
+            distance_m,
+            input_pixel_size_m,
+            input_pixel_number,
+            dtype,
+            radial_symmetry,
+            optArg,
+            hankel_method,
+            cell_size_m,
+        )
+    else:
+        x, H = plan.asm_grid_x, plan.asm_transfer_function
+
+    ### The 2D propagation is a linear filter with a hand-written (adjoint) gradient
+    if not radial_symmetry:
+        return asm_fft2d(wavefront, H, paddings, input_pixel_number)
+
+    ### Propagation by multiplying the angular decomposition with H then taking the inverse transform, and crop
+    padded_wavefront = tf.pad(wavefront, paddings, mode="CONSTANT", constant_values=0)
+    angular_spectrum, spectrum_grid = asm_angular_spectrum(
+        padded_wavefront, x, input_pixel_size_m, radial_symmetry, hankel_method
+    )
+
+    return asm_propagate_spectrum(
+        angular_spectrum,
+        spectrum_grid,
+        H,
+        x,
+        padhalf,
+        input_pixel_number,
+        input_pixel_number,
         radial_symmetry,
-        lambda: [[0, 0], [0, 0], [0, padhalfx]],
-        lambda: [[0, 0], [padhalfy, padhalfy], [padhalfx, padhalfx]],
+        hankel_method,
+    )
+
+
+def asm_fft2d(wavefront, transfer_function, paddings, input_pixel_number):
+    """Propagates a 2D field by the angular spectrum method on a zero-padded grid (pad, centered DFT, multiplication
+    by the transfer function, inverse DFT, and crop), with a hand-written gradient.
+
+    The propagation is linear in the wavefront so its gradient is the adjoint propagation: the same filter applied to
+    the upstream gradient with the conjugate transfer function (i.e. back-propagation over the distance). Only the 
+    transfer function is held for the backward pass, rather than the intermediate tensors recorded by autodiff. No 
+    gradient is returned for the transfer function. 
+    
+    A stack of transfer functions (e.g. of the planes of a focal stack) may be given along a leading axis; the DFT of 
+    the wavefront is then shared by all of them, and the adjoint sums the back-propagated spectra before a single 
+    inverse DFT.
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x']).
+        `transfer_function` (tf.complex): Transfer function on the padded frequency grid, of shape (1, Ny_padded, Nx_padded)
+            or (num_planes, 1, Ny_padded, Nx_padded).
+        `paddings` (list): Zero-padding of the field, as passed to tf.pad.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+
+    Returns:
+        `tf.complex`: Complex field at the output plane grid, the same shape as wavefront, or of shape 
+            (num_planes, batch_size, input_pixel_number['y'], input_pixel_number['x']) for a stack of transfer functions.
+    """
+    stacked = len(transfer_function.shape) == 4
+
+    # Fields and spectra of a stack carry a leading plane axis; the pad and crop only act on the last two axes
+    field_paddings = [[0, 0]] + list(paddings) if stacked else paddings
+
+    def transform(field):
+        field = tf.pad(field, field_paddings[-len(field.shape) :], mode="CONSTANT", constant_values=0)
+        return tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(field, axes=(-2, -1))), axes=(-2, -1))
+
+    def inverse_transform(spectrum):
+        field = tf.signal.fftshift(tf.signal.ifft2d(tf.signal.ifftshift(spectrum, axes=(-2, -1))), axes=(-2, -1))
+        begin = [0] * (len(field.shape) - 2) + [paddings[-2][0], paddings[-1][0]]
+        size = [-1] * (len(field.shape) - 2) + [input_pixel_number["y"], input_pixel_number["x"]]
+        return tf.slice(field, begin, size)
+
+    @tf.custom_gradient
+    def propagate(wavefront):
+        def grad(upstream):
+            spectrum = transform(upstream) * tf.math.conj(transfer_function)
+            if stacked:
+                spectrum = tf.math.reduce_sum(spectrum, 0)
+            return inverse_transform(spectrum)
+
+        spectrum = transform(wavefront)
+        if stacked:
+            spectrum = tf.expand_dims(spectrum, 0)
+        return inverse_transform(spectrum * transfer_function), grad
+
+    return propagate(wavefront)
+
+
+def asm_angular_spectrum(padded_wavefront, x, input_pixel_size_m, radial_symmetry, hankel_method="qdht"):
+    """Computes the angular decomposition of a zero-padded field, as used by the angular spectrum propagators.
+
+    Args:
+        `padded_wavefront` (tf.complex): Zero-padded complex field, of shape (batch_size, Ny_padded, Nx_padded) or
+            (batch_size, 1, Nr_padded).
+        `x` (tf.float): Padded x-coordinate grid, of shape (Ny_padded, Nx_padded) or (1, Nr_padded).
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+
+    Returns:
+        `tf.complex`: Angular spectrum, of the same shape as padded_wavefront (for radial_symmetry with "fht", on the
+            log-spaced frequency grid, of shape (batch_size, 1, M)).
+        The frequency grid needed by the inverse transform: the angular frequency vector for "qdht", the fast Hankel
+            transform grid (see fht_radial_grid) for "fht", or None for 2D data.
+    """
+    if radial_symmetry and hankel_method == "fht":
+        fht_grid = fht_radial_grid(padded_wavefront.shape[-1], input_pixel_size_m["x"])
+        return fht_log(radial_to_log_grid(padded_wavefront, *fht_grid), *fht_grid), fht_grid
+    elif radial_symmetry:
+        kr, angular_spectrum = qdht(tf.squeeze(x), padded_wavefront)
+        return angular_spectrum, kr
+
+    angular_spectrum = tf.signal.fftshift(
+        tf.signal.fft2d(tf.signal.ifftshift(padded_wavefront, axes=(-2, -1))), axes=(-2, -1)
     )
-    padded_wavefront_ampl = tf.pad(wavefront_ampl, paddings, mode="CONSTANT", constant_values=0)
-    padded_wavefront_phase = tf.pad(wavefront_phase, paddings, mode="CONSTANT", constant_values=0)
+    return angular_spectrum, None
+
+
+def asm_propagate_spectrum(
+    angular_spectrum,
+    spectrum_grid,
+    transfer_function,
+    x,
+    padhalf,
+    input_pixel_number,
+    output_pixel_number,
+    radial_symmetry,
+    hankel_method="qdht",
+    output_terms=None,
+):
+    """Multiplies an angular spectrum (see asm_angular_spectrum) with a transfer function, takes the inverse transform
+    on the output grid, and crops away the zero-padding.
+
+    A stack of transfer functions (e.g. of the planes of a focal stack) may be given along a leading axis; the planes
+    are then folded into the batch for a single inverse transform.
+
+    Args:
+        `angular_spectrum` (tf.complex): Angular spectrum of the zero-padded field, of shape (batch_size, ...).
+        `spectrum_grid`: Frequency grid returned by asm_angular_spectrum.
+        `transfer_function` (tf.complex): Transfer function, of shape (1, ...) or (num_planes, 1, ...).
+        `x` (tf.float): Padded x-coordinate grid, of shape (Ny_padded, Nx_padded) or (1, Nr_padded).
+        `padhalf` (dict): Number of zero-padding samples on each side of the input (to the right of radial data), via 
+            dictionary {"x": int, "y": int}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": int, "y": int, "r": int}.
+        `output_pixel_number` (dict): Propagated field grid size (a centred window), in terms of number of pixels, via
+            dictionary {"x": int, "y": int, "r": int}.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+        `output_terms` (dict or tf.float, optional): Output transform terms of the scaled engines (see 
+            asm_bandlimited_terms). If None, the output grid has the input pitch. Defaults to None.
+
+    Returns:
+        `tf.complex`: Complex field at the output plane grid, of shape (batch_size, output_pixel_number['y'], 
+            output_pixel_number['x']) or (batch_size, 1, output_pixel_number['r']), with a leading num_planes axis for 
+            a stack of transfer functions.
+    """
+    fourier_transform_term = angular_spectrum * transfer_function
+    stacked = len(transfer_function.shape) == 4
+    if stacked:
+        plane_batch_shape = tf.shape(fourier_transform_term)[:2]
+        fourier_transform_term = tf.reshape(
+            fourier_transform_term, tf.concat([[-1], tf.shape(fourier_transform_term)[2:]], 0)
+        )
+
+    if radial_symmetry and hankel_method == "fht":
+        outputwavefront = ifht_to_radial(fourier_transform_term, *spectrum_grid)
+        if output_terms is None:
+            outputwavefront = outputwavefront[:, :, : output_pixel_number["r"]]
+        else:
+            outputwavefront = tf_generalSpline_regular1DGrid(tf.squeeze(x), output_terms, outputwavefront)
+    elif radial_symmetry:
+        r2, outputwavefront = iqdht(spectrum_grid, fourier_transform_term)
+        if output_terms is None:
+            output_terms = tf.squeeze(x)[: output_pixel_number["r"]]
+        outputwavefront = tf_generalSpline_regular1DGrid(r2, output_terms, outputwavefront)
+    elif output_terms is None:
+        outputwavefront = tf.signal.fftshift(
+            tf.signal.ifft2d(tf.signal.ifftshift(fourier_transform_term, axes=(-2, -1))), axes=(-2, -1)
+        )
+        offsety = int(padhalf["y"]) + (input_pixel_number["y"] - output_pixel_number["y"]) // 2
+        offsetx = int(padhalf["x"]) + (input_pixel_number["x"] - output_pixel_number["x"]) // 2
+        outputwavefront = outputwavefront[
+            :, offsety : offsety + output_pixel_number["y"], offsetx : offsetx + output_pixel_number["x"]
+        ]
+    else:
+        outputwavefront = czt2d(fourier_transform_term, output_terms["x"], output_terms["y"])
+
+    if stacked:
+        outputwavefront = tf.reshape(outputwavefront, tf.concat([plane_batch_shape, tf.shape(outputwavefront)[1:]], 0))
+
+    return outputwavefront
+
+
+def asm_transfer_function_terms(
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    dtype,
+    radial_symmetry,
+    optArg=1,
+    hankel_method="qdht",
+    cell_size_m=None,
+):
+    """Computes the static terms used by transfer_function_diffraction(): the padded spatial grid and the unit-magnitude
+    transfer function obtained from the Fourier transform of the Rayleigh-Sommerfeld kernel.
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `optArg` (int, optional): Length factor used for zero-padding. Defaults to 1.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+        `cell_size_m` (dict, optional): Metasurface cell size, via {"x": float, "y": float}; if given (without 
+            radial_symmetry), the cell aperture spectrum is included in the transfer function. Defaults to None.
+
+    Returns:
+        `tf.float`: Padded x-coordinate grid, of shape (Ny_padded, Nx_padded) or (1, Nr_padded).
+        `tf.complex`: Transfer function on the padded frequency grid, of shape (1, Ny_padded, Nx_padded) or (1, 1, Nr_padded).
+            For radial_symmetry with "fht", the transfer function is instead given on the log-spaced frequency grid
+            of the fast Hankel transform, of shape (1, 1, M).
+    """
+    # The static terms are always evaluated in double precision (the kernel phase k*r is large) then cast to dtype
+    complex_dtype = tf.complex64 if dtype == tf.float32 else tf.complex128
+    TF_ZERO = tf.cast(0.0, dtype=tf.float64)
+    padhalfx = tf.cast(input_pixel_number["x"] * optArg, tf.int32)
+    padhalfy = tf.cast(input_pixel_number["y"] * optArg, tf.int32)
 
     ### Define the grid space (input same as output spatial domain)
     if radial_symmetry:
-        x, y = tf.meshgrid(tf.range(0, input_pixel_number["r"] + padhalfx, dtype=dtype), tf.range(1, dtype=dtype))
+        x, y = tf.meshgrid(
+            tf.range(0, input_pixel_number["r"] + padhalfx, dtype=tf.float64), tf.range(1, dtype=tf.float64)
+        )
     else:
         x, y = tf.meshgrid(
-            tf.range(0, input_pixel_number["x"] + 2 * padhalfx, dtype=dtype),
-            tf.range(0, input_pixel_number["y"] + 2 * padhalfy, dtype=dtype),
+            tf.range(0, input_pixel_number["x"] + 2 * padhalfx, dtype=tf.float64),
+            tf.range(0, input_pixel_number["y"] + 2 * padhalfy, dtype=tf.float64),
         )
         x = x - (x.shape[1] - 1) / 2
         y = y - (y.shape[0] - 1) / 2
     x = x * input_pixel_size_m["x"]
     y = y * input_pixel_size_m["y"]
 
-    ### Get the angular decomposition of the input field
-    fourier_transform_term = tf.complex(padded_wavefront_ampl, TF_ZERO) * tf.exp(
-        tf.complex(TF_ZERO, padded_wavefront_phase)
-    )
-    if radial_symmetry:
-        kr, angular_spectrum = qdht(tf.squeeze(x), fourier_transform_term)
-    else:
-        angular_spectrum = tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(fourier_transform_term)))
+    # For the fast Hankel transform, the transfer function is evaluated directly on its log-spaced frequency grid. The
+    # FFTLog transform of the truncated, rapidly oscillating kernel is inaccurate at low frequencies so the analytic
+    # phase is used (exp(i kz z) for propagating waves and, as for the unit-magnitude H below, zero phase otherwise)
+    if radial_symmetry and hankel_method == "fht":
+        padded_number = input_pixel_number["r"] + int(input_pixel_number["x"] * optArg)
+        _, k_log = fht_grids(*fht_radial_grid(padded_number, input_pixel_size_m["x"]), dtype)
+        angular_wavenumber = tf.cast(2 * np.pi / wavelength_m, dtype=tf.float64)
+        kz = tf.math.sqrt(
+            tf.math.maximum(angular_wavenumber ** 2 - tf.constant(k_log, dtype=tf.float64) ** 2, TF_ZERO)
+        )
+
+        # Frequencies above the Nyquist frequency of the uniform grid are not resolved; roll them off smoothly in ln k
+        # (over two octaves) rather than truncating, which limits ringing in the inverse transform
+        k_nyquist = np.pi / input_pixel_size_m["x"]
+        band = np.cos(np.pi / 2 * np.clip(np.log(k_log / k_nyquist) / np.log(4), 0, 1)) ** 2
+        H = tf.complex(tf.constant(band, dtype=tf.float64), TF_ZERO) * tf.exp(
+            tf.complex(TF_ZERO, tf.math.floormod(kz * distance_m, 2 * np.pi))
+        )
+
+        return tf.cast(x, dtype), tf.cast(tf.reshape(H, [1, 1, -1]), complex_dtype)
 
     #### Define the transfer function via FT of the Sommerfield solution
-    # Define the output field grid
     rarray = tf.math.sqrt(distance_m ** 2 + x ** 2 + y ** 2)
-    angular_wavenumber = tf.cast(2 * np.pi / wavelength_m, dtype=dtype)
+    angular_wavenumber = tf.cast(2 * np.pi / wavelength_m, dtype=tf.float64)
     h = tf.expand_dims(
         (
             tf.complex(1 / 2 / np.pi * distance_m / rarray ** 2, TF_ZERO)
@@ -90,7 +411,7 @@ def transfer_function_diffraction(
 
     # Compute Fourier Space Transfer Function
     if radial_symmetry:
-        kr, H = qdht(tf.squeeze(x), h)
+        _, H = qdht(tf.squeeze(x), h)
     else:
         H = tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(h)))
 
@@ -98,30 +419,265 @@ def transfer_function_diffraction(
     # This change makes it easier to play with normalized PSF (Energy under the IPSF less than or equal to energy incident on aperture)
     H = tf.exp(tf.complex(TF_ZERO, tf.math.angle(H)))
 
-    ### Propagation by multiplying angular decomposition with H then taking the inverse transform
-    fourier_transform_term = angular_spectrum * H
+    # The cell aperture of a field that is not upsampled is applied on the (centred) DFT frequency grid
+    if cell_size_m is not None and not radial_symmetry:
+        padded_number = {"x": x.shape[1], "y": x.shape[0]}
+        freq = {}
+        for dim in ["x", "y"]:
+            freq[dim] = (np.arange(padded_number[dim]) - padded_number[dim] // 2) / padded_number[dim]
+            freq[dim] = freq[dim] / input_pixel_size_m[dim]
+        H = H * tf.constant(cell_aperture_spectrum(freq["x"], freq["y"], cell_size_m)[None], dtype=H.dtype)
+
+    return tf.cast(x, dtype), tf.cast(H, complex_dtype)
+
+
+def transfer_function_diffraction_bandlimited_complex(
+    wavefront,
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    optArg=None,
+    plan=None,
+    hankel_method="qdht",
+    output_pixel_number=None,
+    cell_size_m=None,
+):
+    """Uses the band-limited angular spectrum method to propagate an input complex field to the output plane.
+
+    Unlike transfer_function_diffraction_complex(), the transfer function is evaluated analytically in frequency space
+    and is band-limited to the frequencies that the padded grid resolves without aliasing of the propagation kernel
+    (Matsushima and Shimobaba, Opt. Express 17, 2009). The field therefore only needs to be zero-padded enough for the
+    circular convolution to be free of wrap-around within the output window. If output_pixel_size_m differs from
+    input_pixel_size_m, the inverse transform is evaluated directly at the output pitch (scaled angular spectrum) via a
+    chirp-z transform, or by interpolation of the inverse Hankel transform for radial data.
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+            or (batch_size, 1, input_pixel_number['r'])
+        `wavelength_m` (tf.float): Tf constant defining the wavelength of light for the calculation, in units of m
+        `distance_m` (tf.float): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `optArg` (dict, optional): Number of zero-padding samples added to each side of the input (to the right of 
+            radial data), via dictionary {"x": int, "y": int}. If None, the padding assumes the field fills the input grid
+            (see asm_bandlimited_default_padding). Defaults to None.
+        `plan` (propagation_plan, optional): Precomputed padded grid, transfer function, and output transform terms for
+            this geometry. If None, the static terms are computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+        `output_pixel_number` (dict, optional): Propagated field grid size (a centred window), in terms of number of 
+            pixels, via dictionary {"x": int, "y": int, "r": int}. If None, the input grid size is used. Defaults to 
+            None.
+        `cell_size_m` (dict, optional): If given, the input samples are the cells of a piecewise-constant field of 
+            this size (via {"x": float, "y": float}) and the cell aperture is applied in frequency space. Only used 
+            when the transfer function is computed on the fly (a plan includes it already). Defaults to None.
+
+    Returns:
+        `tf.complex`: Complex field at the output plane grid, of shape 
+            (batch_size, output_pixel_number['y'], output_pixel_number['x']) or (batch_size, 1, output_pixel_number['r'])
+    """
+    if output_pixel_number is None:
+        output_pixel_number = input_pixel_number
+
+    ### Zero-pad the field for the frequency transforms
+    padhalf = optArg
+    if padhalf is None:
+        padhalf = asm_bandlimited_default_padding(input_pixel_size_m, input_pixel_number, output_pixel_size_m)
+    padhalfx = int(padhalf["x"])
+    padhalfy = int(padhalf["y"])
     if radial_symmetry:
-        r2, outputwavefront = iqdht(kr, fourier_transform_term)
-        outputwavefront = tf_generalSpline_regular1DGrid(r2, tf.squeeze(x), outputwavefront)
+        padded_wavefront = tf.pad(wavefront, [[0, 0], [0, 0], [0, padhalfx]], mode="CONSTANT", constant_values=0)
+    else:
+        padded_wavefront = tf.pad(
+            wavefront, [[0, 0], [padhalfy, padhalfy], [padhalfx, padhalfx]], mode="CONSTANT", constant_values=0
+        )
+
+    ### Define the grid space, the transfer function, and the output transform terms (or reuse the precomputed terms)
+    if plan is None:
+        x, H, output_terms = asm_bandlimited_terms(
+            wavelength_m,
+            distance_m,
+            input_pixel_size_m,
+            input_pixel_number,
+            output_pixel_size_m,
+            dtype,
+            radial_symmetry,
+            padhalf,
+            hankel_method,
+            output_pixel_number,
+            cell_size_m,
+        )
     else:
-        outputwavefront = tf.signal.fftshift(tf.signal.ifft2d(tf.signal.ifftshift(fourier_transform_term)))
+        x, H, output_terms = plan.asm_grid_x, plan.asm_transfer_function, plan.asm_output_terms
 
-    ### Crop to remove the padding used in the calculation
-    # Radial symmetry needs special preperation before cropping because cropping
-    # runs a inner crop so we need to add half padding for symmetry then call crop
-    outputwavefront = tf.cond(
+    ### Propagation by multiplying the angular decomposition with H then taking the inverse transform on the output grid
+    angular_spectrum, spectrum_grid = asm_angular_spectrum(
+        padded_wavefront, x, input_pixel_size_m, radial_symmetry, hankel_method
+    )
+
+    return asm_propagate_spectrum(
+        angular_spectrum,
+        spectrum_grid,
+        H,
+        x,
+        padhalf,
+        input_pixel_number,
+        output_pixel_number,
         radial_symmetry,
-        lambda: tf.pad(outputwavefront, [[0, 0], [0, 0], [padhalfx, 0]], mode="CONSTANT"),
-        lambda: outputwavefront,
+        hankel_method,
+        output_terms,
     )
 
-    outputwavefront = tf.image.resize_with_crop_or_pad(
-        tf.expand_dims(outputwavefront, -1),  # need to make it shape [N, nx, ny, channels=1]
-        tf.cond(radial_symmetry, lambda: 1, lambda: input_pixel_number["y"]),
-        tf.cond(radial_symmetry, lambda: input_pixel_number["r"], lambda: input_pixel_number["x"],),
+
+def asm_bandlimited_default_padding(input_pixel_size_m, input_pixel_number, output_pixel_size_m):
+    """Returns the zero-padding used by transfer_function_diffraction_bandlimited_complex() when none is specified. 
+    This is the minimum padding that avoids wrap-around in the output window if the field fills the whole input grid. 
+    Tighter padding for a field with smaller support is computed by prop_params ("padasm_half").
+
+    Args:
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+
+    Returns:
+        `dict`: Number of zero-padding samples added to each side of the input, via {"x": int, "y": int}.
+    """
+    padhalf = {}
+    for dim in ["x", "y"]:
+        scale = max(1.0, output_pixel_size_m[dim] / input_pixel_size_m[dim])
+        padhalf[dim] = int(np.ceil((input_pixel_number[dim] - 1) * scale / 2))
+
+    return padhalf
+
+
+def asm_bandlimited_terms(
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    padhalf,
+    hankel_method="qdht",
+    output_pixel_number=None,
+    cell_size_m=None,
+):
+    """Computes the static terms used by transfer_function_diffraction_bandlimited_complex(): the padded spatial grid,
+    the analytic band-limited transfer function, and the terms of the inverse transform onto the output grid.
+
+    The transfer function is exp(i 2 pi z sqrt(1 / wavelength^2 - fx^2 - fy^2)) for propagating waves and zero 
+    otherwise. Along each dimension it is limited to |f| <= 1 / (wavelength sqrt((2 df z)^2 + 1)), with df the 
+    frequency pitch of the padded grid, beyond which the sampled transfer function aliases.
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `padhalf` (dict): Number of zero-padding samples added to each side of the input, via {"x": int, "y": int}.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+        `output_pixel_number` (dict, optional): Propagated field grid size (a centred window), in terms of number of 
+            pixels, via dictionary {"x": int, "y": int, "r": int}. If None, the input grid size is used. Defaults to 
+            None.
+        `cell_size_m` (dict, optional): Metasurface cell size, via {"x": float, "y": float}; if given (without 
+            radial_symmetry), the cell aperture spectrum is included in the transfer function. Defaults to None.
+
+    Returns:
+        `tf.float`: Padded x-coordinate grid, of shape (Ny_padded, Nx_padded) or (1, Nr_padded).
+        `tf.complex`: Transfer function on the padded frequency grid, of shape (1, Ny_padded, Nx_padded) or 
+            (1, 1, Nr_padded). For radial_symmetry with "fht", the transfer function is instead given on the log-spaced
+            frequency grid of the fast Hankel transform, of shape (1, 1, M).
+        `dict` or `tf.float`: None if the output pitch equals the input pitch. Otherwise, the chirp-z transform terms 
+            along "x" and "y" (see czt_terms) or, for radial_symmetry, the output radial grid.
+    """
+    # The static terms are always evaluated in double precision then cast to dtype
+    complex_dtype = tf.complex64 if dtype == tf.float32 else tf.complex128
+    wavelength_m = float(wavelength_m)
+    distance_m = float(distance_m)
+    if output_pixel_number is None:
+        output_pixel_number = input_pixel_number
+    scaled = not all(
+        np.isclose(output_pixel_size_m[dim], input_pixel_size_m[dim], rtol=1e-9, atol=0) for dim in ["x", "y"]
     )
+    band_limit = lambda freq_step: 1 / wavelength_m / np.sqrt((2 * freq_step * distance_m) ** 2 + 1)
+
+    if radial_symmetry:
+        padded_number = input_pixel_number["r"] + int(padhalf["x"])
+        x = np.arange(padded_number, dtype=np.float64)[None, :] * input_pixel_size_m["x"]
+
+        # The radial grid corresponds to a 2D grid of 2 * padded_number - 1 samples
+        if hankel_method == "fht":
+            _, k_grid = fht_grids(*fht_radial_grid(padded_number, input_pixel_size_m["x"]), tf.float64)
+            k_nyquist = np.pi / input_pixel_size_m["x"]
+            band = np.cos(np.pi / 2 * np.clip(np.log(k_grid / k_nyquist) / np.log(4), 0, 1)) ** 2
+        else:
+            alpha, jp1 = qdht_bessel_roots(padded_number, 0)
+            _, k_grid, _, _ = qdht_radius_terms(alpha, jp1, float(np.max(x)))
+            band = np.ones_like(k_grid)
+        freq = k_grid / 2 / np.pi
+        band = band * (freq <= band_limit(1 / (2 * padded_number - 1) / input_pixel_size_m["x"]))
+        kz_phase = 2 * np.pi * distance_m * np.sqrt(np.maximum(1 / wavelength_m ** 2 - freq ** 2, 0))
+        band = band * (freq < 1 / wavelength_m)
+        H = band * np.exp(1j * np.mod(kz_phase, 2 * np.pi))
+        H = H[None, None, :]
+
+        output_terms = None
+        if scaled:
+            output_terms = tf.constant(
+                np.arange(output_pixel_number["r"], dtype=np.float64) * output_pixel_size_m["x"], dtype=dtype
+            )
+    else:
+        padded_number = {dim: input_pixel_number[dim] + 2 * int(padhalf[dim]) for dim in ["x", "y"]}
+        x, _ = np.meshgrid(
+            np.arange(padded_number["x"], dtype=np.float64) - (padded_number["x"] - 1) / 2,
+            np.arange(padded_number["y"], dtype=np.float64),
+        )
+        x = x * input_pixel_size_m["x"]
+
+        freq = {}
+        freq_step = {}
+        for dim in ["x", "y"]:
+            freq_step[dim] = 1 / padded_number[dim] / input_pixel_size_m[dim]
+            freq[dim] = (np.arange(padded_number[dim], dtype=np.float64) - (padded_number[dim] - 1) / 2) * freq_step[dim]
+        fx, fy = np.meshgrid(freq["x"], freq["y"])
+        band = (
+            (np.abs(fx) <= band_limit(freq_step["x"]))
+            * (np.abs(fy) <= band_limit(freq_step["y"]))
+            * (fx ** 2 + fy ** 2 < 1 / wavelength_m ** 2)
+        )
+        kz_phase = 2 * np.pi * distance_m * np.sqrt(np.maximum(1 / wavelength_m ** 2 - fx ** 2 - fy ** 2, 0))
+        H = band * np.exp(1j * np.mod(kz_phase, 2 * np.pi))
+        if cell_size_m is not None:
+            H = H * cell_aperture_spectrum(freq["x"], freq["y"], cell_size_m)
+        H = H[None, :, :]
 
-    outputwavefront_ampl = tf.math.abs(outputwavefront)
-    outputwavefront_phase = tf.math.angle(outputwavefront)
+        # For the scaled variant, the inverse transform is evaluated on the output grid via chirp-z transforms
+        output_terms = None
+        if scaled:
+            output_terms = {}
+            for dim in ["x", "y"]:
+                output_terms[dim] = czt_terms(
+                    freq[dim][0],
+                    freq_step[dim],
+                    padded_number[dim],
+                    -(output_pixel_number[dim] - 1) / 2 * output_pixel_size_m[dim],
+                    output_pixel_size_m[dim],
+                    output_pixel_number[dim],
+                    -2 * np.pi,
+                    1 / padded_number[dim],
+                    dtype,
+                )
 
-    return tf.squeeze(outputwavefront_ampl, -1), tf.squeeze(outputwavefront_phase, -1)
+    return tf.constant(x, dtype=dtype), tf.constant(H, dtype=complex_dtype), output_terms
@@ -1,12 +1,20 @@
 import tensorflow as tf
 
-from .psf_compute import psf_measured, wavefront_afterms_sensor
-from .calc_ms_regularizer import regularize_ms_calc_tf
+from .psf_compute import (
+    psf_measured,
+    wavefront_afterms_sensor_complex,
+    propagation_flop_estimate,
+    propagation_detail,
+    calc_field_shape,
+    sensor_measurement_flop_estimate,
+)
+from .calc_ms_regularizer import regularize_ms_calc_complex
 from .detectorResampling import sensorMeasurement_intensity_phase, sensorMeasurement_intensity_phase_radialData
-from .hankel import radial_crop_or_pad, radial_conditional_resize_with_crop_or_pad
+from .hankel import radial_crop_or_pad, radial_conditional_resize_with_crop_or_pad, safe_angle
+from .stage_profiler import profile_stage, elementwise_flops
 
 
-def broadband_batched_propagation(field_amplitude, field_phase, parameters_list):
+def broadband_batched_propagation(field_amplitude, field_phase, parameters_list, plans=None):
     """Takes a batch of field amplitudes and field phases at an input plane and propagates the field to an output plane,
     for multiple wavelengths. 
 
@@ -29,7 +37,9 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
             or (len(wavelength_set_m), num_profiles, 1, ms_samples["r"]). Alternatively, the input field phase may be 
             assumed the same across wavelengths and given via (num_profiles, ms_samples["y"], ms_samples["x"]) or
             (num_profiles, 1, ms_samples["r"]).
-        `parameters` (prop_param):  Settings object defining field propagation details.
+        `parameters_list` (list): List of prop_param objects, each being initialized (in order of wavelength_set_m) for
+            a different wavelength_m value.
+        `plans` (list, optional): List of propagation_plan objects matching parameters_list. Defaults to None.
 
     Returns:
         `tf.float`: Field amplitude of shape (len(wavelength_set_m), num_profiles, sensor_pixel_number["y"], sensor_pixel_number["x"])
@@ -39,6 +49,8 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
     """
     num_wavelengths = len(parameters_list)
     input_rank = tf.shape(field_amplitude).shape
+    if plans is None:
+        plans = [None] * num_wavelengths
 
     def lambda_loopCond(idx_, hold_ampl_, hold_phase_):
         return tf.less(idx_, num_wavelengths)
@@ -48,7 +60,7 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
         num_profiles = field_amplitude.shape[0]
 
         def lambda_loopBody(idx_, hold_ampl_, hold_phase_):
-            ampl, phase = field_propagation(field_amplitude, field_phase, parameters_list[idx_])
+            ampl, phase = field_propagation(field_amplitude, field_phase, parameters_list[idx_], plans[idx_])
 
             hold_ampl_ = tf.concat([hold_ampl_, tf.expand_dims(ampl, 0)], axis=0)
             hold_phase_ = tf.concat([hold_phase_, tf.expand_dims(phase, 0)], axis=0)
@@ -62,7 +74,9 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
         num_profiles = field_amplitude.shape[1]
 
         def lambda_loopBody(idx_, hold_ampl_, hold_phase_):
-            ampl, phase = field_propagation(field_amplitude[idx_], field_phase[idx_], parameters_list[idx_])
+            ampl, phase = field_propagation(
+                field_amplitude[idx_], field_phase[idx_], parameters_list[idx_], plans[idx_]
+            )
 
             hold_ampl_ = tf.concat([hold_ampl_, tf.expand_dims(ampl, 0)], axis=0)
             hold_phase_ = tf.concat([hold_phase_, tf.expand_dims(phase, 0)], axis=0)
@@ -79,8 +93,8 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
     # Run batched loop
     sensor_pixel_number = parameters_list[0]["sensor_pixel_number"]
     radial_symmetry = parameters_list[0]["radial_symmetry"]
-    num_pts_x = tf.cond(radial_symmetry, lambda: sensor_pixel_number["r"], lambda: sensor_pixel_number["x"])
-    num_pts_y = tf.cond(radial_symmetry, lambda: 1, lambda: sensor_pixel_number["y"])
+    num_pts_x = sensor_pixel_number["r"] if radial_symmetry else sensor_pixel_number["x"]
+    num_pts_y = 1 if radial_symmetry else sensor_pixel_number["y"]
     dtype = parameters_list[0]["dtype"]
 
     idx = tf.constant(0, dtype=tf.int32)
@@ -95,7 +109,7 @@ def broadband_batched_propagation(field_amplitude, field_phase, parameters_list)
     )
 
 
-def field_propagation(field_amplitude, field_phase, parameters):
+def field_propagation(field_amplitude, field_phase, parameters, plan=None):
     """Takes a batch of field amplitudes and field phases at an input plane (of a single wavelength) and propagates the
     field to an output plane.
 
@@ -111,6 +125,7 @@ def field_propagation(field_amplitude, field_phase, parameters):
         `field_phase` (tf.float): Initial plane field phase, of shape (batch_size, ms_samplesM["y"], ms_samplesM["x"])
             or (batch_size, 1, ms_samplesM["r"]).
         `parameters` (prop_param):  Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
 
     Returns:
         `tf.float64`: Output plane field amplitude, of shape (batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"])
@@ -121,11 +136,35 @@ def field_propagation(field_amplitude, field_phase, parameters):
     # Possibly add an assertions check here in the future if people are misusing.
     # .
 
-    # For an accurate calculation, resample field and add the padding as defined during prop_param initialization
-    field_amplitude, field_phase = regularize_ms_calc_tf(field_amplitude, field_phase, parameters)
+    # The field is kept complex through the resampling and propagation and only split into amplitude and phase
+    # before the sensor reinterpolation
+    dtype = parameters["dtype"]
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
+    num_fields = field_amplitude.shape[0]
+    with profile_stage(
+        "regularize_ms_calc",
+        [field_amplitude, field_phase],
+        lambda: elementwise_flops(calc_field_shape(parameters, num_fields), is_complex=True),
+    ) as stage:
+        field = tf.complex(tf.cast(field_amplitude, dtype), TF_ZERO) * tf.exp(
+            tf.complex(TF_ZERO, tf.cast(field_phase, dtype))
+        )
+
+        # For an accurate calculation, resample field and add the padding as defined during prop_param initialization
+        field = regularize_ms_calc_complex(field, parameters)
+        stage.outputs(field)
 
     # Propagate the field, piggy-back off the psf derived functions
-    field_amplitude, field_phase = wavefront_afterms_sensor(field_amplitude, field_phase, parameters)
+    with profile_stage(
+        "propagation",
+        [field],
+        lambda: propagation_flop_estimate(parameters, num_fields),
+        detail=propagation_detail(parameters),
+    ) as stage:
+        field = wavefront_afterms_sensor_complex(field, parameters, plan)
+        field_amplitude = tf.math.abs(field)
+        field_phase = safe_angle(field)
+        stage.outputs(field, field_amplitude, field_phase)
 
     # # pad or crop to match the user defined number of pixels in the output
     # sensor_pixel_number = parameters["sensor_pixel_number"]
@@ -134,17 +173,35 @@ def field_propagation(field_amplitude, field_phase, parameters):
     # field_phase = radial_conditional_resize_with_crop_or_pad(field_phase, radial_symmetry, sensor_pixel_number)
 
     # Reinterpolate to the user specified grid and also ensure resize
-    if parameters["radial_symmetry"]:
-        field_amplitude, field_phase = sensorMeasurement_intensity_phase_radialData(
-            field_amplitude, field_phase, parameters
-        )
-    else:
-        field_amplitude, field_phase = sensorMeasurement_intensity_phase(field_amplitude, field_phase, parameters)
+    with profile_stage(
+        "sensor_measurement",
+        [field_amplitude, field_phase],
+        lambda: sensor_measurement_flop_estimate(parameters, num_fields, radial_data=parameters["radial_symmetry"]),
+    ) as stage:
+        if parameters["radial_symmetry"]:
+            field_amplitude, field_phase = sensorMeasurement_intensity_phase_radialData(
+                field_amplitude, field_phase, parameters, plan
+            )
+        else:
+            field_amplitude, field_phase = sensorMeasurement_intensity_phase(
+                field_amplitude, field_phase, parameters, plan
+            )
+        stage.outputs(field_amplitude, field_phase)
 
     return field_amplitude, field_phase
 
 
-def broadband_batched_psf_measured(ms_trans, ms_phase, normby, point_source_locs, parameters_list):
+def broadband_batched_psf_measured(
+    ms_trans,
+    ms_phase,
+    normby,
+    point_source_locs,
+    parameters_list,
+    chunk_size=None,
+    plans=None,
+    intensity_only=False,
+    recompute=False,
+):
     """Batch computes the PSF measured on the photosensor for metasurface modulation profiles on each wavelength channel
     within a set.
 
@@ -167,75 +224,85 @@ def broadband_batched_psf_measured(ms_trans, ms_phase, normby, point_source_locs
         `point_source_locs` (tf.float): Tensor of point-source coordinates, of shape (N,3)
         `parameters_list` (list): List of prop_param objects, each being initialized (in order of wavelength_set_m) for
             a different wavelength_m value.
+        `chunk_size` (int, optional): Maximum number of fields (profile and point-source pairs) to propagate at once
+            for each wavelength channel. Defaults to None, in which case no chunking is applied.
+        `plans` (list, optional): List of propagation_plan objects matching parameters_list. Defaults to None.
+        `intensity_only` (bool, optional): If True, the phase is never computed or resampled and only the PSF 
+            intensity is returned. Defaults to False.
+        `recompute` (bool, optional): If True, the intermediate tensors of each wavelength channel and chunk are 
+            discarded after the forward pass and recomputed during backpropagation (see batched_psf_measured). 
+            Defaults to False.
 
     Returns:
         `tf.float`: Batched PSF intensity of shape (len(wavelength_set_m), profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"])
-        `tf.float`: Batched PSF phase of shape (len(wavelength_set_m), profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"])
+        `tf.float`: Batched PSF phase of shape (len(wavelength_set_m), profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+            Not returned if intensity_only is True.
     """
     # unpack parameters
-    num_wavelengths = len(parameters_list)
     input_rank = tf.shape(ms_trans).shape
-
-    def lambda_loopCond(idx_, holdPSF_int_, holdPSF_phase_):
-        return tf.less(idx_, num_wavelengths)
-
-    if input_rank == 3:
-        # the metasurface modulation profiles are the same across wavelength
-        num_ms = ms_trans.shape[0]
-
-        def lambda_loopBody(idx_, holdPSF_int_, holdPSF_phase_):
-            psfs_int, psfs_phase = batched_psf_measured(
-                ms_trans, ms_phase, normby, point_source_locs, parameters_list[idx_]
-            )
-
-            holdPSF_int_ = tf.concat([holdPSF_int_, psfs_int], axis=0)
-            holdPSF_phase_ = tf.concat([holdPSF_phase_, psfs_phase], axis=0)
-
-            idx_ += 1
-
-            return [idx_, holdPSF_int_, holdPSF_phase_]
-
-    elif input_rank == 4:
-        # The metasurface modulations are defined for each wavelength channel
-        num_ms = ms_trans.shape[1]
-
-        def lambda_loopBody(idx_, holdPSF_int_, holdPSF_phase_):
-            psfs_int, psfs_phase = batched_psf_measured(
-                ms_trans[idx_], ms_phase[idx_], normby, point_source_locs, parameters_list[idx_]
-            )
-
-            holdPSF_int_ = tf.concat([holdPSF_int_, psfs_int], axis=0)
-            holdPSF_phase_ = tf.concat([holdPSF_phase_, psfs_phase], axis=0)
-
-            idx_ += 1
-
-            return [idx_, holdPSF_int_, holdPSF_phase_]
-
-    else:
+    if not input_rank in [3, 4]:
         raise ValueError(
             "broadband_batched_psf_measured: rank of ms_trans and/or ms_phase is incorrect. must be rank 3 or rank 4 tensor."
         )
 
-    # Run batched loop with manual conditional overloading on function
-    sensor_pixel_number = parameters_list[0]["sensor_pixel_number"]
-    dtype = parameters_list[0]["dtype"]
-    num_ps = point_source_locs.shape[0]
-    idx = tf.constant(0, dtype=tf.int32)
-
-    holdPSF_int = tf.zeros((1, num_ms, num_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]), dtype=dtype)
-    holdPSF_phase = tf.zeros((1, num_ms, num_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]), dtype=dtype)
-    loopData = tf.while_loop(lambda_loopCond, lambda_loopBody, loop_vars=[idx, holdPSF_int, holdPSF_phase])
-
-    return (
-        tf.stack(loopData[1][1:]),
-        tf.stack(loopData[2][1:]),
-    )
-
-
-def batched_psf_measured(ms_trans, ms_phase, normby, point_source_locs, parameters):
+    if plans is None:
+        plans = [None] * len(parameters_list)
+
+    # Each wavelength has its own grid so the channels are computed in sequence and gathered by a single concat
+    holdPSF_int = []
+    holdPSF_phase = []
+    for idx, parameters in enumerate(parameters_list):
+        if input_rank == 3:
+            # the metasurface modulation profiles are the same across wavelength
+            this_trans, this_phase = ms_trans, ms_phase
+        else:
+            # The metasurface modulations are defined for each wavelength channel
+            this_trans, this_phase = ms_trans[idx], ms_phase[idx]
+
+        psfs = batched_psf_measured(
+            this_trans,
+            this_phase,
+            normby,
+            point_source_locs,
+            parameters,
+            chunk_size,
+            plans[idx],
+            intensity_only,
+            recompute,
+        )
+        if intensity_only:
+            holdPSF_int.append(psfs)
+        else:
+            holdPSF_int.append(psfs[0])
+            holdPSF_phase.append(psfs[1])
+
+    if intensity_only:
+        return tf.concat(holdPSF_int, axis=0)
+
+    return tf.concat(holdPSF_int, axis=0), tf.concat(holdPSF_phase, axis=0)
+
+
+def batched_psf_measured(
+    ms_trans,
+    ms_phase,
+    normby,
+    point_source_locs,
+    parameters,
+    chunk_size=None,
+    plan=None,
+    intensity_only=False,
+    recompute=False,
+):
     """Given a stack of metasurface transmission and phase profiles, compute the PSF for a set of point-sources.
     
-    This function batches the psf_measured function call.
+    The (profile_batch x num_point_sources) stack of fields is computed in a single, broadcast pass through the 
+    psf_measured call. If chunk_size is given, the stack is instead split into chunks containing at most chunk_size 
+    fields so that peak memory can be bounded; the chunks are gathered with a single concat at the end.
+
+    With recompute, each chunk is wrapped in tf.recompute_grad: only the chunk inputs and output PSFs are kept for the
+    backward pass and the propagation of a chunk is rerun when its gradient is required. Peak memory during
+    backpropagation then scales with a single chunk rather than with the full stack, at the cost of a second forward
+    evaluation. Gradients are only propagated to ms_trans, ms_phase, and point_source_locs (not to normby).
     
     Args:
         `ms_trans` (tf.float): Metasurface transmittance, of shape 
@@ -245,37 +312,66 @@ def batched_psf_measured(ms_trans, ms_phase, normby, point_source_locs, paramete
             (ideally to make the total psf energy unity).
         `point_source_locs` (tf.float): Tensor of point-source coordinates, of shape (N,3)
         `parameters` (prop_param):  Settings object defining field propagation details.
+        `chunk_size` (int, optional): Maximum number of fields (profile and point-source pairs) to propagate at once.
+            Defaults to None, in which case the full stack is computed together.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
+        `intensity_only` (bool, optional): If True, the phase is never computed or resampled and only the PSF 
+            intensity is returned. Defaults to False.
+        `recompute` (bool, optional): If True, the intermediate tensors of each chunk are recomputed during
+            backpropagation instead of being stored. Defaults to False.
 
     Returns:
         `tf.float`: Batched PSFs intensity of shape (1, batch_size, N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
         `tf.float`: Batched PSFs phase of shape (1, batch_size, N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+            Not returned if intensity_only is True.
     """
     # unpack parameters
     num_ms = ms_trans.shape[0]
-
-    # Use a tf while_loop to batch metasurfaces
-    def ms_loopCond(idx_, holdPSF_int_, holdPSF_phase_):
-        return tf.less(idx_, num_ms)
-
-    def ms_loopBody(idx_, holdPSF_int_, holdPSF_phase_):
-        psfs_int, psfs_phase = psf_measured(
-            point_source_locs, ms_trans[idx_ : idx_ + 1], ms_phase[idx_ : idx_ + 1], parameters, normby,
-        )
-
-        holdPSF_int_ = tf.concat([holdPSF_int_, tf.expand_dims(psfs_int, 0)], axis=0)
-        holdPSF_phase_ = tf.concat([holdPSF_phase_, tf.expand_dims(psfs_phase, 0)], axis=0)
-
-        idx_ += 1
-        return [idx_, holdPSF_int_, holdPSF_phase_]
-
-    # Run batched loop
-    sensor_pixel_number = parameters["sensor_pixel_number"]
-    dtype = parameters["dtype"]
     num_ps = point_source_locs.shape[0]
-    idx = tf.constant(0, dtype=tf.int32)
-    holdPSF_int = tf.zeros((1, num_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]), dtype=dtype)
-    holdPSF_phase = tf.zeros((1, num_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]), dtype=dtype)
-    loopData = tf.while_loop(ms_loopCond, ms_loopBody, loop_vars=[idx, holdPSF_int, holdPSF_phase])
-
-    return (tf.expand_dims(tf.stack(loopData[1][1:]), 0), tf.expand_dims(tf.stack(loopData[2][1:]), 0))
-
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    output_shape = [1, num_ms, num_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]]
+
+    def chunk_psf(chunk_locs, chunk_trans, chunk_phase):
+        return psf_measured(chunk_locs, chunk_trans, chunk_phase, parameters, normby, plan, intensity_only)
+
+    if recompute:
+        chunk_psf = tf.recompute_grad(chunk_psf)
+
+    if chunk_size is None or chunk_size >= num_ms * num_ps:
+        psfs = chunk_psf(point_source_locs, ms_trans, ms_phase)
+        if intensity_only:
+            return tf.reshape(psfs, output_shape)
+        return tf.reshape(psfs[0], output_shape), tf.reshape(psfs[1], output_shape)
+
+    # Split the profiles into chunks and, if a single profile still exceeds the budget, split the point-sources
+    ms_chunk = max(1, chunk_size // num_ps)
+    ps_chunk = min(num_ps, chunk_size)
+
+    hold_int = []
+    hold_phase = []
+    for ms_start in range(0, num_ms, ms_chunk):
+        ms_slice = slice(ms_start, min(ms_start + ms_chunk, num_ms))
+        this_ms = ms_slice.stop - ms_slice.start
+
+        chunk_int = []
+        chunk_phase = []
+        for ps_start in range(0, num_ps, ps_chunk):
+            ps_slice = slice(ps_start, min(ps_start + ps_chunk, num_ps))
+            this_ps = ps_slice.stop - ps_slice.start
+
+            psfs = chunk_psf(point_source_locs[ps_slice], ms_trans[ms_slice], ms_phase[ms_slice])
+            chunk_shape = [this_ms, this_ps, sensor_pixel_number["y"], sensor_pixel_number["x"]]
+            if intensity_only:
+                chunk_int.append(tf.reshape(psfs, chunk_shape))
+            else:
+                chunk_int.append(tf.reshape(psfs[0], chunk_shape))
+                chunk_phase.append(tf.reshape(psfs[1], chunk_shape))
+
+        hold_int.append(tf.concat(chunk_int, axis=1))
+        if not intensity_only:
+            hold_phase.append(tf.concat(chunk_phase, axis=1))
+
+    if intensity_only:
+        return tf.expand_dims(tf.concat(hold_int, axis=0), 0)
+
+    return tf.expand_dims(tf.concat(hold_int, axis=0), 0), tf.expand_dims(tf.concat(hold_phase, axis=0), 0)
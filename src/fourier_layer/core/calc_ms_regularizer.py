@@ -2,18 +2,110 @@ import tensorflow as tf
 import numpy as np
 
 
+def integer_upsampling_factors(parameters):
+    """Returns the upsampling factors of the metasurface if the calculation grid is an exact, odd integer refinement of
+    the metasurface grid (always the case for ms_upsampling "integer"), otherwise None.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `dict`: Number of calculation samples per metasurface cell, via {"x": int, "y": int}, or None.
+    """
+    ms_samplesM = parameters["ms_samplesM"]
+    calc_samplesM = parameters["calc_samplesM"]
+    factors = {}
+    for dim in ["x", "y"]:
+        factor, remainder = divmod(calc_samplesM[dim], ms_samplesM[dim])
+        if remainder != 0 or factor % 2 == 0:
+            return None
+        factors[dim] = factor
+
+    return factors
+
+
+def repeat_upsample(ms_modulation, factors, radial_flag, axis=-1):
+    """Upsamples metasurface profiles by repeating each cell, which is identical to (centred) nearest neighbor 
+    upsampling by an integer factor but requires no interpolation indices or phase conversions.
+
+    The radial profile is the right half of the centred 2D grid, so its first (central) cell only contributes its 
+    outer half.
+
+    Args:
+        `ms_modulation` (tf.Tensor): Metasurface profiles, of shape (..., ms_samplesM['y'], ms_samplesM['x']) or 
+            (..., 1, ms_samplesM['r']) with the spatial axes ending at `axis`.
+        `factors` (dict): Number of calculation samples per metasurface cell (see integer_upsampling_factors).
+        `radial_flag` (bool): Flag indicating if radial symmetry is used.
+        `axis` (int, optional): Last spatial (x or r) axis. Defaults to -1.
+
+    Returns:
+        `tf.Tensor`: Upsampled profiles, of shape (..., calc_samplesM['y'], calc_samplesM['x']) or 
+            (..., 1, calc_samplesM['r']).
+    """
+    if radial_flag:
+        offset = (factors["x"] - 1) // 2
+        ms_modulation = tf.repeat(ms_modulation, factors["x"], axis=axis)
+        return tf.gather(ms_modulation, tf.range(offset, ms_modulation.shape[axis]), axis=axis)
+
+    ms_modulation = tf.repeat(ms_modulation, factors["y"], axis=axis - 1)
+    return tf.repeat(ms_modulation, factors["x"], axis=axis)
+
+
+def cell_aperture_size(parameters):
+    """Returns the metasurface cell size if the cell aperture is applied in the frequency domain of the propagator
+    (ms_upsampling "cell_aperture"), otherwise None.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `dict`: Cell size in units of m, via {"x": float, "y": float}, or None.
+    """
+    if parameters["ms_upsampling"] != "cell_aperture":
+        return None
+
+    return parameters["ms_dx_m"]
+
+
+def cell_aperture_spectrum(freq_x, freq_y, cell_size_m):
+    """Returns the (DC-normalized) Fourier transform of a rectangular metasurface cell on a frequency grid. 
+
+    A field that is constant over each cell is the convolution of its cell samples with the cell aperture, so its 
+    spectrum is the spectrum of the samples multiplied by this separable sinc.
+
+    Args:
+        `freq_x` (np.float): Spatial frequencies along x, in units of 1/m.
+        `freq_y` (np.float): Spatial frequencies along y, in units of 1/m.
+        `cell_size_m` (dict): Cell size in units of m, via {"x": float, "y": float}.
+
+    Returns:
+        `np.float`: Cell aperture spectrum, of shape (len(freq_y), len(freq_x)).
+    """
+    sinc_x = np.sinc(np.asarray(freq_x) * cell_size_m["x"])
+    sinc_y = np.sinc(np.asarray(freq_y) * cell_size_m["y"])
+
+    return sinc_y[:, None] * sinc_x[None, :]
+
+
 def condResizeFn_true(ms_modulation_trans, ms_modulation_phase, parameters):
     method = "nearest"  # Do NOT change; This is a meaningful choice over interp methods!
 
+    # For an integer refinement, each cell is repeated and the phase is never converted to a phasor and back
+    radial_flag = parameters["radial_symmetry"]
+    factors = integer_upsampling_factors(parameters)
+    if factors is not None:
+        return (
+            repeat_upsample(ms_modulation_trans, factors, radial_flag),
+            repeat_upsample(ms_modulation_phase, factors, radial_flag),
+        )
+
     # Unpack variables and expand the channel dimension of input matrices
     calc_samplesM = parameters["calc_samplesM"]
     ms_modulation_trans = tf.expand_dims(ms_modulation_trans, -1)
     ms_modulation_phase = tf.expand_dims(ms_modulation_phase, -1)
 
     # handle radial flag conditional
-    # tf v2 supports nested conditionals
-    radial_flag = parameters["radial_symmetry"]
-    resizeTo = tf.cond(radial_flag, lambda: [1, calc_samplesM["r"]], lambda: [calc_samplesM["y"], calc_samplesM["x"]],)
+    resizeTo = [1, calc_samplesM["r"]] if radial_flag else [calc_samplesM["y"], calc_samplesM["x"]]
 
     # Resize transmittance of the field -- Just upsampling so nearest interp req.
     calc_modulation_trans = tf.image.resize(
@@ -45,11 +137,10 @@ def condPad_true(calc_modulation_trans, calc_modulation_phase, parameters):
 
     # handle radial flag conditional
     radial_flag = parameters["radial_symmetry"]
-    paddings = tf.cond(
-        radial_flag,
-        lambda: [[0, 0], [0, 0], [0, padhalfx]],
-        lambda: [[0, 0], [padhalfy, padhalfy], [padhalfx, padhalfx]],
-    )
+    if radial_flag:
+        paddings = [[0, 0], [0, 0], [0, padhalfx]]
+    else:
+        paddings = [[0, 0], [padhalfy, padhalfy], [padhalfx, padhalfx]]
 
     calc_modulation_trans = tf.pad(calc_modulation_trans, paddings, mode="CONSTANT", constant_values=0)
     calc_modulation_phase = tf.pad(calc_modulation_phase, paddings, mode="CONSTANT", constant_values=0)
@@ -88,25 +179,104 @@ def regularize_ms_calc_tf(
     calc_modulation_trans = tf.identity(ms_modulation_trans)
     calc_modulation_phase = tf.identity(ms_modulation_phase)
 
-    # Resample the metasurface via nearest neighbors if required
-    resizeCondition = tf.math.logical_or(
-        tf.greater(calc_samplesM["x"], ms_samplesM["x"]), tf.greater(calc_samplesM["y"], ms_samplesM["y"]),
-    )
-    calc_modulation_trans, calc_modulation_phase = tf.cond(
-        resizeCondition,
-        lambda: condResizeFn_true(ms_modulation_trans, ms_modulation_phase, parameters),
-        lambda: condResizeFn_false(ms_modulation_trans, ms_modulation_phase, parameters),
-    )
+    # Resample the metasurface via nearest neighbors if required (the grid sizes are static settings so the branch is
+    # resolved in python and the output shape stays static when traced)
+    resizeCondition = calc_samplesM["x"] > ms_samplesM["x"] or calc_samplesM["y"] > ms_samplesM["y"]
+    if resizeCondition:
+        calc_modulation_trans, calc_modulation_phase = condResizeFn_true(
+            ms_modulation_trans, ms_modulation_phase, parameters
+        )
+    else:
+        calc_modulation_trans, calc_modulation_phase = condResizeFn_false(
+            ms_modulation_trans, ms_modulation_phase, parameters
+        )
 
     # Pad the array if samplesN (padded) is larger than samplesM (unpadded)
     calc_samplesN = parameters["calc_samplesN"]
-    padCondition = tf.math.logical_or(
-        tf.greater(calc_samplesN["x"], calc_samplesM["x"]), tf.greater(calc_samplesN["y"], calc_samplesM["y"]),
-    )
-    calc_modulation_trans, calc_modulation_phase = tf.cond(
-        padCondition,
-        lambda: condPad_true(calc_modulation_trans, calc_modulation_phase, parameters),
-        lambda: condPad_false(calc_modulation_trans, calc_modulation_phase, parameters),
-    )
+    padCondition = calc_samplesN["x"] > calc_samplesM["x"] or calc_samplesN["y"] > calc_samplesM["y"]
+    if padCondition:
+        calc_modulation_trans, calc_modulation_phase = condPad_true(
+            calc_modulation_trans, calc_modulation_phase, parameters
+        )
+    else:
+        calc_modulation_trans, calc_modulation_phase = condPad_false(
+            calc_modulation_trans, calc_modulation_phase, parameters
+        )
 
     return tf.cast(calc_modulation_trans, dtype), tf.cast(calc_modulation_phase, dtype)
+
+
+def nearest_resize_indices(input_size, output_size):
+    """Returns the source indices of nearest neighbor resampling along one axis, matching tf.image.resize with
+    method="nearest" (half-pixel centers, evaluated in single precision as in the TF kernel).
+
+    Args:
+        `input_size` (int): Number of input samples.
+        `output_size` (int): Number of output samples.
+
+    Returns:
+        `np.int32`: Index of the input sample used for each output sample, of length output_size.
+    """
+    scale = np.float32(input_size) / np.float32(output_size)
+    index = np.floor((np.arange(output_size, dtype=np.float32) + np.float32(0.5)) * scale)
+
+    return np.clip(index, 0, input_size - 1).astype(np.int32)
+
+
+def condResizeFn_true_complex(ms_modulation_real, ms_modulation_imag, parameters):
+    calc_samplesM = parameters["calc_samplesM"]
+    radial_flag = parameters["radial_symmetry"]
+    resizeTo = [1, calc_samplesM["r"]] if radial_flag else [calc_samplesM["y"], calc_samplesM["x"]]
+    factors = integer_upsampling_factors(parameters)
+    if factors is not None:
+        calc_modulation = tf.stack([ms_modulation_real, ms_modulation_imag], -1)
+        calc_modulation = repeat_upsample(calc_modulation, factors, radial_flag, axis=-2)
+        return calc_modulation[..., 0], calc_modulation[..., 1]
+
+    # Nearest neighbor upsampling is applied as a gather with static indices; unlike tf.image.resize, this gives the 
+    # same result when compiled with XLA
+    index_y = nearest_resize_indices(ms_modulation_real.shape[-2], resizeTo[0])
+    index_x = nearest_resize_indices(ms_modulation_real.shape[-1], resizeTo[1])
+    calc_modulation = tf.stack([ms_modulation_real, ms_modulation_imag], -1)
+    calc_modulation = tf.gather(tf.gather(calc_modulation, index_y, axis=-3), index_x, axis=-2)
+
+    return calc_modulation[..., 0], calc_modulation[..., 1]
+
+
+def regularize_ms_calc_complex(ms_modulation_field, parameters):
+    """Complex field implementation of regularize_ms_calc_tf(). Given an input complex field defined on the grid 
+    specified in the parameters object, upsample the field and pad according to the computed requirements.
+
+    Nearest neighbor upsampling of the real and imaginary parts is identical to upsampling the amplitude and phase so
+    this returns the same field as regularize_ms_calc_tf without the amplitude/phase conversions.
+
+    Args:
+        `ms_modulation_field` (tf.complex): Metasurface complex modulation on the user specified grid of shape 
+            (batch_size, ms_samplesM['y'], ms_samplesM['x']) or (batch_size, 1, ms_samplesM['r']).
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `tf.complex`: Upsampled and padded metasurface modulation of shape (batch_size, calc_samplesN['y'], calc_samplesN['x'])
+            or (batch_size, 1, calc_samplesN['r']).
+    """
+    # The real and imaginary parts are passed through the same resize and pad calls used for transmittance and phase
+    calc_samplesM = parameters["calc_samplesM"]
+    ms_samplesM = parameters["ms_samplesM"]
+    calc_modulation_real = tf.math.real(ms_modulation_field)
+    calc_modulation_imag = tf.math.imag(ms_modulation_field)
+
+    resizeCondition = calc_samplesM["x"] > ms_samplesM["x"] or calc_samplesM["y"] > ms_samplesM["y"]
+    if resizeCondition:
+        calc_modulation_real, calc_modulation_imag = condResizeFn_true_complex(
+            calc_modulation_real, calc_modulation_imag, parameters
+        )
+
+    calc_samplesN = parameters["calc_samplesN"]
+    padCondition = calc_samplesN["x"] > calc_samplesM["x"] or calc_samplesN["y"] > calc_samplesM["y"]
+    if padCondition:
+        calc_modulation_real, calc_modulation_imag = condPad_true(
+            calc_modulation_real, calc_modulation_imag, parameters
+        )
+
+    return tf.complex(calc_modulation_real, calc_modulation_imag)
+
@@ -0,0 +1,134 @@
+import tensorflow as tf
+from .calc_ms_regularizer import regularize_ms_calc_complex
+from .hankel import safe_angle
+from .angular_spectrum_method import (
+    asm_bandlimited_default_padding,
+    asm_bandlimited_terms,
+    transfer_function_diffraction_bandlimited_complex,
+)
+from .psf_compute import wavefront_afterms_sensor_complex
+from .detectorResampling import sensorMeasurement_intensity_phase, sensorMeasurement_intensity_phase_radialData
+
+
+class gap_plan:
+    """Precomputed, static tensors used when propagating a field over the gap between two elements of a cascade.
+
+    The field stays on the calculation grid of the prop_params configuration (the output grid equals the input grid)
+    so that the next element can be applied directly. The band-limited angular spectrum method is used for every gap,
+    regardless of the diffraction engine, since it maps the calculation grid onto itself for any distance. The plan
+    holds the terms read by transfer_function_diffraction_bandlimited_complex from its `plan` argument.
+
+    Attributes:
+        `distance_m` (float): Gap distance, in units of m.
+        `padhalf` (dict): Zero-padding of the field on each side, via {"x": int, "y": int}.
+        `asm_grid_x` (tf.float): Padded x-coordinate grid.
+        `asm_transfer_function` (tf.complex): Band-limited transfer function of the gap.
+        `asm_output_terms` (None): No output transform terms (the output pitch equals the input pitch).
+    """
+
+    def __init__(self, parameters, distance_m):
+        """Gap plan initialization.
+
+        Args:
+            `parameters` (prop_params): Settings object defining the calculation grid (single wavelength).
+            `distance_m` (float): Gap distance, in units of m.
+        """
+        calc_ms_dx_m = parameters["calc_ms_dx_m"]
+        calc_samplesN = parameters["calc_samplesN"]
+
+        self.distance_m = distance_m
+        self.padhalf = asm_bandlimited_default_padding(calc_ms_dx_m, calc_samplesN, calc_ms_dx_m)
+        self.asm_grid_x, self.asm_transfer_function, self.asm_output_terms = asm_bandlimited_terms(
+            parameters["wavelength_m"],
+            distance_m,
+            calc_ms_dx_m,
+            calc_samplesN,
+            calc_ms_dx_m,
+            parameters["dtype"],
+            parameters["radial_symmetry"],
+            self.padhalf,
+            parameters["hankel_method"],
+            calc_samplesN,
+        )
+
+
+def cascade_gap_plans(parameters, element_gaps_m):
+    """Builds the gap plans of a cascade; gaps of equal distance share one plan.
+
+    Args:
+        `parameters` (prop_params): Settings object defining the calculation grid (single wavelength).
+        `element_gaps_m` (list): Distances between consecutive elements, in units of m.
+
+    Returns:
+        `list`: gap_plan object for each gap.
+    """
+    plans = {}
+    for distance_m in element_gaps_m:
+        if distance_m not in plans:
+            plans[distance_m] = gap_plan(parameters, distance_m)
+
+    return [plans[distance_m] for distance_m in element_gaps_m]
+
+
+def cascaded_field_propagation(element_amplitude, element_phase, parameters, gap_plans, plan=None):
+    """Propagates a batch of fields through a cascade of modulation planes (elements) separated by free-space gaps,
+    for a single wavelength, and measures the field at the output plane.
+
+    The first element is the field just after the first plane (as for field_propagation). Each element is resampled
+    onto the calculation grid and multiplied with the field propagated to it, which never leaves the calculation grid
+    between elements. Only the propagation after the last element (over parameters["sensor_distance_m"], with the
+    configured diffraction engine) is followed by the detector resampling.
+
+    Args:
+        `element_amplitude` (tf.float): Amplitude modulation of each element, of shape
+            (num_elements, batch_size, ms_samplesM["y"], ms_samplesM["x"]) or 
+            (num_elements, batch_size, 1, ms_samplesM["r"]).
+        `element_phase` (tf.float): Phase modulation of each element, of the same shape as element_amplitude.
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+        `gap_plans` (list): gap_plan objects for the num_elements - 1 gaps between consecutive elements.
+        `plan` (propagation_plan, optional): Precomputed static tensors for the propagation after the last element.
+            Defaults to None.
+
+    Returns:
+        `tf.float`: Output plane field amplitude, of shape (batch_size, sensor_pixel_number["y"],
+            sensor_pixel_number["x"]) or (batch_size, 1, sensor_pixel_number["r"]).
+        `tf.float`: Output plane field phase, of the same shape.
+    """
+    dtype = parameters["dtype"]
+    radial_symmetry = parameters["radial_symmetry"]
+    calc_ms_dx_m = parameters["calc_ms_dx_m"]
+    calc_samplesN = parameters["calc_samplesN"]
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
+
+    field = None
+    for idx in range(len(gap_plans) + 1):
+        modulation = tf.complex(tf.cast(element_amplitude[idx], dtype), TF_ZERO) * tf.exp(
+            tf.complex(TF_ZERO, tf.cast(element_phase[idx], dtype))
+        )
+        modulation = regularize_ms_calc_complex(modulation, parameters)
+        field = modulation if field is None else field * modulation
+
+        if idx < len(gap_plans):
+            field = transfer_function_diffraction_bandlimited_complex(
+                field,
+                parameters["wavelength_m"],
+                gap_plans[idx].distance_m,
+                calc_ms_dx_m,
+                calc_samplesN,
+                calc_ms_dx_m,
+                dtype,
+                radial_symmetry,
+                optArg=gap_plans[idx].padhalf,
+                plan=gap_plans[idx],
+                hankel_method=parameters["hankel_method"],
+                output_pixel_number=calc_samplesN,
+            )
+
+    # Propagate to the output plane and measure the field on the user specified grid
+    field = wavefront_afterms_sensor_complex(field, parameters, plan)
+    field_amplitude = tf.math.abs(field)
+    field_phase = safe_angle(field)
+    if radial_symmetry:
+        return sensorMeasurement_intensity_phase_radialData(field_amplitude, field_phase, parameters, plan)
+
+    return sensorMeasurement_intensity_phase(field_amplitude, field_phase, parameters, plan)
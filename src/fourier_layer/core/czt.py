@@ -0,0 +1,114 @@
+import numpy as np
+import tensorflow as tf
+
+
+def fast_fft_length(min_length):
+    """Returns the smallest integer greater than or equal to min_length with no prime factors other than 2, 3, and 5.
+
+    Args:
+        `min_length` (int): Minimum transform length.
+
+    Returns:
+        `int`: FFT-friendly transform length.
+    """
+    length = int(min_length)
+    while True:
+        remainder = length
+        for factor in [2, 3, 5]:
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return length
+        length += 1
+
+
+def czt_terms(input_start, input_dx, input_number, output_start, output_dx, output_number, scale, norm, dtype):
+    """Computes the chirps used to evaluate the transform
+
+        out[k] = norm * sum_n in[n] * exp(-i * scale * x[n] * u[k]),
+
+    with x[n] = input_start + n * input_dx and u[k] = output_start + k * output_dx, as a chirp-z (Bluestein) transform.
+
+    The output grid is independent of the input grid so the transform may be evaluated for any output pitch and window.
+    The FFT length is the smallest FFT-friendly integer >= input_number + output_number - 1. All phases are computed in
+    double precision before casting.
+
+    Args:
+        `input_start` (float): First input coordinate.
+        `input_dx` (float): Input grid pitch.
+        `input_number` (int): Number of input samples.
+        `output_start` (float): First output coordinate.
+        `output_dx` (float): Output grid pitch.
+        `output_number` (int): Number of output samples.
+        `scale` (float): Scale factor in the exponent (e.g. 2 pi / (wavelength * distance) for the Fresnel integral).
+            A negative value gives the transform with a positive exponent.
+        `norm` (float): Scalar normalization applied to the output.
+        `dtype` (tf.dtype): Real datatype of the calculation, either tf.float64 or tf.float32.
+
+    Returns:
+        `tf.complex`: Pre-multiplication chirp of shape (input_number,).
+        `tf.complex`: FFT of the convolution chirp, of shape (fft_length,).
+        `tf.complex`: Post-multiplication chirp (including norm) of shape (output_number,).
+    """
+    complex_dtype = tf.complex128 if dtype == tf.float64 else tf.complex64
+    n = np.arange(input_number, dtype=np.float64)
+    k = np.arange(output_number, dtype=np.float64)
+    beta = scale * input_dx * output_dx
+
+    pre_chirp = np.exp(-1j * (scale * input_dx * output_start * n + beta * n ** 2 / 2))
+    post_chirp = norm * np.exp(
+        -1j * (scale * input_start * output_start + scale * input_start * output_dx * k + beta * k ** 2 / 2)
+    )
+
+    # The convolution chirp is defined for lags m = -(input_number - 1), ..., output_number - 1 and is wrapped into a
+    # circular buffer of the FFT length
+    fft_length = fast_fft_length(input_number + output_number - 1)
+    m = np.arange(fft_length, dtype=np.float64)
+    m[output_number:] -= fft_length
+    kernel = np.exp(1j * beta * m ** 2 / 2)
+    kernel[output_number : fft_length - input_number + 1] = 0.0
+    kernel_fft = np.fft.fft(kernel)
+
+    return (
+        tf.constant(pre_chirp, dtype=complex_dtype),
+        tf.constant(kernel_fft, dtype=complex_dtype),
+        tf.constant(post_chirp, dtype=complex_dtype),
+    )
+
+
+def czt(data, terms):
+    """Applies the chirp-z transform defined by czt_terms() along the last axis of a rank 3 tensor.
+
+    Args:
+        `data` (tf.complex): Input data of shape (batch_size, Ny, input_number).
+        `terms` (tuple): Pre-chirp, kernel FFT, and post-chirp as returned by czt_terms().
+
+    Returns:
+        `tf.complex`: Transformed data of shape (batch_size, Ny, output_number).
+    """
+    pre_chirp, kernel_fft, post_chirp = terms
+    input_number = pre_chirp.shape[0]
+    fft_length = kernel_fft.shape[0]
+    output_number = post_chirp.shape[0]
+
+    data = tf.pad(data * pre_chirp, [[0, 0], [0, 0], [0, fft_length - input_number]])
+    data = tf.signal.ifft(tf.signal.fft(data) * kernel_fft)
+
+    return data[:, :, :output_number] * post_chirp
+
+
+def czt2d(data, terms_x, terms_y):
+    """Applies the separable chirp-z transform along the last two axes of a rank 3 tensor.
+
+    Args:
+        `data` (tf.complex): Input data of shape (batch_size, Ny, Nx).
+        `terms_x` (tuple): Transform terms along x, as returned by czt_terms().
+        `terms_y` (tuple): Transform terms along y, as returned by czt_terms().
+
+    Returns:
+        `tf.complex`: Transformed data of shape (batch_size, output_number_y, output_number_x).
+    """
+    data = czt(data, terms_x)
+    data = czt(tf.transpose(data, [0, 2, 1]), terms_y)
+
+    return tf.transpose(data, [0, 2, 1])
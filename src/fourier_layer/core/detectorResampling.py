@@ -1,7 +1,7 @@
 import tensorflow as tf
 import tensorflow_probability as tfp
 import numpy as np
-from .hankel import radial_crop_or_pad
+from .hankel import radial_crop_or_pad, safe_atan2
 
 
 def batch_interp_regular_nd(real_refdat_2d, ref_grid_min, ref_grid_max, x_grid_mesh, y_grid_mesh):
@@ -93,114 +93,123 @@ def resample_phase_sensor(phase, input_size, resize_ratio):
     phasex = resize_area(tf.math.cos(phase), input_size, resize_ratio) / resize_ratio["x"] / resize_ratio["y"]
     phasey = resize_area(tf.math.sin(phase), input_size, resize_ratio) / resize_ratio["x"] / resize_ratio["y"]
 
-    return tf.math.atan2(phasey, phasex)
+    return safe_atan2(phasey, phasex)
 
 
-def sensorMeasurement_intensity_phase(sensor_intensity, sensor_phase, parameters):
+def sensorMeasurement_intensity_phase(sensor_intensity, sensor_phase, parameters, plan=None):
     """Returns both the measured intensity on the detector and the averaged phase on the detector pixels, given the 
     intensity and phase on a grid just above the detector face.
     
-    Note: In the current version, the measurement implementation does NOT enable fractional resize treatment. As an
-    important consquence, the integer rounded resize will be slightly incorrect. 
+    If parameters["accurate_measurement"] is True, the sensor plane grid is integrated over the detector pixels using
+    exact, separable area-overlap matrices (see sensor_area_overlap), which also handle fractional ratios between the 
+    detector pixel size and the grid pitch. Otherwise, a box filter with the rounded integer ratio is used, which is 
+    slightly incorrect when the ratio is not an integer.
 
     Args:
-        `sensor_intensity` (tf.float64): Field intensity at the sensor plane, of shape (batch_size, calc_samplesN["y"], calc_samplesN["x"]).
-        `sensor_phase` (tf.float64): Field phase at the sensor plane, of shape (batch_size, calc_samplesN["y"], calc_samplesN["x"]).
+        `sensor_intensity` (tf.float64): Field intensity at the sensor plane, of shape (batch_size, calc_sensor_samplesN["y"], calc_sensor_samplesN["x"]).
+        `sensor_phase` (tf.float64): Field phase at the sensor plane, of shape (batch_size, calc_sensor_samplesN["y"], calc_sensor_samplesN["x"]).
         `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed area-overlap matrices for this geometry. Defaults to None.
 
     Returns:
         `tf.float64`: Intensity measured on the detector pixel array, of shape (batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"])
         `tf.float64`: Average phase measured on the detector pixel array, of shape (batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"])
     """
+    sensor_intensity = sensorMeasurement_intensity(sensor_intensity, parameters, plan)
 
-    ### Our manual conv2D area-resize requires integer resize ratios so first we reinterpolate the sensor grid measurements
-    # Unpack parameters
-    calc_samplesN = parameters["calc_samplesN"]
-    calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
-    sensor_pixel_size_m = parameters["sensor_pixel_size_m"]
-    sensor_pixel_number = parameters["sensor_pixel_number"]
-    dtype = parameters["dtype"]
+    if parameters["accurate_measurement"]:
+        area_overlap = sensor_area_overlap(parameters) if plan is None else plan.sensor_area_overlap
+        sensor_phase = resample_phase_area_overlap(sensor_phase, area_overlap)
+    else:
+        sensor_pixel_number = parameters["sensor_pixel_number"]
+        new_size = {"x": sensor_phase.shape[2], "y": sensor_phase.shape[1]}
+        sensor_phase = resample_phase_sensor(
+            tf.expand_dims(sensor_phase, -1), new_size, sensor_resize_ratio(parameters)
+        )
+        sensor_phase = tf.image.resize_with_crop_or_pad(
+            sensor_phase, sensor_pixel_number["y"], sensor_pixel_number["x"]
+        )
+        sensor_phase = tf.squeeze(sensor_phase, -1)
 
-    # Define the sensor plane grid (non-centered)
-    max_grid_span_x = calc_samplesN["x"] * calc_sensor_dx_m["x"]
-    max_grid_span_y = calc_samplesN["y"] * calc_sensor_dx_m["y"]
-    sens_grid_min = [0.0, 0.0]
-    sens_grid_max = [max_grid_span_x, max_grid_span_y]
+    return sensor_intensity, sensor_phase
 
-    round_ratio_pixel_grid = {
-        "x": int(np.round(sensor_pixel_size_m["x"] / calc_sensor_dx_m["x"])),
-        "y": int(np.round(sensor_pixel_size_m["y"] / calc_sensor_dx_m["y"])),
-    }
-    interp_sensor_dx = {
-        "x": sensor_pixel_size_m["x"] / round_ratio_pixel_grid["x"],
-        "y": sensor_pixel_size_m["y"] / round_ratio_pixel_grid["y"],
-    }
 
-    # Call interp on new sensor plane grid
+def sensorMeasurement_intensity(sensor_intensity, parameters, plan=None):
+    """Returns the measured intensity on the detector, given the intensity on a grid just above the detector face. 
+
+    This is the intensity-only counterpart of sensorMeasurement_intensity_phase(); no phase is resampled.
+
+    Args:
+        `sensor_intensity` (tf.float64): Field intensity at the sensor plane, of shape (batch_size, calc_sensor_samplesN["y"], calc_sensor_samplesN["x"]).
+        `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed area-overlap matrices for this geometry. Defaults to None.
+
+    Returns:
+        `tf.float64`: Intensity measured on the detector pixel array, of shape (batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"])
+    """
     if parameters["accurate_measurement"]:
-        interp_grid_x, interp_grid_y = tf.meshgrid(
-            tf.range(0, max_grid_span_x, delta=interp_sensor_dx["x"], dtype=dtype),
-            tf.range(0, max_grid_span_y, delta=interp_sensor_dx["y"], dtype=dtype),
-        )
-        sensor_intensity = batch_interp_regular_nd(
-            sensor_intensity, sens_grid_min, sens_grid_max, interp_grid_x, interp_grid_y
-        )
-        sensor_phase = batch_interp_regular_nd(
-            sensor_phase, sens_grid_min, sens_grid_max, interp_grid_x, interp_grid_y
-        )
-    new_size = {"x": sensor_intensity.shape[2], "y": sensor_intensity.shape[0]}
+        area_overlap = sensor_area_overlap(parameters) if plan is None else plan.sensor_area_overlap
+        return resample_area_overlap(sensor_intensity, area_overlap)
 
-    # Now call the resize
+    # Box filter with the rounded integer ratio then crop to the detector
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    new_size = {"x": sensor_intensity.shape[2], "y": sensor_intensity.shape[1]}
     sensor_intensity = resample_intensity_sensor(
-        tf.expand_dims(sensor_intensity, -1), new_size, round_ratio_pixel_grid
+        tf.expand_dims(sensor_intensity, -1), new_size, sensor_resize_ratio(parameters)
     )
     sensor_intensity = tf.image.resize_with_crop_or_pad(
         sensor_intensity, sensor_pixel_number["y"], sensor_pixel_number["x"]
     )
 
-    sensor_phase = resample_phase_sensor(tf.expand_dims(sensor_phase, -1), new_size, round_ratio_pixel_grid)
-    sensor_phase = tf.image.resize_with_crop_or_pad(sensor_phase, sensor_pixel_number["y"], sensor_pixel_number["x"])
+    return tf.squeeze(sensor_intensity, -1)
+
+
+def sensor_resize_ratio(parameters):
+    """Returns the integer ratio of the detector pixel size to the sensor plane grid pitch, used in the area resize.
 
-    return tf.squeeze(sensor_intensity, -1), tf.squeeze(sensor_phase, -1)
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
 
+    Returns:
+        `dict`: Integer resize ratio along x and y, via dictionary {"x": int, "y": int}.
+    """
+    calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+    sensor_pixel_size_m = parameters["sensor_pixel_size_m"]
 
-def sensorMeasurement_intensity_phase_radialData(sensor_intensity, sensor_phase, parameters):
+    return {
+        "x": int(np.round(sensor_pixel_size_m["x"] / calc_sensor_dx_m["x"])),
+        "y": int(np.round(sensor_pixel_size_m["y"] / calc_sensor_dx_m["y"])),
+    }
+
+
+def sensorMeasurement_intensity_phase_radialData(sensor_intensity, sensor_phase, parameters, plan=None):
     """Returns both the measured intensity on the detector and the averaged phase on the detector pixels, given the
     intensity and phase on a grid just above the detector face.
 
-    Note: In the current version, the measurement implementation does NOT enable fractional resize treatment. As an
-    important consquence, the integer rounded resize will be slightly incorrect.
+    If parameters["accurate_measurement"] is True, the radial data is integrated over the detector pixels along x 
+    using an exact area-overlap matrix (see sensor_area_overlap_radialData). Otherwise, a box filter with the rounded 
+    integer ratio is used.
 
     Args:
-        `sensor_intensity` (tf.float64): Field intensity at the sensor plane, of shape (batch_size, 1, calc_samplesN["r"]).
-        `sensor_phase` (tf.float64): Field phase at the sensor plane, of shape (batch_size, 1, calc_samplesN["r"]).
+        `sensor_intensity` (tf.float64): Field intensity at the sensor plane, of shape (batch_size, 1, calc_sensor_samplesN["r"]).
+        `sensor_phase` (tf.float64): Field phase at the sensor plane, of shape (batch_size, 1, calc_sensor_samplesN["r"]).
         `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed area-overlap matrix for this geometry. Defaults to None.
 
     Returns:
         `tf.float64`: Intensity measured on the detector pixel array, of shape (batch_size, 1, sensor_pixel_number["r"])
         `tf.float64`: Average phase measured on the detector pixel array, of shape (batch_size, 1, sensor_pixel_number["r"])
     """
-
-    ### Our manual conv2D area-resize requires integer resize ratios so first we reinterpolate the sensor grid measurements
-    # Unpack parameters
-    calc_samplesN = parameters["calc_samplesN"]
-    calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
-    sensor_pixel_size_m = parameters["sensor_pixel_size_m"]
-    sensor_pixel_number = parameters["sensor_pixel_number"]
-    dtype = parameters["dtype"]
-
-    # Define the sensor plane grid
-    sens_grid_max = calc_samplesN["r"] * calc_sensor_dx_m["x"]
-    round_ratio_pixel_grid_x = int(round(sensor_pixel_size_m["x"] / calc_sensor_dx_m["x"]))
-    interp_sensor_dx = sensor_pixel_size_m["x"] / round_ratio_pixel_grid_x
-
-    # Call interp on new sensor plane grid
     if parameters["accurate_measurement"]:
-        r = tf.range(0, sens_grid_max, delta=interp_sensor_dx, dtype=dtype)
-        sensor_intensity = tfp.math.interp_regular_1d_grid(r, 0.0, sens_grid_max, sensor_intensity)
-        sensor_phase = tfp.math.interp_regular_1d_grid(r, 0.0, sens_grid_max, sensor_phase)
+        area_overlap = sensor_area_overlap_radialData(parameters) if plan is None else plan.sensor_area_overlap_r
+        sensor_intensity = resample_area_overlap(sensor_intensity, area_overlap)
+        sensor_phase = resample_phase_area_overlap(sensor_phase, area_overlap)
+        return sensor_intensity, sensor_phase
 
-    new_size = {"x": sensor_intensity.shape[2], "y": sensor_intensity.shape[0]}
+    # Box filter with the rounded integer ratio then crop to the detector
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    round_ratio_pixel_grid_x = sensor_resize_ratio(parameters)["x"]
+    new_size = {"x": sensor_intensity.shape[2], "y": sensor_intensity.shape[1]}
     sensor_intensity = resample_intensity_sensor(
         tf.expand_dims(sensor_intensity, -1), new_size, {"x": round_ratio_pixel_grid_x, "y": 1}
     )
@@ -213,3 +222,145 @@ def sensorMeasurement_intensity_phase_radialData(sensor_intensity, sensor_phase,
     sensor_phase = radial_crop_or_pad(tf.squeeze(sensor_phase, -1), {"r": sensor_pixel_number["r"]})
 
     return sensor_intensity, sensor_phase
+
+
+def area_overlap_matrix(input_pixel_number, input_dx_m, output_pixel_number, output_dx_m, dtype, radial=False):
+    """Returns the matrix of overlaps between the cells of a uniform input grid and the pixels of a uniform output grid
+    along one dimension. Both grids are centered on the same origin.
+
+    Element [j, i] is the fraction of input cell i that falls within output pixel j so that a matrix product integrates
+    the input samples over each output pixel. Any ratio of output_dx_m to input_dx_m (including fractional) is treated
+    exactly. Input samples which do not overlap any output pixel are dropped: only the columns start:stop are returned.
+
+    Args:
+        `input_pixel_number` (int): Number of samples on the input grid.
+        `input_dx_m` (float): Input grid pitch, in units of m.
+        `output_pixel_number` (int): Number of pixels on the output grid.
+        `output_dx_m` (float): Output pixel size, in units of m.
+        `dtype` (tf.dtype): Datatype of the returned matrix.
+        `radial` (bool, optional): If True, both grids are radial vectors starting at the origin. The radial data is 
+            treated as the x-axis slice of the radially symmetric field so samples at negative x are folded back onto 
+            the radial samples. Defaults to False.
+
+    Returns:
+        `tf.float`: Overlap matrix of shape (output_pixel_number, stop - start).
+        `int`: Index of the first input sample used.
+        `int`: Index after the last input sample used.
+    """
+    if radial:
+        input_x = np.arange(-(input_pixel_number - 1), input_pixel_number) * input_dx_m
+        output_x = np.arange(output_pixel_number) * output_dx_m
+    else:
+        input_x = (np.arange(input_pixel_number) - (input_pixel_number - 1) / 2) * input_dx_m
+        output_x = (np.arange(output_pixel_number) - (output_pixel_number - 1) / 2) * output_dx_m
+
+    lower = np.maximum(output_x[:, None] - output_dx_m / 2, input_x[None, :] - input_dx_m / 2)
+    upper = np.minimum(output_x[:, None] + output_dx_m / 2, input_x[None, :] + input_dx_m / 2)
+    overlap = np.clip(upper - lower, 0.0, None) / input_dx_m
+
+    # Remove round-off slivers where pixel and cell edges coincide
+    overlap[overlap < 1e-9] = 0.0
+
+    if radial:
+        overlap = overlap[:, input_pixel_number - 1 :] + np.pad(
+            np.flip(overlap[:, : input_pixel_number - 1], axis=1), [[0, 0], [1, 0]]
+        )
+
+    used = np.nonzero(np.any(overlap > 0, axis=0))[0]
+    start, stop = (int(used[0]), int(used[-1]) + 1) if len(used) else (0, 0)
+
+    return tf.constant(overlap[:, start:stop], dtype=dtype), start, stop
+
+
+def sensor_area_overlap(parameters):
+    """Returns the separable area-overlap matrices which integrate the sensor plane grid over the detector pixels. 
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `dict`: Overlap matrix and used sample range along y and x (see area_overlap_matrix), via dictionary 
+            {"y": tuple, "x": tuple}.
+    """
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+    calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+    sensor_pixel_size_m = parameters["sensor_pixel_size_m"]
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    dtype = parameters["dtype"]
+
+    return {
+        dim: area_overlap_matrix(
+            calc_sensor_samplesN[dim],
+            calc_sensor_dx_m[dim],
+            sensor_pixel_number[dim],
+            sensor_pixel_size_m[dim],
+            dtype,
+        )
+        for dim in ["y", "x"]
+    }
+
+
+def sensor_area_overlap_radialData(parameters):
+    """Returns the area-overlap matrix which integrates radial sensor plane data over the detector pixels along x.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `dict`: Overlap matrix and used sample range along x (see area_overlap_matrix), via dictionary {"x": tuple}.
+    """
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+    calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+    sensor_pixel_size_m = parameters["sensor_pixel_size_m"]
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    dtype = parameters["dtype"]
+
+    return {
+        "x": area_overlap_matrix(
+            calc_sensor_samplesN["r"],
+            calc_sensor_dx_m["x"],
+            sensor_pixel_number["r"],
+            sensor_pixel_size_m["x"],
+            dtype,
+            radial=True,
+        )
+    }
+
+
+def resample_area_overlap(sensor_data, area_overlap):
+    """Integrates sensor plane data over the detector pixels by applying the area-overlap matrices along y (if given) 
+    and x. Only the samples which overlap the detector are used.
+
+    Args:
+        `sensor_data` (tf.float): Real data at the sensor plane, of shape (batch_size, Ny, Nx).
+        `area_overlap` (dict): Overlap matrices from sensor_area_overlap or sensor_area_overlap_radialData.
+
+    Returns:
+        `tf.float`: Integrated data on the detector pixels, of shape (batch_size, sensor_pixel_number["y"], 
+            sensor_pixel_number["x"]) or (batch_size, 1, sensor_pixel_number["r"]).
+    """
+    matrix_x, start_x, stop_x = area_overlap["x"]
+    sensor_data = sensor_data[:, :, start_x:stop_x]
+
+    if "y" in area_overlap:
+        matrix_y, start_y, stop_y = area_overlap["y"]
+        sensor_data = tf.linalg.matmul(matrix_y, sensor_data[:, start_y:stop_y, :])
+
+    return tf.linalg.matmul(sensor_data, matrix_x, transpose_b=True)
+
+
+def resample_phase_area_overlap(sensor_phase, area_overlap):
+    """Returns the phase averaged over the detector pixels, computed from the area-weighted average of the phasor.
+
+    Args:
+        `sensor_phase` (tf.float): Phase at the sensor plane, of shape (batch_size, Ny, Nx).
+        `area_overlap` (dict): Overlap matrices from sensor_area_overlap or sensor_area_overlap_radialData.
+
+    Returns:
+        `tf.float`: Average phase on the detector pixels, of shape (batch_size, sensor_pixel_number["y"], 
+            sensor_pixel_number["x"]) or (batch_size, 1, sensor_pixel_number["r"]).
+    """
+    phasex = resample_area_overlap(tf.math.cos(sensor_phase), area_overlap)
+    phasey = resample_area_overlap(tf.math.sin(sensor_phase), area_overlap)
+
+    return safe_atan2(phasey, phasex)
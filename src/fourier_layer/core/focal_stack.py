@@ -0,0 +1,188 @@
+import tensorflow as tf
+from .calc_ms_regularizer import regularize_ms_calc_complex, cell_aperture_size
+from .hankel import radial_conditional_resize_with_crop_or_pad, safe_angle
+from .angular_spectrum_method import asm_transfer_function_terms, asm_bandlimited_terms
+from .angular_spectrum_method import asm_fft2d, asm_angular_spectrum, asm_propagate_spectrum
+from .psf_compute import sensor_window_active
+from .detectorResampling import sensorMeasurement_intensity_phase, sensorMeasurement_intensity_phase_radialData
+
+# Engines for which the propagation to every plane of a focal stack shares the input spectrum and the output grid
+focalStackEngines = ["ASM_fourier", "ASM_bandlimited", "ASM_scaled"]
+
+
+def focal_stack_terms(parameters, distances_m):
+    """Computes the static terms used by focal_stack_propagation(): the padded grid, the transfer functions of all
+    planes stacked along a leading axis, and the output transform terms.
+
+    Args:
+        `parameters` (prop_params): Settings object defining the calculation grid (single wavelength).
+            parameters["sensor_distance_m"] is not used.
+        `distances_m` (list): Distances of the output planes from the input plane, in units of m.
+
+    Raises:
+        ValueError: The diffraction engine must be one of focalStackEngines.
+
+    Returns:
+        `tf.float`: Padded x-coordinate grid, of shape (Ny_padded, Nx_padded) or (1, Nr_padded).
+        `tf.complex`: Transfer functions, of shape (num_planes, 1, Ny_padded, Nx_padded) or 
+            (num_planes, 1, 1, Nr_padded) (for radial_symmetry with "fht", on the log-spaced frequency grid).
+        `dict` or `tf.float`: Output transform terms of the band-limited engines (see asm_bandlimited_terms), or None.
+    """
+    diffractionEngine = parameters["diffractionEngine"]
+    if diffractionEngine not in focalStackEngines:
+        raise ValueError("focal stack propagation requires one of the engines " + ", ".join(focalStackEngines))
+
+    wavelength_m = parameters["wavelength_m"]
+    calc_samplesN = parameters["calc_samplesN"]
+    calc_ms_dx_m = parameters["calc_ms_dx_m"]
+    dtype = parameters["dtype"]
+    radial_symmetry = parameters["radial_symmetry"]
+    cell_size_m = cell_aperture_size(parameters)
+
+    transfer_functions = []
+    output_terms = None
+    for distance_m in distances_m:
+        if diffractionEngine == "ASM_fourier":
+            x, H = asm_transfer_function_terms(
+                wavelength_m,
+                distance_m,
+                calc_ms_dx_m,
+                calc_samplesN,
+                dtype,
+                radial_symmetry,
+                hankel_method=parameters["hankel_method"],
+                cell_size_m=cell_size_m,
+            )
+        else:
+            # The output transform terms do not depend on the distance
+            x, H, output_terms = asm_bandlimited_terms(
+                wavelength_m,
+                distance_m,
+                calc_ms_dx_m,
+                calc_samplesN,
+                parameters["calc_sensor_dx_m"],
+                dtype,
+                radial_symmetry,
+                parameters["padasm_half"],
+                parameters["hankel_method"],
+                parameters["calc_sensor_samplesN"],
+                cell_size_m,
+            )
+        transfer_functions.append(H)
+
+    return x, tf.stack(transfer_functions, 0), output_terms
+
+
+def focal_stack_propagation(field_amplitude, field_phase, parameters, stack_terms, plan=None, chunk_size=None):
+    """Takes a batch of field amplitudes and field phases at an input plane (of a single wavelength) and propagates the
+    field to a stack of parallel output planes with the angular spectrum method.
+
+    The field is regularized and transformed to its angular spectrum once. The transfer functions of the planes are
+    then applied as a batched product, followed by a batched inverse transform and detector measurement. If chunk_size
+    is given, the planes are processed in chunks of at most chunk_size planes, which bounds the memory of the padded
+    spectra to that of chunk_size planes. All planes share the calculation grid and the output grid defined by 
+    parameters.
+
+    Args:
+        `field_amplitude` (tf.float): Initial plane field amplitude, of shape
+            (batch_size, ms_samplesM["y"], ms_samplesM["x"]) or (batch_size, 1, ms_samplesM["r"])
+        `field_phase` (tf.float): Initial plane field phase, of shape (batch_size, ms_samplesM["y"], ms_samplesM["x"])
+            or (batch_size, 1, ms_samplesM["r"]).
+        `parameters` (prop_params): Settings object defining the calculation and output grids (single wavelength).
+        `stack_terms` (tuple): Padded grid, stacked transfer functions, and output transform terms, as returned by
+            focal_stack_terms().
+        `plan` (propagation_plan, optional): Precomputed area-overlap matrices for the detector measurement. Defaults
+            to None.
+        `chunk_size` (int, optional): Maximum number of planes propagated at once. Defaults to None (all planes).
+
+    Returns:
+        `tf.float`: Output planes field amplitude, of shape
+            (num_planes, batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"]) or
+            (num_planes, batch_size, 1, sensor_pixel_number["r"]).
+        `tf.float`: Output planes field phase, of the same shape.
+    """
+    dtype = parameters["dtype"]
+    radial_symmetry = parameters["radial_symmetry"]
+    hankel_method = parameters["hankel_method"]
+    calc_samplesN = parameters["calc_samplesN"]
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+    x, transfer_functions, output_terms = stack_terms
+
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
+    field = tf.complex(tf.cast(field_amplitude, dtype), TF_ZERO) * tf.exp(
+        tf.complex(TF_ZERO, tf.cast(field_phase, dtype))
+    )
+    field = regularize_ms_calc_complex(field, parameters)
+
+    ### Zero-pad the field as in the single plane propagators
+    fourier_2d = parameters["diffractionEngine"] == "ASM_fourier" and not radial_symmetry
+    if parameters["diffractionEngine"] == "ASM_fourier":
+        padhalf = {"x": calc_samplesN["x"], "y": calc_samplesN["y"]}
+        output_pixel_number = calc_samplesN
+    else:
+        padhalf = parameters["padasm_half"]
+        output_pixel_number = calc_sensor_samplesN
+    if radial_symmetry:
+        paddings = [[0, 0], [0, 0], [0, padhalf["x"]]]
+    else:
+        paddings = [[0, 0], [padhalf["y"], padhalf["y"]], [padhalf["x"], padhalf["x"]]]
+
+    ### Get the angular decomposition of the input field (once for all planes). The 2D ASM_fourier stack is instead
+    # propagated by asm_fft2d, which shares the input spectrum over the planes of each chunk and has an adjoint gradient
+    if not fourier_2d:
+        angular_spectrum, spectrum_grid = asm_angular_spectrum(
+            tf.pad(field, paddings, mode="CONSTANT", constant_values=0),
+            x,
+            parameters["calc_ms_dx_m"],
+            radial_symmetry,
+            hankel_method,
+        )
+
+    num_planes = transfer_functions.shape[0]
+    num_fields = field.shape[0]
+    chunk_size = num_planes if chunk_size is None else chunk_size
+    hold_ampl = []
+    hold_phase = []
+    for start in range(0, num_planes, chunk_size):
+        chunk_transfer_functions = transfer_functions[start : start + chunk_size]
+
+        ### Apply the transfer function of each plane and inverse transform; the planes are returned on a leading axis
+        if fourier_2d:
+            chunk_field = asm_fft2d(field, chunk_transfer_functions, paddings, calc_samplesN)
+        else:
+            chunk_field = asm_propagate_spectrum(
+                angular_spectrum,
+                spectrum_grid,
+                chunk_transfer_functions,
+                x,
+                padhalf,
+                calc_samplesN,
+                output_pixel_number,
+                radial_symmetry,
+                hankel_method,
+                output_terms,
+            )
+        num_chunk_planes = chunk_transfer_functions.shape[0]
+        chunk_field = tf.reshape(chunk_field, [num_chunk_planes * num_fields] + chunk_field.shape.as_list()[2:])
+
+        ### Crop to the window of the output grid
+        if output_terms is None and sensor_window_active(parameters):
+            chunk_field = radial_conditional_resize_with_crop_or_pad(chunk_field, radial_symmetry, calc_sensor_samplesN)
+
+        ### Measure the planes of the chunk on the output grid
+        field_amplitude = tf.math.abs(chunk_field)
+        field_phase = safe_angle(chunk_field)
+        if radial_symmetry:
+            field_amplitude, field_phase = sensorMeasurement_intensity_phase_radialData(
+                field_amplitude, field_phase, parameters, plan
+            )
+        else:
+            field_amplitude, field_phase = sensorMeasurement_intensity_phase(
+                field_amplitude, field_phase, parameters, plan
+            )
+
+        output_shape = [num_chunk_planes, num_fields] + field_amplitude.shape[1:].as_list()
+        hold_ampl.append(tf.reshape(field_amplitude, output_shape))
+        hold_phase.append(tf.reshape(field_phase, output_shape))
+
+    return tf.concat(hold_ampl, 0), tf.concat(hold_phase, 0)
@@ -1,6 +1,9 @@
 import tensorflow as tf
 import numpy as np
-from .hankel import qdht, tf_generalSpline_regular1DGrid
+from .hankel import fht, fht_radial_grid, qdht, tf_generalSpline_regular1DGrid, safe_angle
+from .hankel import quadrature_hankel_matrix, quadrature_hankel
+from .czt import czt_terms, czt2d
+from .calc_ms_regularizer import cell_aperture_spectrum
 
 
 def fresnel_diffraction_fft(
@@ -14,11 +17,13 @@ def fresnel_diffraction_fft(
     dtype,
     radial_symmetry,
     optArg=0,
+    plan=None,
+    hankel_method="qdht",
 ):
     """Uses the single-Fourier transform implementation of the Fresnel diffraction equation to propagate fields. 
     
     The complex coefficients in the formulation are excluded here but can be added by appropriately calling
-    fresnel_diffraction_coeffs().
+    fresnel_diffraction_coeffs(). This is the amplitude and phase interface to fresnel_diffraction_fft_complex().
 
     Args:
         `wavefront_ampl` (tf.float): Starting field amplitude, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
@@ -29,44 +34,89 @@ def fresnel_diffraction_fft(
         `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}. 
         `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
         `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
-        `dtype` (tf.dtype): Datatype for the calculation. Only tf.float64 is currently allowed
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
         `radial_symmetry` (bool): Flag indicating if radial symmetry is used. 
         `optArg` (int, optional): Unused for this call.
+        `plan` (propagation_plan, optional): Precomputed input grid and quadratic phase for this geometry. If None,
+            the static terms are computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
     Returns:
-        `tf.float64`: Field amplitude at the output plane grid, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+        `tf.float`: Field amplitude at the output plane grid, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
             or (batch_size, 1, input_pixel_number['r']).
-        `tf.float64`: Field phase at the output plane grid (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+        `tf.float`: Field phase at the output plane grid (batch_size, input_pixel_number['y'], input_pixel_number['x'])
             or (batch_size, 1, input_pixel_number['r'])
     """
-
-    # create the coordinate grid at the input
-    if radial_symmetry:
-        input_pixel_x, input_pixel_y = tf.meshgrid(
-            tf.range(input_pixel_number["r"], dtype=dtype), tf.range(1, dtype=dtype),
-        )
-    else:
-        input_pixel_x, input_pixel_y = tf.meshgrid(
-            tf.range(input_pixel_number["x"], dtype=dtype), tf.range(input_pixel_number["y"], dtype=dtype),
-        )
-        input_pixel_x = input_pixel_x - (input_pixel_x.shape[1] - 1) / 2
-        input_pixel_y = input_pixel_y - (input_pixel_y.shape[0] - 1) / 2
-    input_pixel_x = input_pixel_x * input_pixel_size_m["x"]
-    input_pixel_y = input_pixel_y * input_pixel_size_m["y"]
-
-    # fourier transform approximation of fresnel diffraction
     TF_ZERO = tf.constant(0.0, dtype=dtype)
-    angular_wave_number = 2 * np.pi / wavelength_m
-    quadratic_term = angular_wave_number / 2 / distance_m * (input_pixel_x ** 2 + input_pixel_y ** 2)
+    wavefront = tf.complex(wavefront_ampl, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, wavefront_phase))
 
-    fourier_transform_trans = wavefront_ampl
-    fourier_transform_phase = wavefront_phase + tf.expand_dims(quadratic_term, 0)
-    fourier_transform_term = tf.complex(fourier_transform_trans, TF_ZERO) * tf.exp(
-        tf.complex(TF_ZERO, fourier_transform_phase)
+    wavefront_outPlane = fresnel_diffraction_fft_complex(
+        wavefront,
+        wavelength_m,
+        distance_m,
+        input_pixel_size_m,
+        input_pixel_number,
+        output_pixel_size_m,
+        dtype,
+        radial_symmetry,
+        optArg,
+        plan,
+        hankel_method,
     )
 
+    return tf.abs(wavefront_outPlane), safe_angle(wavefront_outPlane)
+
+
+def fresnel_diffraction_fft_complex(
+    wavefront,
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    optArg=0,
+    plan=None,
+    hankel_method="qdht",
+):
+    """Complex field implementation of fresnel_diffraction_fft(), taking and returning the field as a single complex 
+    tensor so that no amplitude/phase conversions are made between the stages of a calculation.
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+            or (batch_size, 1, input_pixel_number['r']).
+        `wavelength_m` (tf.float): Tf constant defining the wavelength of light for the calculation, in units of m
+        `distance_m` (tf.float): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}. 
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used. 
+        `optArg` (int, optional): Unused for this call.
+        `plan` (propagation_plan, optional): Precomputed input grid and quadratic phase for this geometry. If None,
+            the static terms are computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Hankel transform used when radial_symmetry is True, either "qdht" or "fht".
+            Defaults to "qdht".
+    Returns:
+        `tf.complex`: Complex field at the output plane grid (excluding the complex coefficients), of shape 
+            (batch_size, input_pixel_number['y'], input_pixel_number['x']) or (batch_size, 1, input_pixel_number['r']).
+    """
+
+    # create the coordinate grid at the input and the quadratic phase (or reuse the precomputed terms)
+    TF_ZERO = tf.constant(0.0, dtype=dtype)
+    if plan is None:
+        input_pixel_x, quadratic_term = fresnel_input_terms(
+            wavelength_m, distance_m, input_pixel_size_m, input_pixel_number, dtype, radial_symmetry
+        )
+        quadratic_chirp = tf.exp(tf.complex(TF_ZERO, quadratic_term))
+    else:
+        input_pixel_x, quadratic_chirp = plan.fresnel_input_x, plan.fresnel_input_chirp
+
     # If radialy symmetric input, then use the hankel transform otherwise use 2D DFT
     if radial_symmetry:
-        kr, wavefront_outPlane = qdht(tf.squeeze(input_pixel_x), fourier_transform_term)
+        # fourier transform approximation of fresnel diffraction
+        fourier_transform_term = wavefront * quadratic_chirp
         normterm = tf.complex(
             tf.math.sqrt(
                 tf.cast(
@@ -86,7 +136,12 @@ def fresnel_diffraction_fft(
         ang_fx = tf.range(
             0, 1 / 2 / input_pixel_size_m["x"], 1 / input_pixel_size_m["x"] / input_pixel_number["x"], dtype=dtype
         )
-        wavefront_outPlane = tf_generalSpline_regular1DGrid(kr / 2 / np.pi, ang_fx, wavefront_outPlane) * normterm
+        if hankel_method == "fht":
+            fht_grid = fht_radial_grid(input_pixel_number["r"], input_pixel_size_m["x"])
+            wavefront_outPlane = fht(fourier_transform_term, 2 * np.pi * ang_fx, *fht_grid) * normterm
+        else:
+            kr, wavefront_outPlane = qdht(tf.squeeze(input_pixel_x), fourier_transform_term)
+            wavefront_outPlane = tf_generalSpline_regular1DGrid(kr / 2 / np.pi, ang_fx, wavefront_outPlane) * normterm
     else:
         normterm = tf.complex(
             tf.math.sqrt(
@@ -102,11 +157,185 @@ def fresnel_diffraction_fft(
             ),
             TF_ZERO,
         )
-        wavefront_outPlane = (
-            tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(fourier_transform_term))) * normterm
+        wavefront_outPlane = fresnel_fft2d(wavefront, quadratic_chirp, normterm)
+
+    return wavefront_outPlane
+
+
+def fresnel_fft2d(wavefront, quadratic_chirp, normterm):
+    """Applies the quadratic phase, the centered 2D DFT, and the normalization of the fresnel transform, with a 
+    hand-written gradient.
+
+    The transform is linear in the wavefront so its gradient is the adjoint propagation: the inverse DFT of the 
+    upstream gradient multiplied by the conjugate chirp. Only the chirp is held for the backward pass, rather than the
+    intermediate tensors recorded by autodiff. No gradient is returned for the chirp and normalization terms.
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x']).
+        `quadratic_chirp` (tf.complex): Quadratic phase factor, of shape (1, input_pixel_number['y'], input_pixel_number['x']).
+        `normterm` (tf.complex): Real-valued normalization factor.
+
+    Returns:
+        `tf.complex`: Transformed field, the same shape as wavefront.
+    """
+    num_points = tf.cast(tf.reduce_prod(tf.shape(wavefront)[-2:]), wavefront.dtype.real_dtype)
+    adjoint_norm = normterm * tf.complex(num_points, tf.zeros_like(num_points))
+
+    @tf.custom_gradient
+    def transform(wavefront):
+        fourier_transform_term = wavefront * quadratic_chirp
+        wavefront_outPlane = tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(fourier_transform_term))) * normterm
+
+        def grad(upstream):
+            upstream = tf.signal.fftshift(tf.signal.ifft2d(tf.signal.ifftshift(upstream))) * adjoint_norm
+            return upstream * tf.math.conj(quadratic_chirp)
+
+        return wavefront_outPlane, grad
+
+    return transform(wavefront)
+
+
+def fresnel_diffraction_czt_complex(
+    wavefront,
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    optArg=0,
+    plan=None,
+    hankel_method="qdht",
+    output_pixel_number=None,
+):
+    """Chirp-z transform implementation of the single-Fourier transform Fresnel diffraction integral.
+
+    Unlike fresnel_diffraction_fft_complex(), the output grid pitch is not tied to the input grid by the DFT; the
+    integral is evaluated directly on a centred output grid with pitch output_pixel_size_m and output_pixel_number 
+    samples (by default, the same number as the input). With the DFT pitch and fewer output samples, this is a pruned 
+    DFT evaluating only a window of the fresnel_diffraction_fft_complex() output. The transform is applied separably along x and y as a chirp-z (Bluestein) transform, which
+    requires FFTs of no more than twice the grid length. For radially symmetric inputs, the Hankel transform is
+    evaluated by direct quadrature. The complex coefficients in the formulation are excluded here but can be added by
+    calling fresnel_diffraction_coeffs_complex().
+
+    Args:
+        `wavefront` (tf.complex): Starting complex field, of shape (batch_size, input_pixel_number['y'], input_pixel_number['x'])
+            or (batch_size, 1, input_pixel_number['r']).
+        `wavelength_m` (tf.float): Tf constant defining the wavelength of light for the calculation, in units of m
+        `distance_m` (tf.float): Tf constant defining the distance between the starting plane and the propagated plane, in units of m
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+        `dtype` (tf.dtype): Datatype for the calculation, either tf.float64 or tf.float32.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `optArg` (int, optional): Unused for this call.
+        `plan` (propagation_plan, optional): Precomputed quadratic phase and chirp-z transform terms for this geometry.
+            If None, the static terms are computed on the fly. Defaults to None.
+        `hankel_method` (str, optional): Unused for this call.
+        `output_pixel_number` (dict, optional): Propagated field grid size, in terms of number of pixels, via 
+            dictionary {"x": int, "y": int, "r": int}. If None, the input grid size is used. Defaults to None.
+    Returns:
+        `tf.complex`: Complex field at the output plane grid (excluding the complex coefficients), of shape
+            (batch_size, output_pixel_number['y'], output_pixel_number['x']) or (batch_size, 1, output_pixel_number['r']).
+    """
+
+    # create the quadratic phase and the transform terms (or reuse the precomputed terms)
+    if plan is None:
+        TF_ZERO = tf.constant(0.0, dtype=dtype)
+        _, quadratic_term = fresnel_input_terms(
+            wavelength_m, distance_m, input_pixel_size_m, input_pixel_number, dtype, radial_symmetry
+        )
+        quadratic_chirp = tf.exp(tf.complex(TF_ZERO, quadratic_term))
+        transform_terms = fresnel_czt_terms(
+            wavelength_m,
+            distance_m,
+            input_pixel_size_m,
+            input_pixel_number,
+            output_pixel_size_m,
+            dtype,
+            radial_symmetry,
+            output_pixel_number,
         )
+    else:
+        quadratic_chirp, transform_terms = plan.fresnel_input_chirp, plan.fresnel_czt_terms
+
+    # fourier transform approximation of fresnel diffraction, evaluated directly on the output grid
+    fourier_transform_term = wavefront * quadratic_chirp
+    if radial_symmetry:
+        wavefront_outPlane = quadrature_hankel(fourier_transform_term, transform_terms["r"])
+    else:
+        wavefront_outPlane = czt2d(fourier_transform_term, transform_terms["x"], transform_terms["y"])
+
+    return wavefront_outPlane
 
-    return tf.abs(wavefront_outPlane), tf.math.angle(wavefront_outPlane)
+
+def fresnel_czt_terms(
+    wavelength_m,
+    distance_m,
+    input_pixel_size_m,
+    input_pixel_number,
+    output_pixel_size_m,
+    dtype,
+    radial_symmetry,
+    output_pixel_number=None,
+):
+    """Computes the static transform terms used by fresnel_diffraction_czt_complex(). The normalization matches that of
+    fresnel_diffraction_fft_complex(), i.e. the 2D integral is scaled by the input pixel area over wavelength * distance.
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `output_pixel_size_m` (dict): Propagated field grid discretization/pitch, in units of m, via dictionary {"x": float, "y":float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+        `output_pixel_number` (dict, optional): Propagated field grid size, in terms of number of pixels, via 
+            dictionary {"x": int, "y": int, "r": int}. If None, the input grid size is used. Defaults to None.
+
+    Returns:
+        `dict`: Chirp-z transform terms along "x" and "y" (see czt_terms), or the quadrature Hankel transform matrix "r"
+            if radial_symmetry is True.
+    """
+    wavelength_m = float(wavelength_m)
+    distance_m = float(distance_m)
+    scale = 2 * np.pi / wavelength_m / distance_m
+    if output_pixel_number is None:
+        output_pixel_number = input_pixel_number
+
+    if radial_symmetry:
+        return {
+            "r": quadrature_hankel_matrix(
+                int(input_pixel_number["r"]),
+                float(input_pixel_size_m["x"]),
+                int(output_pixel_number["r"]),
+                float(output_pixel_size_m["x"]),
+                scale,
+                dtype,
+            )
+            / (wavelength_m * distance_m)
+        }
+
+    transform_terms = {}
+    for dim in ["x", "y"]:
+        number = int(input_pixel_number[dim])
+        output_number = int(output_pixel_number[dim])
+        input_dx = float(input_pixel_size_m[dim])
+        output_dx = float(output_pixel_size_m[dim])
+        transform_terms[dim] = czt_terms(
+            -(number - 1) / 2 * input_dx,
+            input_dx,
+            number,
+            -(output_number - 1) / 2 * output_dx,
+            output_dx,
+            output_number,
+            scale,
+            input_dx / np.sqrt(wavelength_m * distance_m),
+            dtype,
+        )
+
+    return transform_terms
 
 
 def fresnel_diffraction_coeffs(
@@ -118,6 +347,7 @@ def fresnel_diffraction_coeffs(
     output_pixel_number,
     dtype,
     radial_symmetry,
+    plan=None,
 ):
     """Adds the complex coefficient terms in the Fresnel diffraction integral formulation to the out-plane wavefront,
     computed by fresnel_diffraction_fft().
@@ -131,28 +361,149 @@ def fresnel_diffraction_coeffs(
             (batch_size, 1, output_pixel_number["r"]).
         `wavelength_m` (tf.float): tf constant corresponding to the wavelength of the field 
             (should match that used in the fresnel_diffraction call)
-        `distance_m` (tf.float64): tf constant corresponding to the distance propagated 
+        `distance_m` (tf.float): tf constant corresponding to the distance propagated 
             (should match that used in the fresnel_diffraction call)
         `output_pixel_size_m` (dict): Output field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
         `output_pixel_number` (dict): Output field grid length in terms of number of pixels, via dictionary {"x": float, "y": float}.
-        `dtype` (tf.dtype): Datatype to be used in the tensorflow calculation; Only tf.float64 is currently supported.
+        `dtype` (tf.dtype): Datatype to be used in the tensorflow calculation, either tf.float64 or tf.float32.
         `radial_symmetry` (bool): Flag indicating if radial symmetry is used. 
+        `plan` (propagation_plan, optional): Precomputed output-plane phase for this geometry. If None, the phase is 
+            computed on the fly. Defaults to None.
         
     Returns:
-        `tf.float64`: Field amplitude at the output plane with the complex coefficients added in. same shape as input.
-        `tf.float64`: Field phase at the output plane with the compelx coefficients added in. same shape as input.
+        `tf.float`: Field amplitude at the output plane with the complex coefficients added in. same shape as input.
+        `tf.float`: Field phase at the output plane with the compelx coefficients added in. same shape as input.
     """
 
     TF_ZERO = tf.constant(0.0, dtype=dtype)
+    wavefront = tf.complex(out_wavefront_ampl, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, out_wavefront_phase))
+
+    wavefront = fresnel_diffraction_coeffs_complex(
+        wavefront, wavelength_m, distance_m, output_pixel_size_m, output_pixel_number, dtype, radial_symmetry, plan
+    )
+
+    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+
+
+def fresnel_diffraction_coeffs_complex(
+    out_wavefront,
+    wavelength_m,
+    distance_m,
+    output_pixel_size_m,
+    output_pixel_number,
+    dtype,
+    radial_symmetry,
+    plan=None,
+    cell_size_m=None,
+):
+    """Complex field implementation of fresnel_diffraction_coeffs(), adding the complex coefficient terms to the 
+    out-plane wavefront computed by fresnel_diffraction_fft_complex().
+
+    Args:
+        `out_wavefront` (tf.complex): Complex field at the output plane, excluding complex coeffs, of shape
+            (batch_size, output_pixel_number["x"], output_pixel_number["y"]) or (batch_size, 1, output_pixel_number["r"]).
+        `wavelength_m` (tf.float): tf constant corresponding to the wavelength of the field 
+            (should match that used in the fresnel_diffraction call)
+        `distance_m` (tf.float): tf constant corresponding to the distance propagated 
+            (should match that used in the fresnel_diffraction call)
+        `output_pixel_size_m` (dict): Output field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `output_pixel_number` (dict): Output field grid length in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `dtype` (tf.dtype): Datatype to be used in the tensorflow calculation, either tf.float64 or tf.float32.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used. 
+        `plan` (propagation_plan, optional): Precomputed output-plane phase for this geometry. If None, the phase is 
+            computed on the fly. Defaults to None.
+        `cell_size_m` (dict, optional): If given, the input samples are the cells of a piecewise-constant field of 
+            this size (via {"x": float, "y": float}) and the cell aperture is applied at the output plane. Only used 
+            when the plan is None (a plan includes it already). Defaults to None.
+        
+    Returns:
+        `tf.complex`: Complex field at the output plane with the complex coefficients added in. same shape as input.
+    """
+
+    # create the output plane phase (or reuse the precomputed term)
+    if plan is None:
+        TF_ZERO = tf.constant(0.0, dtype=dtype)
+        output_phase = fresnel_output_phase(
+            wavelength_m, distance_m, output_pixel_size_m, output_pixel_number, dtype, radial_symmetry
+        )
+        output_chirp = tf.exp(tf.complex(TF_ZERO, output_phase))
+        if cell_size_m is not None and not radial_symmetry:
+            output_chirp = output_chirp * fresnel_cell_aperture(
+                wavelength_m, distance_m, output_pixel_size_m, output_pixel_number, cell_size_m, dtype
+            )
+    else:
+        output_chirp = plan.fresnel_output_chirp
 
-    # create the output plane coordinate grid
+    # add the final terms
+    ### Neglect the power term, 1/i/lambda/z since we want psf normalized by energy at the end
+    # wavefront = (
+    #     tf.complex(wavefront_trans, TF_ZERO)
+    #     * tf.complex(TF_ZERO, tf.cast(1.0 / wavelength_m / distance_m, dtype))
+    #     * tf.exp(tf.complex(TF_ZERO, wavefront_phase + angular_wave_number * quadterm))
+    # )
+    return out_wavefront * output_chirp
+
+
+def fresnel_input_terms(wavelength_m, distance_m, input_pixel_size_m, input_pixel_number, dtype, radial_symmetry):
+    """Computes the static input-plane terms used by fresnel_diffraction_fft(): the input x-coordinate grid and the 
+    quadratic phase applied before the Fourier transform.
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `input_pixel_size_m` (dict): Starting field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `input_pixel_number` (dict): Starting field grid size, in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+
+    Returns:
+        `tf.float`: Input x-coordinate grid, of shape (input_pixel_number['y'], input_pixel_number['x']) or (1, input_pixel_number['r']).
+        `tf.float`: Quadratic phase term, of shape (1, input_pixel_number['y'], input_pixel_number['x']) or (1, 1, input_pixel_number['r']).
+    """
+    if radial_symmetry:
+        input_pixel_x, input_pixel_y = tf.meshgrid(
+            tf.range(input_pixel_number["r"], dtype=tf.float64), tf.range(1, dtype=tf.float64),
+        )
+    else:
+        input_pixel_x, input_pixel_y = tf.meshgrid(
+            tf.range(input_pixel_number["x"], dtype=tf.float64), tf.range(input_pixel_number["y"], dtype=tf.float64),
+        )
+        input_pixel_x = input_pixel_x - (input_pixel_x.shape[1] - 1) / 2
+        input_pixel_y = input_pixel_y - (input_pixel_y.shape[0] - 1) / 2
+    input_pixel_x = input_pixel_x * input_pixel_size_m["x"]
+    input_pixel_y = input_pixel_y * input_pixel_size_m["y"]
+
+    angular_wave_number = 2 * np.pi / wavelength_m
+    quadratic_term = angular_wave_number / 2 / distance_m * (input_pixel_x ** 2 + input_pixel_y ** 2)
+
+    # The grid and phase are always evaluated in double precision then wrapped to [0, 2pi) before casting to the
+    # calculation dtype, so that single-precision calculations do not inherit the rounding of the large phase values
+    quadratic_term = tf.math.floormod(quadratic_term, 2 * np.pi)
+
+    return tf.cast(input_pixel_x, dtype), tf.cast(tf.expand_dims(quadratic_term, 0), dtype)
+
+
+def fresnel_output_phase(wavelength_m, distance_m, output_pixel_size_m, output_pixel_number, dtype, radial_symmetry):
+    """Computes the static output-plane phase added by fresnel_diffraction_coeffs().
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `output_pixel_size_m` (dict): Output field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `output_pixel_number` (dict): Output field grid length in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+        `radial_symmetry` (bool): Flag indicating if radial symmetry is used.
+
+    Returns:
+        `tf.float`: Output-plane phase, of shape (1, output_pixel_number["y"], output_pixel_number["x"]) or (1, 1, output_pixel_number["r"]).
+    """
     if radial_symmetry:
         output_pixel_x, output_pixel_y = tf.meshgrid(
-            tf.range(output_pixel_number["r"], dtype=dtype), tf.range(1, dtype=dtype),
+            tf.range(output_pixel_number["r"], dtype=tf.float64), tf.range(1, dtype=tf.float64),
         )
     else:
         output_pixel_x, output_pixel_y = tf.meshgrid(
-            tf.range(output_pixel_number["x"], dtype=dtype), tf.range(output_pixel_number["y"], dtype=dtype),
+            tf.range(output_pixel_number["x"], dtype=tf.float64), tf.range(output_pixel_number["y"], dtype=tf.float64),
         )
         output_pixel_x = output_pixel_x - (tf.shape(output_pixel_x)[1] - 1) / 2
         output_pixel_y = output_pixel_y - (tf.shape(output_pixel_y)[0] - 1) / 2
@@ -161,18 +512,36 @@ def fresnel_diffraction_coeffs(
     output_pixel_x = tf.expand_dims(output_pixel_x, 0)
     output_pixel_y = tf.expand_dims(output_pixel_y, 0)
 
-    # add the final terms
     angular_wave_number = 2 * np.pi / wavelength_m
     quadterm = distance_m + (output_pixel_x ** 2 + output_pixel_y ** 2) / 2 / distance_m
-    ### Neglect the power term, 1/i/lambda/z since we want psf normalized by energy at the end
-    # wavefront = (
-    #     tf.complex(wavefront_trans, TF_ZERO)
-    #     * tf.complex(TF_ZERO, tf.cast(1.0 / wavelength_m / distance_m, dtype))
-    #     * tf.exp(tf.complex(TF_ZERO, wavefront_phase + angular_wave_number * quadterm))
-    # )
-    wavefront = tf.complex(out_wavefront_ampl, TF_ZERO) * tf.exp(
-        tf.complex(TF_ZERO, out_wavefront_phase + angular_wave_number * quadterm)
-    )
 
-    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+    # As in fresnel_input_terms, the phase (which includes the large k*z piston) is wrapped in double precision
+    output_phase = tf.math.floormod(angular_wave_number * quadterm, 2 * np.pi)
+
+    return tf.cast(output_phase, dtype)
+
+
+def fresnel_cell_aperture(wavelength_m, distance_m, output_pixel_size_m, output_pixel_number, cell_size_m, dtype):
+    """Computes the cell aperture term of the fresnel propagation of a piecewise-constant (not upsampled) field. 
+
+    In the fresnel approximation, the output point x' samples the input spectrum at the frequency x'/(wavelength z), 
+    where the spectrum of a field that is constant over each cell carries the cell aperture (sinc) envelope.
+
+    Args:
+        `wavelength_m` (tf.float): Wavelength of light for the calculation, in units of m.
+        `distance_m` (tf.float): Distance between the starting plane and the propagated plane, in units of m.
+        `output_pixel_size_m` (dict): Output field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
+        `output_pixel_number` (dict): Output field grid length in terms of number of pixels, via dictionary {"x": float, "y": float}.
+        `cell_size_m` (dict): Cell size in units of m, via {"x": float, "y": float}.
+        `dtype` (tf.dtype): Datatype for the calculation.
+
+    Returns:
+        `tf.complex`: Cell aperture term, of shape (1, output_pixel_number["y"], output_pixel_number["x"]).
+    """
+    complex_dtype = tf.complex64 if dtype == tf.float32 else tf.complex128
+    freq = {}
+    for dim in ["x", "y"]:
+        output_pixel = np.arange(output_pixel_number[dim]) - (output_pixel_number[dim] - 1) / 2
+        freq[dim] = output_pixel * output_pixel_size_m[dim] / float(wavelength_m) / float(distance_m)
 
+    return tf.constant(cell_aperture_spectrum(freq["x"], freq["y"], cell_size_m)[None], dtype=complex_dtype)
@@ -1,6 +1,9 @@
+import numpy as np
 import tensorflow as tf
 from .hankel import qdht, radial_2d_transform, radial_2d_transform_wrapped_phase, radial_2d_transform_complex
 from .psf_compute import psf_sensor_LTI
+from .calc_ms_regularizer import regularize_ms_calc_complex
+from .czt import fast_fft_length
 
 
 def otf_sensor(
@@ -24,6 +27,8 @@ def otf_sensor(
     """
 
     radial_symmetry = parameters["radial_symmetry"]
+    dtype = parameters["dtype"]
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
 
     # First get the coherent LTI PSF on the sensor grid
     # OTF is defined by the psf intensity and does not require phase
@@ -32,23 +37,23 @@ def otf_sensor(
         ms_modulation_trans,
         ms_modulation_phase,
         parameters,
-        tf.constant(1.0, dtype=tf.float64),
+        tf.constant(1.0, dtype=dtype),
         addCoeffs=False,
+        convert_2D=False,
     )
-    psf_intensity = tf.complex(psf_intensity, tf.cast(0.0, dtype=tf.float64))
+    psf_intensity = tf.complex(psf_intensity, TF_ZERO)
 
     # Take the fourier transform using Hankel or 2D-fft
     if radial_symmetry:
         calc_samplesN = parameters["calc_samplesN"]
         calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
-        dtype = parameters["dtype"]
         sensor_r = tf.range(0, calc_samplesN["r"], dtype=dtype) * calc_sensor_dx_m["x"]
         kr, OTF = qdht(sensor_r, psf_intensity)
     else:
         OTF = tf.signal.fftshift(tf.signal.fft2d(tf.signal.ifftshift(psf_intensity)))
 
     # Apply the standard OTF center normalization convention
-    normby = tf.complex(tf.math.reduce_max(tf.math.abs(OTF), axis=[1, 2]), tf.cast(0.0, dtype=tf.float64))
+    normby = tf.complex(tf.math.reduce_max(tf.math.abs(OTF), axis=[1, 2]), TF_ZERO)
     OTF = OTF / tf.expand_dims(tf.expand_dims(normby, -1), -1)
 
     # After calculation is done, if radial symmetry was used, convert back to 2D
@@ -97,8 +102,9 @@ def atf_sensor(
         parameters,
         tf.constant(1.0, dtype=dtype),
         addCoeffs=True,
+        convert_2D=False,
     )
-    psf = tf.complex(tf.math.sqrt(psf_intensity, TF_ZERO)) * tf.exp(tf.complex(TF_ZERO, psf_phase))
+    psf = tf.complex(tf.math.sqrt(psf_intensity), TF_ZERO) * tf.exp(tf.complex(TF_ZERO, psf_phase))
 
     # Fourier transform of the complex PSF
     if radial_symmetry:
@@ -115,3 +121,281 @@ def atf_sensor(
 
     return tf.math.abs(ATF), tf.math.angle(ATF)
 
+
+
+def otf_slice_frequencies(max_frequency, num_samples, angle_rad=0.0):
+    """Returns sensor-plane frequency samples along a line through the origin, e.g. for an MTF slice.
+
+    Args:
+        `max_frequency` (float): Largest frequency of the slice in cycles per m, e.g. the detector nyquist frequency
+            1 / (2 * sensor_pixel_size_m["x"]).
+        `num_samples` (int): Number of uniformly spaced samples from zero to max_frequency.
+        `angle_rad` (float, optional): Orientation of the slice, measured from the x-axis. Defaults to 0.0.
+
+    Returns:
+        `dict`: Frequency samples via dictionary {"x": np.float, "y": np.float}, each of shape (num_samples,).
+    """
+    frequency = np.linspace(0.0, max_frequency, num_samples)
+
+    return {"x": frequency * np.cos(angle_rad), "y": frequency * np.sin(angle_rad)}
+
+
+def lti_pupil_functions(point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters):
+    """Returns the generalized pupil functions of the linear, translationally invariant (paraxial) imaging model: the
+    upsampled/padded metasurface modulation multiplied by the quadratic wavefront of each on-axis point-source and by
+    the quadratic phase of the fresnel transform to the sensor plane. The PSF intensity is the squared magnitude of the
+    fourier transform of the pupil function, so the OTF is its (normalized) autocorrelation.
+
+    Args:
+        `point_source_locs` (tf.float): Set of point-source coordinates of shape (N,3); only the depths are used.
+        `ms_modulation_trans` (tf.float): Metasurface transmittance profile(s) of shape
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `ms_modulation_phase` (tf.float): Metasurface phase profile(s) of shape
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `parameters` (prop_param):  Settings object defining field propagation details.
+
+    Returns:
+        `tf.complex`: Upsampled and padded metasurface modulation of shape (profile_batch, calc_samplesN['y'],
+            calc_samplesN['x']); radial profiles are converted to 2D.
+        `tf.complex`: Quadratic phase factors of shape (N, calc_samplesN['y'], calc_samplesN['x']); the pupil function
+            of each profile and point-source is the product of the two.
+    """
+    dtype = parameters["dtype"]
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
+    wavelength_m = parameters["wavelength_m"]
+    sensor_distance_m = parameters["sensor_distance_m"]
+    calc_ms_dx_m = parameters["calc_ms_dx_m"]
+
+    ms_modulation = tf.complex(ms_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, ms_modulation_phase))
+    calc_modulation = regularize_ms_calc_complex(ms_modulation, parameters)
+    if parameters["radial_symmetry"]:
+        calc_modulation = radial_2d_transform_complex(tf.squeeze(calc_modulation, 1))
+
+    # Centered metasurface grid, as used in wavefront_pointsources_sensor_LTI
+    num_y, num_x = calc_modulation.shape[-2], calc_modulation.shape[-1]
+    calc_x = (tf.range(num_x, dtype=dtype) - (num_x - 1) / 2) * calc_ms_dx_m["x"]
+    calc_y = (tf.range(num_y, dtype=dtype) - (num_y - 1) / 2) * calc_ms_dx_m["y"]
+    radius_sq = tf.expand_dims(calc_y, 1) ** 2 + tf.expand_dims(calc_x, 0) ** 2
+
+    # The piston terms do not change the PSF intensity and are dropped
+    point_source_loc_z = tf.cast(point_source_locs[:, 2], dtype)
+    defocus = tf.reshape(1 / point_source_loc_z + 1 / sensor_distance_m, [-1, 1, 1])
+    quadratic_phase = np.pi / wavelength_m * defocus * tf.expand_dims(radius_sq, 0)
+
+    return calc_modulation, tf.exp(tf.complex(TF_ZERO, quadratic_phase))
+
+
+def otf_direct_samples(psf_intensity, sensor_x, sensor_y, frequencies):
+    """Evaluates the fourier transform of PSF intensities at a set of frequencies by direct summation, rather than by
+    transforming the full grid.
+
+    The samples are grouped by their frequency along one axis so that the summation along that axis is made once per
+    unique value; a slice along x or y thus costs a single projection of each PSF plus a 1D transform.
+
+    Args:
+        `psf_intensity` (tf.float): PSF intensities of shape (..., Ny, Nx).
+        `sensor_x` (np.float): Sensor-plane x-coordinates of the PSF samples, of shape (Nx,).
+        `sensor_y` (np.float): Sensor-plane y-coordinates of the PSF samples, of shape (Ny,).
+        `frequencies` (dict): Frequency samples in cycles per m via dictionary {"x": np.float, "y": np.float}, each of
+            shape (J,).
+
+    Returns:
+        `tf.complex`: Fourier transform of the intensities at the frequency samples, of shape (..., J).
+    """
+    frequency_x = np.asarray(frequencies["x"], dtype=np.float64)
+    frequency_y = np.asarray(frequencies["y"], dtype=np.float64)
+    if len(np.unique(frequency_y)) > len(np.unique(frequency_x)):
+        psf_intensity = tf.linalg.matrix_transpose(psf_intensity)
+        sensor_x, sensor_y = sensor_y, sensor_x
+        frequency_x, frequency_y = frequency_y, frequency_x
+
+    # The kernels are computed in double precision as the phase arguments can be large
+    complex_dtype = tf.complex128 if psf_intensity.dtype == tf.float64 else tf.complex64
+    unique_y, sample_index = np.unique(frequency_y, return_inverse=True)
+    kernel_y = tf.constant(np.exp(-2j * np.pi * unique_y[:, None] * sensor_y[None, :]), dtype=complex_dtype)
+    kernel_x = tf.constant(np.exp(-2j * np.pi * frequency_x[:, None] * sensor_x[None, :]), dtype=complex_dtype)
+
+    psf_intensity = tf.complex(psf_intensity, tf.zeros_like(psf_intensity))
+    projected = tf.einsum("uy,...yx->...ux", kernel_y, psf_intensity)
+    projected = tf.gather(projected, sample_index, axis=-2)
+
+    return tf.reduce_sum(projected * kernel_x, axis=-1)
+
+
+def otf_grid_samples(otf_half_plane, frequency_dx, frequencies):
+    """Samples a half-plane OTF grid, as returned by tf.signal.rfft2d, at a set of frequencies via bilinear
+    interpolation. Negative x-frequencies are taken from the hermitian symmetry of the OTF and frequencies beyond the
+    grid are clamped to its edge.
+
+    Args:
+        `otf_half_plane` (tf.complex): OTF of shape (..., Ny, Nx // 2 + 1), in fft order along y.
+        `frequency_dx` (dict): Frequency spacing of the grid in cycles per m, via dictionary {"x": float, "y": float}.
+        `frequencies` (dict): Frequency samples in cycles per m via dictionary {"x": np.float, "y": np.float}, each of
+            shape (J,).
+
+    Returns:
+        `tf.complex`: OTF at the frequency samples, of shape (..., J).
+    """
+    num_y, num_half_x = otf_half_plane.shape[-2], otf_half_plane.shape[-1]
+    frequency_x = np.asarray(frequencies["x"], dtype=np.float64)
+    frequency_y = np.asarray(frequencies["y"], dtype=np.float64)
+    conjugate = frequency_x < 0
+    sign = np.where(conjugate, -1.0, 1.0)
+
+    position_x = np.clip(sign * frequency_x / frequency_dx["x"], 0, num_half_x - 1)
+    position_y = sign * frequency_y / frequency_dx["y"]
+    lower_x = np.minimum(np.floor(position_x).astype(np.int64), max(num_half_x - 2, 0))
+    lower_y = np.floor(position_y).astype(np.int64)
+    fraction_x = position_x - lower_x
+    fraction_y = position_y - lower_y
+
+    otf_flat = tf.reshape(otf_half_plane, tf.concat([tf.shape(otf_half_plane)[:-2], [-1]], 0))
+    otf_samples = 0
+    for offset_y, weight_y in [(0, 1 - fraction_y), (1, fraction_y)]:
+        for offset_x, weight_x in [(0, 1 - fraction_x), (1, fraction_x)]:
+            index_x = np.minimum(lower_x + offset_x, num_half_x - 1)
+            index_y = np.mod(lower_y + offset_y, num_y)
+            corner = tf.gather(otf_flat, index_y * num_half_x + index_x, axis=-1)
+            otf_samples += corner * tf.cast(weight_y * weight_x, corner.dtype)
+
+    return tf.where(conjugate, tf.math.conj(otf_samples), otf_samples)
+
+
+def batched_otf_sensor(
+    point_source_locs,
+    ms_modulation_trans,
+    ms_modulation_phase,
+    parameters,
+    frequencies,
+    method="autocorrelation",
+    chunk_size=None,
+):
+    """Computes the optical transfer function of a batch of metasurface profiles at a set of sensor-plane frequencies,
+    for many on-axis point-source depths at once, using the linear, translationally invariant assumptions of otf_sensor.
+    Like otf_sensor, this does not take into account the finite pixel size.
+
+    The OTF is computed from the pupil functions (see lti_pupil_functions) and only returned at the requested
+    frequencies, e.g. an MTF slice (see otf_slice_frequencies):
+    - "autocorrelation": the pupil functions are zero-padded to twice their support so that the inverse transform of
+        the squared pupil spectrum is the exact, non-circular autocorrelation; it is evaluated directly at the requested
+        frequencies only.
+    - "rfft2": the PSF intensity on the unpadded calculation grid is transformed with rfft2 (as otf_sensor does with
+        the full fft) and the half-plane grid is interpolated at the requested frequencies. This is cheaper when many
+        frequencies are requested but the OTF is circularly aliased if the grid is less than twice the lens support.
+
+    Args:
+        `point_source_locs` (tf.float): Set of point-source coordinates of shape (N,3); as the model is translationally
+            invariant, only the depths are used.
+        `ms_modulation_trans` (tf.float): Metasurface transmittance profile(s) of shape
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `ms_modulation_phase` (tf.float): Metasurface phase profile(s) of shape
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `parameters` (prop_param):  Settings object defining field propagation details.
+        `frequencies` (dict): Sensor-plane frequency samples in cycles per m via dictionary {"x": np.float,
+            "y": np.float}, each of shape (J,).
+        `method` (str, optional): Either "autocorrelation" or "rfft2". Defaults to "autocorrelation".
+        `chunk_size` (int, optional): Maximum number of pupil functions (profile and point-source pairs) transformed
+            at once. Defaults to None, in which case all are transformed in a single pass.
+
+    Raises:
+        ValueError: method must be "autocorrelation" or "rfft2".
+
+    Returns:
+        `tf.complex`: OTF normalized to unity at zero frequency, of shape (profile_batch, N, J). The MTF is its
+            magnitude.
+    """
+    if method not in ["autocorrelation", "rfft2"]:
+        raise ValueError("batched_otf_sensor: method must be 'autocorrelation' or 'rfft2'")
+
+    calc_modulation, quadratic_factor = lti_pupil_functions(
+        point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters
+    )
+    num_profiles = calc_modulation.shape[0]
+    num_sources = quadratic_factor.shape[0]
+    num_y, num_x = calc_modulation.shape[-2], calc_modulation.shape[-1]
+
+    # Pupil lags of the OTF map to sensor frequencies via lag / (wavelength * distance)
+    calc_ms_dx_m = parameters["calc_ms_dx_m"]
+    lambda_distance = parameters["wavelength_m"] * parameters["sensor_distance_m"]
+    if method == "autocorrelation":
+        calc_samplesM = parameters["calc_samplesM"]
+        pad_y = max(fast_fft_length(2 * calc_samplesM["y"] - 1), num_y) - num_y
+        pad_x = max(fast_fft_length(2 * calc_samplesM["x"] - 1), num_x) - num_x
+        sensor_x = np.fft.fftfreq(num_x + pad_x) * lambda_distance / calc_ms_dx_m["x"]
+        sensor_y = np.fft.fftfreq(num_y + pad_y) * lambda_distance / calc_ms_dx_m["y"]
+    else:
+        pad_y, pad_x = 0, 0
+        frequency_dx = {"x": calc_ms_dx_m["x"] / lambda_distance, "y": calc_ms_dx_m["y"] / lambda_distance}
+
+    num_fields = num_profiles * num_sources
+    chunk_size = num_fields if chunk_size is None else chunk_size
+    otf_chunks = []
+    for start in range(0, num_fields, chunk_size):
+        field_index = np.arange(start, min(start + chunk_size, num_fields))
+        pupil = tf.gather(calc_modulation, field_index // num_sources) * tf.gather(
+            quadratic_factor, field_index % num_sources
+        )
+        pupil = tf.pad(pupil, [[0, 0], [0, pad_y], [0, pad_x]])
+
+        # PSF intensity in fft order, i.e. with the sensor origin at index zero
+        psf_intensity = tf.math.abs(tf.signal.fft2d(pupil)) ** 2
+        if method == "autocorrelation":
+            otf = otf_direct_samples(psf_intensity, sensor_x, sensor_y, frequencies)
+        else:
+            otf = otf_grid_samples(tf.signal.rfft2d(psf_intensity), frequency_dx, frequencies)
+        energy = tf.cast(tf.reduce_sum(psf_intensity, axis=[-2, -1]), otf.dtype)
+        otf_chunks.append(otf / tf.expand_dims(energy, -1))
+
+    otf = tf.concat(otf_chunks, axis=0)
+
+    return tf.reshape(otf, [num_profiles, num_sources, -1])
+
+
+def broadband_batched_otf_sensor(
+    point_source_locs,
+    ms_modulation_trans,
+    ms_modulation_phase,
+    parameters_list,
+    frequencies,
+    method="autocorrelation",
+    chunk_size=None,
+):
+    """Computes the OTF of a batch of metasurface profiles at a set of sensor-plane frequencies (see
+    batched_otf_sensor), for multiple wavelengths and on-axis point-source depths.
+
+    Args:
+        `point_source_locs` (tf.float): Set of point-source coordinates of shape (N,3); only the depths are used.
+        `ms_modulation_trans` (tf.float): Metasurface transmittance profile(s) of shape
+            (len(wavelength_set_m), profile_batch, ms_samplesM['y'], ms_samplesM['x']) or
+            (len(wavelength_set_m), profile_batch, 1, ms_samplesM['r']). Alternatively, if the profiles are the same
+            across wavelengths, the shape may be (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or
+            (profile_batch, 1, ms_samplesM['r']).
+        `ms_modulation_phase` (tf.float): Metasurface phase profile(s), of the same shape as ms_modulation_trans.
+        `parameters_list` (list): List of prop_param objects, each being initialized (in order of wavelength_set_m) for
+            a different wavelength_m value.
+        `frequencies` (dict): Sensor-plane frequency samples in cycles per m via dictionary {"x": np.float,
+            "y": np.float}, each of shape (J,).
+        `method` (str, optional): Either "autocorrelation" or "rfft2". Defaults to "autocorrelation".
+        `chunk_size` (int, optional): Maximum number of pupil functions transformed at once. Defaults to None.
+
+    Raises:
+        ValueError: rank of ms_modulation_trans and ms_modulation_phase must be 3 or 4.
+
+    Returns:
+        `tf.complex`: OTF normalized to unity at zero frequency, of shape (len(wavelength_set_m), profile_batch, N, J).
+    """
+    input_rank = len(ms_modulation_trans.shape)
+    if input_rank not in [3, 4]:
+        raise ValueError(
+            "broadband_batched_otf_sensor: rank of ms_trans and/or ms_phase is incorrect. must be rank 3 or rank 4 tensor."
+        )
+
+    otf = []
+    for idx, parameters in enumerate(parameters_list):
+        ms_trans = ms_modulation_trans[idx] if input_rank == 4 else ms_modulation_trans
+        ms_phase = ms_modulation_phase[idx] if input_rank == 4 else ms_modulation_phase
+        otf.append(
+            batched_otf_sensor(point_source_locs, ms_trans, ms_phase, parameters, frequencies, method, chunk_size)
+        )
+
+    return tf.stack(otf)
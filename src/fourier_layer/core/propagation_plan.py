@@ -0,0 +1,201 @@
+import tensorflow as tf
+from .psf_compute import calc_ms_grid, sensor_window_active
+from .fresnel_integral_method import (
+    fresnel_input_terms,
+    fresnel_output_phase,
+    fresnel_czt_terms,
+    fresnel_cell_aperture,
+)
+from .angular_spectrum_method import asm_transfer_function_terms, asm_bandlimited_terms
+from .calc_ms_regularizer import cell_aperture_size
+from .detectorResampling import sensor_area_overlap, sensor_area_overlap_radialData
+
+# Keys of the prop_params object that the static tensors in the plan depend on
+PLAN_KEYS = [
+    "wavelength_m",
+    "sensor_distance_m",
+    "calc_samplesN",
+    "calc_ms_dx_m",
+    "calc_sensor_dx_m",
+    "calc_sensor_samplesN",
+    "sensor_pixel_size_m",
+    "sensor_pixel_number",
+    "radial_symmetry",
+    "diffractionEngine",
+    "accurate_measurement",
+    "dtype",
+    "hankel_method",
+    "padasm_half",
+    "ms_upsampling",
+    "ms_dx_m",
+]
+
+
+def plan_fingerprint(parameters):
+    """Returns a hashable summary of the prop_params values used to build a propagation_plan.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+
+    Returns:
+        `tuple`: Fingerprint of the parameters relevant to the plan.
+    """
+    fingerprint = []
+    for key in PLAN_KEYS:
+        value = parameters[key]
+        if isinstance(value, dict):
+            value = tuple(sorted(value.items()))
+        fingerprint.append((key, value))
+
+    return tuple(fingerprint)
+
+
+class propagation_plan:
+    """Precomputed, static tensors used when propagating fields for a single-wavelength prop_params configuration.
+
+    Every call to psf_sensor or field_propagation otherwise rebuilds the same grids, chirps, transfer functions, and
+    detector resampling matrices. The plan is built once (typically during layer initialization) and passed down to 
+    the core calls via their `plan` argument. Since a plan is only valid for the parameters it was built from, it records a
+    fingerprint of the relevant keys which can be checked with `matches` before reuse.
+
+    Attributes:
+        `fingerprint` (tuple): Summary of the prop_params values used to build the plan.
+        `ms_grid` (tuple): x and y coordinates of the upsampled/padded metasurface grid.
+        `fresnel_input_x` (tf.float): Input x-coordinate grid for the fresnel engine (None for other engines).
+        `fresnel_input_chirp` (tf.complex): Quadratic phase factor applied before the fresnel transform (None for other 
+            engines).
+        `fresnel_output_chirp` (tf.complex): Output-plane phase factor added by fresnel_diffraction_coeffs, including
+            the cell aperture for the "cell_aperture" ms_upsampling mode (None for other engines).
+        `fresnel_czt_terms` (dict): Chirp-z (or quadrature Hankel) transform terms for the fresnel_czt engine, or for 
+            the fresnel_fourier engine in 2D when only the sensor window is evaluated (None otherwise).
+        `asm_grid_x` (tf.float): Padded x-coordinate grid for the ASM engine (None for other engines).
+        `asm_transfer_function` (tf.complex): ASM transfer function, of unit magnitude unless it includes the cell 
+            aperture for the "cell_aperture" ms_upsampling mode (None for other engines).
+        `asm_output_terms` (dict or tf.float): Output-grid transform terms for the ASM_scaled engine (None for other 
+            engines).
+        `sensor_area_overlap` (dict): Area-overlap matrices used for the detector measurement (None if 
+            accurate_measurement is False).
+        `sensor_area_overlap_r` (dict): Area-overlap matrix used for the detector measurement of radial data
+            (None if radial_symmetry or accurate_measurement is False).
+    """
+
+    def __init__(self, parameters):
+        """Propagation plan initialization.
+
+        Args:
+            `parameters` (prop_params): Settings object defining field propagation details. The object must define
+                'wavelength_m' (i.e. not be a broadband parent object).
+
+        Raises:
+            KeyError: parameters object must have 'wavelength_m' defined.
+        """
+        if not ("wavelength_m" in parameters.keys()):
+            raise KeyError("propagation_plan: parameters must contain wavelength_m")
+
+        self.fingerprint = plan_fingerprint(parameters)
+
+        wavelength_m = parameters["wavelength_m"]
+        sensor_distance_m = parameters["sensor_distance_m"]
+        calc_samplesN = parameters["calc_samplesN"]
+        calc_ms_dx_m = parameters["calc_ms_dx_m"]
+        calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+        calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+        radial_symmetry = parameters["radial_symmetry"]
+        diffractionEngine = parameters["diffractionEngine"]
+        dtype = parameters["dtype"]
+        cell_size_m = cell_aperture_size(parameters)
+
+        self.ms_grid = calc_ms_grid(parameters)
+
+        self.fresnel_input_x = None
+        self.fresnel_input_chirp = None
+        self.fresnel_output_chirp = None
+        self.fresnel_czt_terms = None
+        self.asm_grid_x = None
+        self.asm_transfer_function = None
+        self.asm_output_terms = None
+        if diffractionEngine in ["fresnel_fourier", "fresnel_czt"]:
+            TF_ZERO = tf.cast(0.0, dtype=dtype)
+            self.fresnel_input_x, input_phase = fresnel_input_terms(
+                wavelength_m, sensor_distance_m, calc_ms_dx_m, calc_samplesN, dtype, radial_symmetry
+            )
+            output_phase = fresnel_output_phase(
+                wavelength_m, sensor_distance_m, calc_sensor_dx_m, calc_sensor_samplesN, dtype, radial_symmetry
+            )
+            self.fresnel_input_chirp = tf.exp(tf.complex(TF_ZERO, input_phase))
+            self.fresnel_output_chirp = tf.exp(tf.complex(TF_ZERO, output_phase))
+            if cell_size_m is not None:
+                self.fresnel_output_chirp = self.fresnel_output_chirp * fresnel_cell_aperture(
+                    wavelength_m, sensor_distance_m, calc_sensor_dx_m, calc_sensor_samplesN, cell_size_m, dtype
+                )
+            # fresnel_fourier uses the chirp-z transform as a pruned DFT when only the sensor window is evaluated
+            if diffractionEngine == "fresnel_czt" or (sensor_window_active(parameters) and not radial_symmetry):
+                self.fresnel_czt_terms = fresnel_czt_terms(
+                    wavelength_m,
+                    sensor_distance_m,
+                    calc_ms_dx_m,
+                    calc_samplesN,
+                    calc_sensor_dx_m,
+                    dtype,
+                    radial_symmetry,
+                    calc_sensor_samplesN,
+                )
+        elif diffractionEngine == "ASM_fourier":
+            self.asm_grid_x, self.asm_transfer_function = asm_transfer_function_terms(
+                wavelength_m,
+                sensor_distance_m,
+                calc_ms_dx_m,
+                calc_samplesN,
+                dtype,
+                radial_symmetry,
+                hankel_method=parameters["hankel_method"],
+                cell_size_m=cell_size_m,
+            )
+        elif diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+            self.asm_grid_x, self.asm_transfer_function, self.asm_output_terms = asm_bandlimited_terms(
+                wavelength_m,
+                sensor_distance_m,
+                calc_ms_dx_m,
+                calc_samplesN,
+                calc_sensor_dx_m,
+                dtype,
+                radial_symmetry,
+                parameters["padasm_half"],
+                parameters["hankel_method"],
+                calc_sensor_samplesN,
+                cell_size_m,
+            )
+
+        self.sensor_area_overlap = None
+        self.sensor_area_overlap_r = None
+        if parameters["accurate_measurement"]:
+            self.sensor_area_overlap = sensor_area_overlap(parameters)
+            if radial_symmetry:
+                self.sensor_area_overlap_r = sensor_area_overlap_radialData(parameters)
+
+    def matches(self, parameters):
+        """Checks if the plan is valid for the given parameters.
+
+        Args:
+            `parameters` (prop_params): Settings object defining field propagation details.
+
+        Returns:
+            `bool`: True if the plan was built from parameters with the same relevant values.
+        """
+        return self.fingerprint == plan_fingerprint(parameters)
+
+
+def validate_plan(plan, parameters):
+    """Returns the plan if it is valid for the given parameters, otherwise returns a newly built plan.
+
+    Args:
+        `plan` (propagation_plan): Previously built plan (may be None).
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `propagation_plan`: Plan valid for parameters.
+    """
+    if plan is None or not plan.matches(parameters):
+        plan = propagation_plan(parameters)
+
+    return plan
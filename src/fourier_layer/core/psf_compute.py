@@ -1,14 +1,35 @@
+import functools
 import tensorflow as tf
 import numpy as np
-from .calc_ms_regularizer import regularize_ms_calc_tf
-from .hankel import radial_2d_transform, radial_2d_transform_wrapped_phase
-from .fresnel_integral_method import fresnel_diffraction_coeffs, fresnel_diffraction_fft
-from .angular_spectrum_method import transfer_function_diffraction
-from .detectorResampling import sensorMeasurement_intensity_phase
+from .calc_ms_regularizer import regularize_ms_calc_complex, cell_aperture_size
+from .hankel import (
+    radial_2d_transform,
+    radial_2d_transform_complex,
+    radial_conditional_resize_with_crop_or_pad,
+    safe_angle,
+)
+from .czt import fast_fft_length
+from .fresnel_integral_method import (
+    fresnel_diffraction_coeffs_complex,
+    fresnel_diffraction_fft_complex,
+    fresnel_diffraction_czt_complex,
+)
+from .angular_spectrum_method import (
+    transfer_function_diffraction_complex,
+    transfer_function_diffraction_bandlimited_complex,
+)
+from .detectorResampling import sensorMeasurement_intensity_phase, sensorMeasurement_intensity
+from .stage_profiler import profile_stage, elementwise_flops, fft_flops, matmul_flops
 
 
 def psf_measured(
-    point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters, normby_transmittance,
+    point_source_locs,
+    ms_modulation_trans,
+    ms_modulation_phase,
+    parameters,
+    normby_transmittance,
+    plan=None,
+    intensity_only=False,
 ):
     """Computes the point-spread function at the sensor-plane then resamples and integrates to yield measurement on a 
     user-specified detector pixels. 
@@ -18,34 +39,75 @@ def psf_measured(
 
     Args:
         `point_source_locs` (tf.float): Set of point-source coordinates of shape (N,3) to compute the PSF for 
-        `ms_modulation_trans` (tf.float): Metasurface transmittance profile of shape (1, ms_samplesM['y'], ms_samplesM['x'])
-            or (1, 1, ms_samplesM["r"]).
-        `ms_modulation_phase` (tf.float): Metasurface phase profile of shape (1, ms_samplesM['y'], ms_samplesM['x']) or
-            (1, 1, ms_samplesM["r"])
+        `ms_modulation_trans` (tf.float): Metasurface transmittance profile(s) of shape 
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `ms_modulation_phase` (tf.float): Metasurface phase profile(s) of shape 
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
         `parameters` (prop_param):  Settings object defining field propagation details.
         `normby_transmittance` (tf.float): Scalar normalization factor for PSF field.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
+        `intensity_only` (bool, optional): If True, the phase is never computed or resampled and only the measured 
+            intensity is returned. Defaults to False.
 
     Returns:
-        `tf.float`: Field intensity measured on the detector, of shape (N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
-        `tf.float`: Fied phase measured on the detector, of shape (N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+        `tf.float`: Field intensity measured on the detector, of shape 
+            (profile_batch * N, sensor_pixel_number["y"], sensor_pixel_number["x"]), ordered profile-major.
+        `tf.float`: Fied phase measured on the detector, of shape 
+            (profile_batch * N, sensor_pixel_number["y"], sensor_pixel_number["x"]), ordered profile-major. Not 
+            returned if intensity_only is True.
     """
 
     # compute the PSF at the sensor plane -- note that psf_sensor returns
     # tf.math.abs(field)**2 already with appropriate psf normalization on energy!
+    if intensity_only:
+        calc_modulation_intensity = psf_sensor(
+            point_source_locs,
+            ms_modulation_trans,
+            ms_modulation_phase,
+            parameters,
+            normby_transmittance,
+            plan=plan,
+            intensity_only=True,
+        )
+        num_fields = calc_modulation_intensity.shape[0]
+        with profile_stage(
+            "sensor_measurement",
+            [calc_modulation_intensity],
+            lambda: sensor_measurement_flop_estimate(parameters, num_fields, intensity_only=True),
+        ) as stage:
+            calc_modulation_intensity = sensorMeasurement_intensity(calc_modulation_intensity, parameters, plan)
+            stage.outputs(calc_modulation_intensity)
+
+        return calc_modulation_intensity
+
     calc_modulation_intensity, calc_modulation_phase = psf_sensor(
-        point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters, normby_transmittance
+        point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters, normby_transmittance, plan=plan
     )
 
     # Predict the measurement on specified detector pixel size and shape
-    (calc_modulation_intensity, calc_modulation_phase,) = sensorMeasurement_intensity_phase(
-        calc_modulation_intensity, calc_modulation_phase, parameters
-    )
+    num_fields = calc_modulation_intensity.shape[0]
+    with profile_stage(
+        "sensor_measurement",
+        [calc_modulation_intensity, calc_modulation_phase],
+        lambda: sensor_measurement_flop_estimate(parameters, num_fields),
+    ) as stage:
+        (calc_modulation_intensity, calc_modulation_phase,) = sensorMeasurement_intensity_phase(
+            calc_modulation_intensity, calc_modulation_phase, parameters, plan
+        )
+        stage.outputs(calc_modulation_intensity, calc_modulation_phase)
 
     return calc_modulation_intensity, calc_modulation_phase
 
 
 def psf_sensor(
-    point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters, normby_transmittance, convert_2D=True
+    point_source_locs,
+    ms_modulation_trans,
+    ms_modulation_phase,
+    parameters,
+    normby_transmittance,
+    convert_2D=True,
+    plan=None,
+    intensity_only=False,
 ):
     """ Computes the point-spread function on a unifrom grid at the sensor-plane, given a metasurface phase and transmittance.
     
@@ -54,56 +116,102 @@ def psf_sensor(
     
     Args:
         `point_source_locs` (tf.float): Set of point-source coordinates of shape (N,3) to compute the PSF for 
-        `ms_modulation_trans` (tf.float): Metasurface transmittance profile of shape (1, ms_samplesM['y'], ms_samplesM['x'])
-            or (1, 1, ms_samplesM["r"]).
-        `ms_modulation_phase` (tf.float): Metasurface phase profile of shape (1, ms_samplesM['y'], ms_samplesM['x']) 
-            or (1, 1, ms_samplesM["r"]).
+        `ms_modulation_trans` (tf.float): Metasurface transmittance profile(s) of shape 
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
+        `ms_modulation_phase` (tf.float): Metasurface phase profile(s) of shape 
+            (profile_batch, ms_samplesM['y'], ms_samplesM['x']) or (profile_batch, 1, ms_samplesM["r"]).
         `parameters` (prop_param):  Settings object defining field propagation details.
         `normby_transmittance` (tf.float): Scalar normalization factor for PSF field.
+        `convert_2D` (bool, optional): If radial symmetry is used, convert the radial psf to 2D. Defaults to True.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
+        `intensity_only` (bool, optional): If True, the phase is not computed and only the intensity is returned. 
+            Defaults to False.
 
     Returns:
-        `tf.float`: Field intensity at the sensor-plane grid of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x'])
-        `tf.float`: Field phase at the sensor-plane grid of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x']).
+        `tf.float`: Field intensity at the sensor-plane grid of shape (profile_batch * N, calc_ms_samplesM['y'], calc_ms_samplesM['x'])
+        `tf.float`: Field phase at the sensor-plane grid of shape (profile_batch * N, calc_ms_samplesM['y'], calc_ms_samplesM['x']).
+            Not returned if intensity_only is True.
     """
 
     # Run psf calculation with assertions upheld
     all_assertions = psf_sensor_assertions(point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters)
     with tf.control_dependencies(all_assertions):
 
-        # For an accurate calculation, resample ms and add the padding as defined during prop_param initialization
-        calc_modulation_trans, calc_modulation_phase = regularize_ms_calc_tf(
-            ms_modulation_trans, ms_modulation_phase, parameters
-        )
+        # The metasurface modulation is combined into a single complex field which is passed through all stages of the
+        # calculation; it is only split into amplitude and phase at the end
+        TF_ZERO = tf.cast(0.0, dtype=parameters["dtype"])
+        num_profiles = ms_modulation_trans.shape[0]
+        with profile_stage(
+            "regularize_ms_calc",
+            [ms_modulation_trans, ms_modulation_phase],
+            lambda: elementwise_flops(calc_field_shape(parameters, num_profiles), is_complex=True),
+        ) as stage:
+            ms_modulation = tf.complex(ms_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, ms_modulation_phase))
+
+            # For an accurate calculation, resample ms and add the padding as defined during prop_param initialization
+            calc_modulation = regularize_ms_calc_complex(ms_modulation, parameters)
+            stage.outputs(calc_modulation)
 
         # Get the field after the metasurface, given a point-source spherical wave origin
-        calc_modulation_trans, calc_modulation_phase = wavefront_pointSources_afterms(
-            point_source_locs, calc_modulation_trans, calc_modulation_phase, parameters
-        )
+        num_fields = num_profiles * point_source_locs.shape[0]
+        with profile_stage(
+            "point_source_wavefronts",
+            [calc_modulation],
+            lambda: elementwise_flops(calc_field_shape(parameters, num_fields), 10, is_complex=True),
+        ) as stage:
+            calc_modulation = wavefront_pointSources_afterms_complex(
+                point_source_locs, calc_modulation, parameters, plan
+            )
+            stage.outputs(calc_modulation)
 
         # get finely sampled field just above the sensor (radial converted to 2D psf at end)
-        (calc_modulation_trans, calc_modulation_phase,) = wavefront_afterms_sensor(
-            calc_modulation_trans, calc_modulation_phase, parameters,
-        )
+        with profile_stage(
+            "propagation",
+            [calc_modulation],
+            lambda: propagation_flop_estimate(parameters, num_fields),
+            detail=propagation_detail(parameters),
+        ) as stage:
+            calc_modulation = wavefront_afterms_sensor_complex(calc_modulation, parameters, plan)
+            stage.outputs(calc_modulation)
 
         # After calculation is done, if radial symmetry was used, convert back to 2D unless override return radial
+        calc_modulation_trans = tf.math.abs(calc_modulation)
         if parameters["radial_symmetry"] and convert_2D:
-            calc_modulation_trans = radial_2d_transform(tf.squeeze(calc_modulation_trans, 1))
-            calc_modulation_phase = radial_2d_transform_wrapped_phase(tf.squeeze(calc_modulation_phase, 1))
+            num_samples_2d = 2 * calc_modulation.shape[-1] - 1
+            with profile_stage(
+                "radial_2d_transform",
+                [calc_modulation],
+                lambda: elementwise_flops([num_fields, num_samples_2d, num_samples_2d], 10 if intensity_only else 20),
+            ) as stage:
+                if intensity_only:
+                    calc_modulation_trans = radial_2d_transform(tf.squeeze(calc_modulation_trans, 1))
+                else:
+                    calc_modulation = radial_2d_transform_complex(tf.squeeze(calc_modulation, 1))
+                    calc_modulation_trans = tf.math.abs(calc_modulation)
+                stage.outputs(calc_modulation_trans)
+
+        # The field is only split into amplitude and phase here
+        if not intensity_only:
+            calc_modulation_phase = safe_angle(calc_modulation)
 
         ### Normalize by input source energy factor
         calc_modulation_trans /= normby_transmittance
         calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+        calc_modulation_intensity = (
+            tf.math.abs(calc_modulation_trans) ** 2 * calc_sensor_dx_m["y"] * calc_sensor_dx_m["x"]
+        )
 
-    return (
-        tf.math.abs(calc_modulation_trans) ** 2 * calc_sensor_dx_m["y"] * calc_sensor_dx_m["x"],
-        calc_modulation_phase,
-    )
+    if intensity_only:
+        return calc_modulation_intensity
+
+    return calc_modulation_intensity, calc_modulation_phase
 
 
 def wavefront_afterms_sensor(
-    calc_modulation_trans, calc_modulation_phase, parameters,
+    calc_modulation_trans, calc_modulation_phase, parameters, plan=None,
 ):
-    """Propagate the complex field from after the ms to just above the sensor plane
+    """Propagate the complex field from after the ms to just above the sensor plane. This is the amplitude and phase 
+    interface to wavefront_afterms_sensor_complex().
 
     Args:
         `calc_modulation_trans` (tf.float): Field amplitude just after the metasurface (upsampled/padded), of shape 
@@ -111,10 +219,34 @@ def wavefront_afterms_sensor(
         `calc_modulation_phase` (tf.float): Field phase just after the metasurface (upsampled/padded), of shape 
             (N, calc_samplesN['y'], calc_samplesN['x']) or (N, 1, calc_samplesN["r"]).
         `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
+
+    Returns:
+        `tf.float`: Field amplitude at the sensor plane grid, of shape (N, calc_sensor_samplesN['y'], 
+            calc_sensor_samplesN['x']) or (N, 1, calc_sensor_samplesN["r"]).
+        `tf.float`: Field phase at the sensor plane grid, of shape (N, calc_sensor_samplesN['y'], 
+            calc_sensor_samplesN['x']) or (N, 1, calc_sensor_samplesN["r"]).
+    """
+    TF_ZERO = tf.cast(0.0, dtype=parameters["dtype"])
+    wavefront = tf.complex(calc_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, calc_modulation_phase))
+    wavefront = wavefront_afterms_sensor_complex(wavefront, parameters, plan)
+
+    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+
+
+def wavefront_afterms_sensor_complex(calc_modulation, parameters, plan=None):
+    """Propagate the complex field from after the ms to just above the sensor plane, keeping the field complex.
+
+    Args:
+        `calc_modulation` (tf.complex): Complex field just after the metasurface (upsampled/padded), of shape 
+            (N, calc_samplesN['y'], calc_samplesN['x']) or (N, 1, calc_samplesN["r"]).
+        `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed static tensors for this geometry. Defaults to None.
 
     Returns:
-        `tf.float64`: Field amplitude at the sensor plane grid, of shape (N, calc_samplesN['y'], calc_samplesN['x']) or (N, 1, calc_samplesN["r"]).
-        `tf.float64`: Field phase at the sensor plane grid, of shape (N, calc_samplesN['y'], calc_samplesN['x']) or (N, 1, calc_samplesN["r"]).
+        `tf.complex`: Complex field at the sensor plane grid, of shape (N, calc_sensor_samplesN['y'], 
+            calc_sensor_samplesN['x']) or (N, 1, calc_sensor_samplesN["r"]). This is the full calculation grid unless 
+            parameters["roi_propagation"] is True, in which case only the window used by the detector is evaluated.
     """
 
     # propagate the field using a specified engine
@@ -123,18 +255,35 @@ def wavefront_afterms_sensor(
     calc_samplesN = parameters["calc_samplesN"]
     calc_ms_dx_m = parameters["calc_ms_dx_m"]
     calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
     dtype = parameters["dtype"]
     radial_symmetry = parameters["radial_symmetry"]
     diffractionEngine = parameters["diffractionEngine"]
-
-    if diffractionEngine == "fresnel_fourier":
-        propagator = fresnel_diffraction_fft
+    # Without a plan, the cell aperture of a field that is not upsampled is applied by the propagator
+    cell_size_m = cell_aperture_size(parameters) if plan is None else None
+
+    # Engines which cannot evaluate only the sensor window return the full grid and are cropped after propagation
+    crop_to_window = sensor_window_active(parameters)
+    if diffractionEngine == "fresnel_fourier" and (radial_symmetry or not crop_to_window):
+        propagator = fresnel_diffraction_fft_complex
+    elif diffractionEngine in ["fresnel_fourier", "fresnel_czt"]:
+        # For fresnel_fourier, the chirp-z transform at the DFT pitch is a pruned DFT over the sensor window
+        propagator = functools.partial(fresnel_diffraction_czt_complex, output_pixel_number=calc_sensor_samplesN)
+        crop_to_window = False
     elif diffractionEngine == "ASM_fourier":
-        propagator = transfer_function_diffraction
+        propagator = functools.partial(transfer_function_diffraction_complex, cell_size_m=cell_size_m)
+    elif diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+        # The band-limited engines take the minimum padding computed by prop_params as the optional argument
+        propagator = functools.partial(
+            transfer_function_diffraction_bandlimited_complex,
+            optArg=parameters["padasm_half"],
+            output_pixel_number=calc_sensor_samplesN,
+            cell_size_m=cell_size_m,
+        )
+        crop_to_window = False
 
-    wavefront_trans, wavefront_phase = propagator(
-        calc_modulation_trans,
-        calc_modulation_phase,
+    wavefront = propagator(
+        calc_modulation,
         wavelength_m,
         sensor_distance_m,
         calc_ms_dx_m,
@@ -142,67 +291,271 @@ def wavefront_afterms_sensor(
         calc_sensor_dx_m,
         dtype,
         radial_symmetry,
+        plan=plan,
+        hankel_method=parameters["hankel_method"],
     )
+    if crop_to_window:
+        wavefront = radial_conditional_resize_with_crop_or_pad(wavefront, radial_symmetry, calc_sensor_samplesN)
 
     # When the fresnel transform calculation is done, coefficients need to be added back in
     # this is done here rather than in the propagator call so that all propagator engines have same
     # inputs to function. No Coefficients are missing in the transfer_function_diffraction propagator
-    if diffractionEngine == "fresnel_fourier":
-        calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
-        wavefront_trans, wavefront_phase = fresnel_diffraction_coeffs(
-            wavefront_trans,
-            wavefront_phase,
+    if diffractionEngine in ["fresnel_fourier", "fresnel_czt"]:
+        wavefront = fresnel_diffraction_coeffs_complex(
+            wavefront,
             wavelength_m,
             sensor_distance_m,
             calc_sensor_dx_m,
-            calc_samplesN,
+            calc_sensor_samplesN,
             dtype,
             radial_symmetry,
+            plan,
+            cell_size_m,
         )
 
-    return wavefront_trans, wavefront_phase
+    return wavefront
+
+
+def calc_field_shape(parameters, num_fields):
+    """Returns the shape of a batch of fields on the calculation grid, for the stage profiles of the layers.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+        `num_fields` (int): Number of fields.
+
+    Returns:
+        `list`: Shape (num_fields, calc_samplesN["y"], calc_samplesN["x"]) or (num_fields, 1, calc_samplesN["r"]).
+    """
+    calc_samplesN = parameters["calc_samplesN"]
+    if parameters["radial_symmetry"]:
+        return [num_fields, 1, calc_samplesN["r"]]
+
+    return [num_fields, calc_samplesN["y"], calc_samplesN["x"]]
+
+
+def sensor_window_active(parameters):
+    """Returns True if the sensor plane field is only evaluated on a window of the calculation grid, i.e. if 
+    roi_propagation is used and the detector does not need the full grid.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+
+    Returns:
+        `bool`: True if calc_sensor_samplesN is smaller than calc_samplesN.
+    """
+    return parameters["calc_sensor_samplesN"] != parameters["calc_samplesN"]
+
+
+def czt_flop_estimate(input_number, output_number, num_transforms):
+    """Estimates the floating-point operations of chirp-z transforms (see czt) of a batch of sequences: two FFTs of 
+    the padded length and the chirp multiplications.
+
+    Args:
+        `input_number` (int): Length of the transformed sequences.
+        `output_number` (int): Number of output points of each transform.
+        `num_transforms` (int): Number of transformed sequences.
+
+    Returns:
+        `float`: Estimated number of floating-point operations.
+    """
+    length = fast_fft_length(input_number + output_number - 1)
+    return fft_flops([length], 2 * num_transforms) + 8 * num_transforms * length
+
+
+def sensor_window_work_estimate(parameters):
+    """Estimates the work saved by evaluating the sensor plane field only on the window used by the detector 
+    (roi_propagation), relative to evaluating the full calculation grid.
+
+    Transform costs are counted as 5 n log2(n) operations per length-n FFT. For the fresnel engines in 2D, the 
+    full-grid FFT (fresnel_fourier) or chirp-z transform (fresnel_czt) is compared with the chirp-z transform over the
+    window. For the angular spectrum engines, the transform fraction is reported as 1 since the forward transform of 
+    the padded field dominates; the window then only reduces the inverse transform and the work after propagation. A 
+    transform fraction above 1 indicates that the pruned transform costs more operations than the full-grid FFT, in 
+    which case the saving comes only from the reduced work on the sensor plane grid.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+
+    Returns:
+        `dict`: Number of sensor plane samples evaluated for the full grid ("full_samples") and the window 
+            ("window_samples"), the fraction of samples evaluated ("sample_fraction"), and the estimated fraction of
+            transform operations for the propagation ("transform_fraction").
+    """
+    calc_samplesN = parameters["calc_samplesN"]
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+
+    if parameters["radial_symmetry"]:
+        full_samples = calc_samplesN["r"]
+        window_samples = calc_sensor_samplesN["r"]
+        transform_fraction = 1.0
+    else:
+        full_samples = calc_samplesN["x"] * calc_samplesN["y"]
+        window_samples = calc_sensor_samplesN["x"] * calc_sensor_samplesN["y"]
+        transform_fraction = 1.0
+        nx, ny = calc_samplesN["x"], calc_samplesN["y"]
+        kx, ky = calc_sensor_samplesN["x"], calc_sensor_samplesN["y"]
+        window_ops = czt_flop_estimate(nx, kx, ny) + czt_flop_estimate(ny, ky, kx)
+        if parameters["diffractionEngine"] == "fresnel_fourier" and sensor_window_active(parameters):
+            transform_fraction = window_ops / fft_flops([nx, ny])
+        elif parameters["diffractionEngine"] == "fresnel_czt":
+            transform_fraction = window_ops / (czt_flop_estimate(nx, nx, ny) + czt_flop_estimate(ny, ny, nx))
+
+    return {
+        "full_samples": full_samples,
+        "window_samples": window_samples,
+        "sample_fraction": window_samples / full_samples,
+        "transform_fraction": float(transform_fraction),
+    }
+
+
+def propagation_flop_estimate(parameters, num_fields):
+    """Estimates the floating-point operations used by wavefront_afterms_sensor_complex() to propagate a batch of 
+    fields, for the stage profiles of the layers (see stage_profiler). 
+
+    Transforms are counted as in sensor_window_work_estimate(); the quasi-discrete Hankel transform is counted as a 
+    dense complex matrix product and the chirp and transfer function multiplications are neglected.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+        `num_fields` (int): Number of fields propagated.
+
+    Returns:
+        `float`: Estimated number of floating-point operations.
+    """
+    calc_samplesN = parameters["calc_samplesN"]
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+    diffractionEngine = parameters["diffractionEngine"]
+    num_transforms = 1 if diffractionEngine in ["fresnel_fourier", "fresnel_czt"] else 2
+
+    if parameters["radial_symmetry"]:
+        samples_r = calc_samplesN["r"]
+        if diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+            samples_r += parameters["padasm_half"]["x"]
+        return matmul_flops(1, samples_r, samples_r, num_fields * num_transforms, is_complex=True)
+
+    nx, ny = calc_samplesN["x"], calc_samplesN["y"]
+    kx, ky = calc_sensor_samplesN["x"], calc_sensor_samplesN["y"]
+    if diffractionEngine in ["ASM_bandlimited", "ASM_scaled"]:
+        nx += 2 * parameters["padasm_half"]["x"]
+        ny += 2 * parameters["padasm_half"]["y"]
+
+    windowed_fresnel = diffractionEngine == "fresnel_fourier" and sensor_window_active(parameters)
+    if diffractionEngine == "fresnel_czt" or windowed_fresnel:
+        ops = czt_flop_estimate(nx, kx, ny) + czt_flop_estimate(ny, ky, kx)
+    elif diffractionEngine == "ASM_scaled":
+        ops = fft_flops([nx, ny]) + czt_flop_estimate(nx, kx, ny) + czt_flop_estimate(ny, ky, kx)
+    else:
+        ops = num_transforms * fft_flops([nx, ny])
+
+    return num_fields * float(ops)
+
+
+def propagation_detail(parameters):
+    """Returns a short description of the engine and transform used by wavefront_afterms_sensor_complex(), for the
+    stage profiles of the layers.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+
+    Returns:
+        `str`: Description, e.g. "fresnel_fourier (qdht)" or "ASM_fourier (2D)".
+    """
+    if parameters["radial_symmetry"]:
+        return parameters["diffractionEngine"] + " (" + parameters["hankel_method"] + ")"
+
+    return parameters["diffractionEngine"] + " (2D)"
+
+
+def sensor_measurement_flop_estimate(parameters, num_fields, intensity_only=False, radial_data=False):
+    """Estimates the floating-point operations of the detector measurement (area-overlap integration of the
+    intensity and, unless intensity_only, of the phasor), for the stage profiles of the layers (see stage_profiler).
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details (single wavelength).
+        `num_fields` (int): Number of fields measured.
+        `intensity_only` (bool, optional): If True, only the intensity is measured. Defaults to False.
+        `radial_data` (bool, optional): If True, the measured data is radial rather than converted to 2D. Defaults to
+            False.
+
+    Returns:
+        `float`: Estimated number of floating-point operations.
+    """
+    calc_sensor_samplesN = parameters["calc_sensor_samplesN"]
+    sensor_pixel_number = parameters["sensor_pixel_number"]
+    py, px = sensor_pixel_number["y"], sensor_pixel_number["x"]
+    if radial_data:
+        ny, nx = 1, calc_sensor_samplesN["r"]
+        py, px = 1, sensor_pixel_number["r"]
+    elif parameters["radial_symmetry"]:
+        ny = nx = 2 * calc_sensor_samplesN["r"] - 1
+    else:
+        ny, nx = calc_sensor_samplesN["y"], calc_sensor_samplesN["x"]
+
+    # Integration along y then x, for the intensity and the real and imaginary parts of the phasor
+    ops = matmul_flops(py, ny, nx) + matmul_flops(py, nx, px)
+
+    return num_fields * ops * (1 if intensity_only else 3)
 
 
 def wavefront_pointSources_afterms(
-    point_sources_locs, calc_modulation_trans, calc_modulation_phase, parameters,
+    point_sources_locs, calc_modulation_trans, calc_modulation_phase, parameters, plan=None,
 ):
+    """Computes the set of complex fields after a metasurface, resulting from the illuminated, upsampled/padded phase
+    and transmittance modulation profiles. This is the amplitude and phase interface to 
+    wavefront_pointSources_afterms_complex().
+
+    Args:
+        `point_sources_locs` (tf.float): Set of point-source coordinates to compute PSF for, of shape (N,3).
+        `calc_modulation_trans` (tf.float): Metasurface transmittance (upsampled/padded) of shape 
+            (profile_batch, calc_samplesN['y'], calc_samplesN['x']) or (profile_batch, 1, calc_samplesN["r"]).
+        `calc_modulation_phase` (tf.float): Metasurface phase (upsampled/padded) of shape 
+            (profile_batch, calc_samplesN['y'], calc_samplesN['x']) or (profile_batch, 1, calc_samplesN["r"]).
+        `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed metasurface grid for this geometry. Defaults to None.
+
+    Returns:
+        `tf.float`: Field amplitude after the metasurface, of shape (profile_batch * N, calc_samplesN['y'], calc_samplesN['x'])
+            or (profile_batch * N, 1, calc_samplesN["r"]).
+        `tf.float`: Field phase after the metasurface, the same shape as the returned amplitude.
+    """
+    TF_ZERO = tf.constant(0.0, dtype=parameters["dtype"])
+    calc_modulation = tf.complex(calc_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, calc_modulation_phase))
+    wavefront = wavefront_pointSources_afterms_complex(point_sources_locs, calc_modulation, parameters, plan)
+
+    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+
+
+def wavefront_pointSources_afterms_complex(point_sources_locs, calc_modulation, parameters, plan=None):
     """Computes the set of complex fields after a metasurface, resulting from the illuminated, upsampled/padded phase
     and transmittance modulation profiles. The incident wavefront at the metasurface corresponds to spherical wavefronts
     originating at the point-source locations. 
 
+    Every profile in the batch is illuminated by every point-source. The returned fields are ordered profile-major,
+    i.e. index b * N + n corresponds to profile b illuminated by point-source n.
+
     Args:
         `point_sources_locs` (tf.float): Set of point-source coordinates to compute PSF for, of shape (N,3).
-        `calc_modulation_trans` (tf.float): Metasurface transmittance (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x'])
-            or (1, 1, calc_samplesN["r"]).
-        `calc_modulation_phase` (tf.float): Metasurface phase (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x'])
-            or (1, 1, calc_samplesN["r"]).
+        `calc_modulation` (tf.complex): Metasurface complex modulation (upsampled/padded) of shape 
+            (profile_batch, calc_samplesN['y'], calc_samplesN['x']) or (profile_batch, 1, calc_samplesN["r"]).
         `parameters` (prop_params): Settings object defining field propagation details.
+        `plan` (propagation_plan, optional): Precomputed metasurface grid for this geometry. Defaults to None.
 
     Returns:
-        `tf.float`: Field amplitude after the metasurface, the same shape as the input.
-        `tf.float`: Field phase after the metasurface, the same shape as the input.
+        `tf.complex`: Complex field after the metasurface, of shape (profile_batch * N, calc_samplesN['y'], 
+            calc_samplesN['x']) or (profile_batch * N, 1, calc_samplesN["r"]).
     """
 
     # unpack the parameters
     wavelength_m = parameters["wavelength_m"]
-    radial_symmetry = parameters["radial_symmetry"]
     dtype = parameters["dtype"]
-    calc_samplesN = parameters["calc_samplesN"]
-    calc_ms_dx_m = parameters["calc_ms_dx_m"]
     angular_wave_number = 2 * np.pi / wavelength_m
-    TF_ZERO = tf.constant(0.0, dtype=tf.float64)
+    TF_ZERO = tf.constant(0.0, dtype=dtype)
 
-    # create the metasurface grid
-    if radial_symmetry:
-        calc_pixel_x, calc_pixel_y = tf.meshgrid(tf.range(calc_samplesN["r"], dtype=dtype), tf.range(1, dtype=dtype),)
+    # create the metasurface grid (or reuse the precomputed grid)
+    if plan is None:
+        calc_pixel_x, calc_pixel_y = calc_ms_grid(parameters)
     else:
-        calc_pixel_x, calc_pixel_y = tf.meshgrid(
-            tf.range(calc_samplesN["x"], dtype=dtype), tf.range(calc_samplesN["y"], dtype=dtype),
-        )
-        calc_pixel_x = calc_pixel_x - (calc_pixel_x.shape[1] - 1) / 2
-        calc_pixel_y = calc_pixel_y - (calc_pixel_y.shape[0] - 1) / 2
-    calc_pixel_x = tf.expand_dims(calc_pixel_x * calc_ms_dx_m["x"], 0)
-    calc_pixel_y = tf.expand_dims(calc_pixel_y * calc_ms_dx_m["y"], 0)
+        calc_pixel_x, calc_pixel_y = plan.ms_grid
 
     # index of the points
     point_source_loc_x = point_sources_locs[:, 0]
@@ -213,9 +566,15 @@ def wavefront_pointSources_afterms(
     point_source_loc_x = tf.expand_dims(tf.expand_dims(point_source_loc_x, -1), -1)
     point_source_loc_y = tf.expand_dims(tf.expand_dims(point_source_loc_y, -1), -1)
     point_source_loc_z = tf.expand_dims(tf.expand_dims(point_source_loc_z, -1), -1)
-    distance_point_ms = tf.sqrt(
-        (calc_pixel_x - point_source_loc_x) ** 2 + (calc_pixel_y - point_source_loc_y) ** 2 + point_source_loc_z ** 2
-    )
+    lateral_distance_sq = (calc_pixel_x - point_source_loc_x) ** 2 + (calc_pixel_y - point_source_loc_y) ** 2
+    distance_point_ms = tf.sqrt(lateral_distance_sq + point_source_loc_z ** 2)
+
+    # The phase k*r is large for distant point-sources and cannot be accumulated directly in single precision. It is
+    # split into the path difference r - z, evaluated without cancellation as rho^2 / (r + z), and the constant k*z,
+    # which is wrapped to [0, 2pi) in double precision.
+    path_difference = lateral_distance_sq / (distance_point_ms + point_source_loc_z)
+    piston_phase = tf.math.floormod(angular_wave_number * tf.cast(point_source_loc_z, tf.float64), 2 * np.pi)
+    spherical_phase = angular_wave_number * path_difference + tf.cast(piston_phase, dtype)
 
     ## Compute product of spherical wavefront and metasurface
     ## For the spherical wave, one could place 1/(i*lambda*r) instead of 1/r
@@ -226,11 +585,40 @@ def wavefront_pointSources_afterms(
     # )
 
     ## However we remove the 1/r and 1/lambda dependence to aid in normalized psf downstream
-    wavefront = tf.complex(calc_modulation_trans, TF_ZERO) * tf.exp(
-        tf.complex(TF_ZERO, calc_modulation_phase + angular_wave_number * distance_point_ms)
-    )
+    # The profile batch is broadcast against the point-sources in one pass, giving shape (profile_batch, N, ...)
+    wavefront = tf.expand_dims(calc_modulation, 1) * tf.expand_dims(tf.exp(tf.complex(TF_ZERO, spherical_phase)), 0)
+    wavefront = tf.reshape(wavefront, tf.concat([[-1], tf.shape(wavefront)[2:]], axis=0))
 
-    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+    return wavefront
+
+
+def calc_ms_grid(parameters):
+    """Returns the coordinates of the upsampled/padded metasurface calculation grid.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+
+    Returns:
+        `tf.float`: x coordinates of the grid, of shape (1, calc_samplesN['y'], calc_samplesN['x']) or (1, 1, calc_samplesN["r"]).
+        `tf.float`: y coordinates of the grid, the same shape as the x coordinates.
+    """
+    radial_symmetry = parameters["radial_symmetry"]
+    dtype = parameters["dtype"]
+    calc_samplesN = parameters["calc_samplesN"]
+    calc_ms_dx_m = parameters["calc_ms_dx_m"]
+
+    if radial_symmetry:
+        calc_pixel_x, calc_pixel_y = tf.meshgrid(tf.range(calc_samplesN["r"], dtype=dtype), tf.range(1, dtype=dtype),)
+    else:
+        calc_pixel_x, calc_pixel_y = tf.meshgrid(
+            tf.range(calc_samplesN["x"], dtype=dtype), tf.range(calc_samplesN["y"], dtype=dtype),
+        )
+        calc_pixel_x = calc_pixel_x - (calc_pixel_x.shape[1] - 1) / 2
+        calc_pixel_y = calc_pixel_y - (calc_pixel_y.shape[0] - 1) / 2
+    calc_pixel_x = tf.expand_dims(calc_pixel_x * calc_ms_dx_m["x"], 0)
+    calc_pixel_y = tf.expand_dims(calc_pixel_y * calc_ms_dx_m["y"], 0)
+
+    return calc_pixel_x, calc_pixel_y
 
 
 def psf_sensor_assertions(point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters):
@@ -249,18 +637,20 @@ def psf_sensor_assertions(point_source_locs, ms_modulation_trans, ms_modulation_
         point_source_locs.shape[1],
         3,
         name="point_source_shape_assertion",
-        summarize="Point source locations should be Nx3 in dimension",
+        message="Point source locations should be Nx3 in dimension",
     )
 
     assert3 = tf.debugging.assert_greater(
         point_source_locs[:, 2],
         TF_ZERO,
         name="point_source_positive_z_assertion",
-        summarize="Point source locations should have positive z values",
+        message="Point source locations should have positive z values",
     )
 
     assert4 = tf.debugging.Assert(
-        dtype == tf.float64, dtype, name="datatype_assertion", summarize="calculation data type must be tf.float64",
+        dtype in [tf.float32, tf.float64],
+        ["calculation data type must be tf.float64 or tf.float32"],
+        name="datatype_assertion",
     )
 
     # Check the shape of the data to make sure no mistakes were made
@@ -269,44 +659,43 @@ def psf_sensor_assertions(point_source_locs, ms_modulation_trans, ms_modulation_
         tf.shape(ms_modulation_trans).shape,
         3,
         name="lens_intensity_dimension_assertion",
-        summarize="Dimensionality of lens transmittance must be 3",
+        message="Dimensionality of lens transmittance must be 3",
     )
 
     assert6 = tf.debugging.assert_equal(
         tf.shape(ms_modulation_phase).shape,
         3,
         name="lens_phase_dimension_assertion",
-        summarize="Dimension of lens phase must be 3",
+        message="Dimension of lens phase must be 3",
     )
 
     # check that the input dimensions match what is expected by parameters
     radial_symmetry = parameters["radial_symmetry"]
     ms_samplesM = parameters["ms_samplesM"]
-    ms_dimension = tf.cond(
-        radial_symmetry,
-        lambda: tf.cast([1, ms_samplesM["r"]], tf.int32),
-        lambda: tf.cast([ms_samplesM["y"], ms_samplesM["x"]], tf.int32),
-    )
+    if radial_symmetry:
+        ms_dimension = tf.cast([1, ms_samplesM["r"]], tf.int32)
+    else:
+        ms_dimension = tf.cast([ms_samplesM["y"], ms_samplesM["x"]], tf.int32)
 
     assert7 = tf.debugging.assert_equal(
         ms_dimension,
         tf.shape(ms_modulation_trans)[1:],
         name="ms_intensity_dimension_assertion",
-        summarize="Check ms transmittance shape",
+        message="Check ms transmittance shape",
     )
 
     assert8 = tf.debugging.assert_equal(
         ms_dimension,
         tf.shape(ms_modulation_phase)[1:],
         name="ms_phase_dimension_assertion",
-        summarize="Check ms phase shape",
+        message="Check ms phase shape",
     )
 
-    assert9 = tf.debugging.assert_type(point_source_locs, tf.float64, name="point_source_locs_dtype_assetion")
+    assert9 = tf.debugging.assert_type(point_source_locs, dtype, name="point_source_locs_dtype_assetion")
 
-    assert10 = tf.debugging.assert_type(ms_modulation_trans, tf.float64, name="ms_intensity_dtype_assertion")
+    assert10 = tf.debugging.assert_type(ms_modulation_trans, dtype, name="ms_intensity_dtype_assertion")
 
-    assert11 = tf.debugging.assert_type(ms_modulation_phase, tf.float64, name="ms_phase_dtype_assertion")
+    assert11 = tf.debugging.assert_type(ms_modulation_phase, dtype, name="ms_phase_dtype_assertion")
 
     # return assertions as list
     all_assertions = [
@@ -323,11 +712,18 @@ def psf_sensor_assertions(point_source_locs, ms_modulation_trans, ms_modulation_
         assert11,
     ]
 
-    return all_assertions
+    # Assertions which are checked statically (e.g. on known shapes while tracing a graph) return None
+    return [assertion for assertion in all_assertions if assertion is not None]
 
 
 def psf_sensor_LTI(
-    point_source_locs, ms_modulation_trans, ms_modulation_phase, parameters, normby_transmittance, addCoeffs=True
+    point_source_locs,
+    ms_modulation_trans,
+    ms_modulation_phase,
+    parameters,
+    normby_transmittance,
+    addCoeffs=True,
+    convert_2D=True,
 ):
     """Computes the point-spread function on a uniform grid at the sensor plane, given a metasurface and phase transmittance.
 
@@ -344,10 +740,13 @@ def psf_sensor_LTI(
         `parameters` (prop_param):  Settings object defining field propagation details.
         `normby_transmittance` (tf.float): Scalar normalization factor for PSF field of shape (N,1).
         `addCoeffs` (bool, optional): Boolean flag to include the correct phase coefficients.
+        `convert_2D` (bool, optional): If radial symmetry is used, convert the radial psf to 2D. Defaults to True.
 
     Returns:
-        `tf.float64`: Intensity at the sensorplane of the LTI PSF, of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x']).
-        `tf.float64`: Phase at the sensorplane of the LTI PSF, of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x']).
+        `tf.float64`: Intensity at the sensorplane of the LTI PSF, of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x'])
+            or (N, 1, calc_samplesN["r"]) if convert_2D is False.
+        `tf.float64`: Phase at the sensorplane of the LTI PSF, of shape (N, calc_ms_samplesM['y'], calc_ms_samplesM['x'])
+            or (N, 1, calc_samplesN["r"]) if convert_2D is False.
     """
 
     # Get list of assertions used in the regular PSF calculation and add fresnel assertion
@@ -356,30 +755,30 @@ def psf_sensor_LTI(
         parameters["diffractionEngine"],
         "fresnel_fourier",
         name="paraxial_psf_expectation_check",
-        summarize="Ensure paraxial psf is expected when calling for LTI psf",
+        message="Ensure paraxial psf is expected when calling for LTI psf",
     )
     all_assertions.append(assertFresnel)
     with tf.control_dependencies(all_assertions):
 
+        # The complex field is built once and only split into amplitude and phase at the end
+        TF_ZERO = tf.cast(0.0, dtype=parameters["dtype"])
+        ms_modulation = tf.complex(ms_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, ms_modulation_phase))
+
         # For an accurate calculation, resample ms and add the padding as defined during param initialization
-        calc_modulation_trans, calc_modulation_phase = regularize_ms_calc_tf(
-            ms_modulation_trans, ms_modulation_phase, parameters
-        )
-        print(calc_modulation_trans.shape)
+        calc_modulation = regularize_ms_calc_complex(ms_modulation, parameters)
 
         # Get finely sampled field just above the sensor
-        (calc_modulation_trans, calc_modulation_phase,) = wavefront_pointsources_sensor_LTI(
-            point_source_locs, calc_modulation_trans, calc_modulation_phase, parameters, addCoeffs
+        calc_modulation = wavefront_pointsources_sensor_LTI_complex(
+            point_source_locs, calc_modulation, parameters, addCoeffs
         )
-        print(calc_modulation_trans.shape)
 
-        # After calculation is done, if radial symmetry was used, convert back to 2D
-        if parameters["radial_symmetry"]:
-            calc_modulation_trans = radial_2d_transform(tf.squeeze(calc_modulation_trans, 1))
-            calc_modulation_phase = radial_2d_transform_wrapped_phase(tf.squeeze(calc_modulation_phase, 1))
+        # After calculation is done, if radial symmetry was used, convert back to 2D unless override return radial
+        if parameters["radial_symmetry"] and convert_2D:
+            calc_modulation = radial_2d_transform_complex(tf.squeeze(calc_modulation, 1))
 
         ### Normalize by input source energy factor
-        calc_modulation_trans /= normby_transmittance
+        calc_modulation_trans = tf.math.abs(calc_modulation) / normby_transmittance
+        calc_modulation_phase = safe_angle(calc_modulation)
         calc_sensor_dx_m = parameters["calc_sensor_dx_m"]
 
     return (
@@ -391,6 +790,30 @@ def psf_sensor_LTI(
 def wavefront_pointsources_sensor_LTI(
     point_sources_locs, calc_modulation_trans, calc_modulation_phase, parameters, addCoeffs=True
 ):
+    """Computes the set of fields at the sensor grid for the LTI formulation. This is the amplitude and phase interface
+    to wavefront_pointsources_sensor_LTI_complex().
+
+    Args:
+        `point_sources_locs` (tf.float): Set of point-source coordinates to compute PSF for, of shape (N,3).
+        `calc_modulation_trans` (tf.float): Metasurface transmittance (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x']) 
+            or (1, 1, calc_samplesN["x"]).
+        `calc_modulation_phase` (tf.float): Metasurface phase (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x'])
+            or (1, 1, calc_samplesN["r"]).
+        `parameters` (prop_params): Settings object defining field propagation details.
+        `addCoeffs` (bool, optional): Boolean flag to include the correct phase coefficients.
+
+    Returns:
+        `tf.float64`: Field amplitude at the sensor plane
+        `tf.float64`: Field phase at the sensor plane
+    """
+    TF_ZERO = tf.cast(0.0, dtype=parameters["dtype"])
+    calc_modulation = tf.complex(calc_modulation_trans, TF_ZERO) * tf.exp(tf.complex(TF_ZERO, calc_modulation_phase))
+    wavefront = wavefront_pointsources_sensor_LTI_complex(point_sources_locs, calc_modulation, parameters, addCoeffs)
+
+    return tf.math.abs(wavefront), tf.math.angle(wavefront)
+
+
+def wavefront_pointsources_sensor_LTI_complex(point_sources_locs, calc_modulation, parameters, addCoeffs=True):
     """Computes the set of complex fields at the sensor grid, resulting from the illuminated, upsampled/padded phase 
     and transmittance modulation profiles. The incident wavefront at the metasurface corresponds to quadratic wavefronts 
     originating on axis and at depths specified in point_sources_locs. This function applies a linear, transtlationally
@@ -398,16 +821,14 @@ def wavefront_pointsources_sensor_LTI(
      
     Args:
         `point_sources_locs` (tf.float): Set of point-source coordinates to compute PSF for, of shape (N,3).
-        `calc_modulation_trans` (tf.float): Metasurface transmittance (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x']) 
-            or (1, 1, calc_samplesN["x"]).
-        `calc_modulation_phase` (tf.float): Metasurface phase (upsampled/padded) of shape (1, calc_samplesN['y'], calc_samplesN['x'])
-            or (1, 1, calc_samplesN["r"]).
+        `calc_modulation` (tf.complex): Metasurface complex modulation (upsampled/padded) of shape 
+            (1, calc_samplesN['y'], calc_samplesN['x']) or (1, 1, calc_samplesN["r"]).
         `parameters` (prop_params): Settings object defining field propagation details.
         `addCoeffs` (bool, optional): Boolean flag to include the correct phase coefficients.
 
     Returns:
-        `tf.float64`: Field amplitude after the metasurface, same shape as input
-        `tf.float64`: Field phase after the metasurface, same shape as input
+        `tf.complex`: Complex field at the sensor plane, of shape (N, calc_samplesN['y'], calc_samplesN['x']) or 
+            (N, 1, calc_samplesN["r"]).
     """
 
     # unpack the parameters
@@ -435,22 +856,23 @@ def wavefront_pointsources_sensor_LTI(
     point_source_loc_z = point_sources_locs[:, 2]
     point_source_loc_z = tf.expand_dims(tf.expand_dims(point_source_loc_z, -1), -1)
     angular_wave_number = 2 * np.pi / wavelength_m
-    quadWavefront = (calc_pixel_x ** 2 + calc_pixel_y ** 2) / 2 / point_source_loc_z + point_source_loc_z
+    # As in wavefront_pointSources_afterms, the large piston phase k*z is wrapped in double precision
+    piston_phase = tf.math.floormod(angular_wave_number * tf.cast(point_source_loc_z, tf.float64), 2 * np.pi)
+    quadPhase = angular_wave_number * (calc_pixel_x ** 2 + calc_pixel_y ** 2) / 2 / point_source_loc_z + tf.cast(
+        piston_phase, dtype
+    )
 
     TF_ZERO = tf.cast(0.0, dtype=dtype)
     ## The quadratic wavefront has factor 1/z but the true factor is 1/(i*wavelength*z)
     # wavefront_afterlens = tf.complex(calc_modulation_trans / point_source_loc_z, TF_ZERO) * tf.exp(
-    #     tf.complex(TF_ZERO, calc_modulation_phase + angular_wave_number * quadWavefront)
+    #     tf.complex(TF_ZERO, calc_modulation_phase + quadPhase)
     # )
     ## As done in wavefront_pointSources_afterms, we neglect the 1/z to aid normalization of psf to energy
-    wavefront_afterlens = tf.complex(calc_modulation_trans, TF_ZERO) * tf.exp(
-        tf.complex(TF_ZERO, calc_modulation_phase + angular_wave_number * quadWavefront)
-    )
+    wavefront_afterlens = calc_modulation * tf.exp(tf.complex(TF_ZERO, quadPhase))
 
     # Propagate the field to the sensor using the fresnel method
-    wavefront_ampl, wavefront_phase = fresnel_diffraction_fft(
-        tf.math.abs(wavefront_afterlens),
-        tf.math.angle(wavefront_afterlens),
+    wavefront = fresnel_diffraction_fft_complex(
+        wavefront_afterlens,
         wavelength_m,
         sensor_distance_m,
         calc_ms_dx_m,
@@ -462,20 +884,13 @@ def wavefront_pointsources_sensor_LTI(
 
     if addCoeffs:
         # Add the fresnel coefficients back in
-        wavefront_ampl, wavefront_phase = fresnel_diffraction_coeffs(
-            wavefront_ampl,
-            wavefront_phase,
-            wavelength_m,
-            sensor_distance_m,
-            calc_sensor_dx_m,
-            calc_samplesN,
-            dtype,
-            radial_symmetry,
+        wavefront = fresnel_diffraction_coeffs_complex(
+            wavefront, wavelength_m, sensor_distance_m, calc_sensor_dx_m, calc_samplesN, dtype, radial_symmetry,
         )
 
         # Add the LTI coefficient (This is the replacement of the object space quad wavefront with a magnified object space quad wavefront)
         # as explained in goodman ed 4, ch 6.3.2
-        wavefront_phase += LTI_sensorplane_phaseterm(
+        LTI_phase = LTI_sensorplane_phaseterm(
             point_sources_locs,
             wavelength_m,
             sensor_distance_m,
@@ -484,8 +899,9 @@ def wavefront_pointsources_sensor_LTI(
             dtype,
             radial_symmetry,
         )
+        wavefront = wavefront * tf.exp(tf.complex(TF_ZERO, LTI_phase))
 
-    return wavefront_ampl, wavefront_phase
+    return wavefront
 
 
 def LTI_sensorplane_phaseterm(
@@ -499,7 +915,7 @@ def LTI_sensorplane_phaseterm(
         `distance_m` (tf.float): Tf constant corresponding to the distance propagated (should match that used in the fresnel_diffraction call)
         `output_pixel_size_m` (dict): Output field grid discretization/pitch in units of m, via dictionary {"x": float, "y": float}.
         `output_pixel_number` (dict): Output field grid length in terms of number of pixels, via dictionary {"x": float, "y": float}.
-        `dtype` (tf.dtype): Datatype to be used in the tensorflow calculation; Only tf.float64 is currently supported.
+        `dtype` (tf.dtype): Datatype to be used in the tensorflow calculation, either tf.float64 or tf.float32.
         `radial_symmetry` (bool): Flag indicating if radial symmetry is used. 
         
     Returns
@@ -507,30 +923,31 @@ def LTI_sensorplane_phaseterm(
             or (1, 1, calc_samplesN["r"]).
     """
 
-    # Define sensor plane coords
+    # Define sensor plane coords (in double precision, as in fresnel_output_phase)
     if radial_symmetry:
         output_pixel_x, output_pixel_y = tf.meshgrid(
-            tf.range(output_pixel_number["r"], dtype=dtype), tf.range(1, dtype=dtype),
+            tf.range(output_pixel_number["r"], dtype=tf.float64), tf.range(1, dtype=tf.float64),
         )
     else:
         output_pixel_x, output_pixel_y = tf.meshgrid(
-            tf.range(output_pixel_number["x"], dtype=dtype), tf.range(output_pixel_number["y"], dtype=dtype),
+            tf.range(output_pixel_number["x"], dtype=tf.float64), tf.range(output_pixel_number["y"], dtype=tf.float64),
         )
-        output_pixel_x = output_pixel_x - (tf.shape(output_pixel_x)[1] - 1) / 2
-        output_pixel_y = output_pixel_y - (tf.shape(output_pixel_y)[0] - 1) / 2
+        output_pixel_x = output_pixel_x - (output_pixel_number["x"] - 1) / 2
+        output_pixel_y = output_pixel_y - (output_pixel_number["y"] - 1) / 2
     output_pixel_x = output_pixel_x * output_pixel_size_m["x"]
     output_pixel_y = output_pixel_y * output_pixel_size_m["y"]
     output_pixel_x = tf.expand_dims(output_pixel_x, 0)
     output_pixel_y = tf.expand_dims(output_pixel_y, 0)
 
     # Create the magnification, dependent quad phase factor
-    point_source_loc_z = point_sources_locs[:, 2]
+    point_source_loc_z = tf.cast(point_sources_locs[:, 2], tf.float64)
     point_source_loc_z = tf.expand_dims(tf.expand_dims(point_source_loc_z, -1), -1)
-    angular_wave_number = 2 * np.pi / wavelength_m
+    angular_wave_number = 2 * np.pi / tf.cast(wavelength_m, tf.float64)
 
-    magnification = -distance_m / point_source_loc_z
+    magnification = -tf.cast(distance_m, tf.float64) / point_source_loc_z
     phaseterm = (
         angular_wave_number / 2 / point_source_loc_z / magnification ** 2 * (output_pixel_x ** 2 + output_pixel_y ** 2)
     )
 
-    return phaseterm
+    # As in fresnel_output_phase, the phase is wrapped in double precision before the cast to dtype
+    return tf.cast(tf.math.floormod(phaseterm, 2 * np.pi), dtype)
@@ -0,0 +1,226 @@
+import numpy as np
+import tensorflow as tf
+
+
+def field_coordinates(point_source_locs):
+    """Returns the field coordinates used to interpolate PSFs: the tangents of the field angles along x and y and the
+    inverse depth of each point-source.
+
+    Args:
+        `point_source_locs` (float): Point-source coordinates, of shape (N,3).
+
+    Returns:
+        `np.float`: Field coordinates (tan_x, tan_y, 1/z) of shape (N,3).
+    """
+    point_source_locs = np.asarray(point_source_locs, dtype=np.float64)
+    inverse_depth = 1.0 / point_source_locs[:, 2]
+
+    return np.stack(
+        [point_source_locs[:, 0] * inverse_depth, point_source_locs[:, 1] * inverse_depth, inverse_depth], axis=-1
+    )
+
+
+def node_axis(min_value, max_value, samples):
+    """Returns a uniformly spaced node axis; a single node is placed at the midpoint.
+
+    Args:
+        `min_value` (float): First node coordinate.
+        `max_value` (float): Last node coordinate.
+        `samples` (int): Number of nodes.
+
+    Returns:
+        `np.float`: Node coordinates of shape (samples,).
+    """
+    if samples == 1:
+        return np.array([(min_value + max_value) / 2])
+
+    return np.linspace(min_value, max_value, samples)
+
+
+def node_point_sources(node_axes):
+    """Returns the point-source coordinates of every node on a regular grid of field coordinates.
+
+    Args:
+        `node_axes` (list): Node axes of the field coordinates (tan_x, tan_y, 1/z), each a 1D array.
+
+    Returns:
+        `np.float`: Point-source coordinates of shape (num_nodes, 3), ordered with the last axis varying fastest.
+    """
+    tan_x, tan_y, inverse_depth = [grid.flatten() for grid in np.meshgrid(*node_axes, indexing="ij")]
+    depth = 1.0 / inverse_depth
+
+    return np.stack([tan_x * depth, tan_y * depth, depth], axis=-1)
+
+
+def multilinear_weights(query_coordinates, node_axes):
+    """Returns the multilinear interpolation weights of query coordinates on a regular grid of nodes.
+
+    Query coordinates outside of the node range are clipped to the boundary, i.e. the nodes are never extrapolated.
+
+    Args:
+        `query_coordinates` (np.float): Coordinates of the query points, of shape (N, len(node_axes)).
+        `node_axes` (list): Uniformly spaced node coordinates along each axis, each a 1D array.
+
+    Returns:
+        `np.float`: Weight matrix of shape (N, num_nodes), with the nodes ordered with the last axis varying fastest.
+    """
+    query_coordinates = np.asarray(query_coordinates, dtype=np.float64)
+    num_query = query_coordinates.shape[0]
+    axis_lengths = [len(axis) for axis in node_axes]
+
+    # Lower node index and fractional position of the query along each axis
+    lower_index = []
+    fraction = []
+    for dim, axis in enumerate(node_axes):
+        if len(axis) == 1:
+            lower_index.append(np.zeros(num_query, dtype=np.int64))
+            fraction.append(np.zeros(num_query))
+            continue
+        position = np.clip((query_coordinates[:, dim] - axis[0]) / (axis[1] - axis[0]), 0, len(axis) - 1)
+        lower = np.minimum(np.floor(position).astype(np.int64), len(axis) - 2)
+        lower_index.append(lower)
+        fraction.append(position - lower)
+
+    # Accumulate the weight of every corner of the enclosing cell
+    weights = np.zeros((num_query, int(np.prod(axis_lengths))))
+    query_index = np.arange(num_query)
+    for corner in np.ndindex(*[2] * len(node_axes)):
+        corner_weight = np.ones(num_query)
+        node_index = np.zeros(num_query, dtype=np.int64)
+        for dim, offset in enumerate(corner):
+            corner_weight = corner_weight * (fraction[dim] if offset else 1 - fraction[dim])
+            index = np.minimum(lower_index[dim] + offset, axis_lengths[dim] - 1)
+            node_index = node_index * axis_lengths[dim] + index
+        np.add.at(weights, (query_index, node_index), corner_weight)
+
+    return weights
+
+
+def psf_centroid(psf):
+    """Returns the intensity-weighted centroid of PSFs, in pixels relative to the center of the detector.
+
+    Args:
+        `psf` (tf.float): PSF intensity of shape (..., Ny, Nx).
+
+    Returns:
+        `tf.float`: Centroid (y, x) of shape (..., 2).
+    """
+    ny, nx = psf.shape[-2], psf.shape[-1]
+    pixel_y = tf.range(ny, dtype=psf.dtype) - (ny - 1) / 2
+    pixel_x = tf.range(nx, dtype=psf.dtype) - (nx - 1) / 2
+    energy = tf.reduce_sum(psf, axis=[-2, -1])
+    centroid_y = tf.reduce_sum(tf.reduce_sum(psf, axis=-1) * pixel_y, axis=-1) / energy
+    centroid_x = tf.reduce_sum(tf.reduce_sum(psf, axis=-2) * pixel_x, axis=-1) / energy
+
+    return tf.stack([centroid_y, centroid_x], axis=-1)
+
+
+def shift_psf(psf, shift):
+    """Shifts PSFs by a (sub-pixel) number of pixels via the Fourier shift theorem.
+
+    The PSFs are zero-padded by half their size on each side before the shift so that the energy shifted beyond the
+    detector is dropped rather than wrapped around.
+
+    Args:
+        `psf` (tf.float): PSF intensity of shape (..., Ny, Nx).
+        `shift` (tf.float): Shift (y, x) in pixels, of shape (..., 2), with the leading dimensions matching psf.
+
+    Returns:
+        `tf.float`: Shifted PSF intensity of shape (..., Ny, Nx).
+    """
+    dtype = psf.dtype
+    ny, nx = psf.shape[-2], psf.shape[-1]
+    pad_y, pad_x = ny // 2, nx // 2
+    batch_rank = len(psf.shape) - 2
+    padded = tf.pad(psf, [[0, 0]] * batch_rank + [[pad_y, pad_y], [pad_x, pad_x]])
+
+    freq_y = tf.constant(np.fft.fftfreq(ny + 2 * pad_y)[:, None], dtype=dtype)
+    freq_x = tf.constant(np.fft.fftfreq(nx + 2 * pad_x)[None, :], dtype=dtype)
+    shift_y = shift[..., 0, None, None]
+    shift_x = shift[..., 1, None, None]
+    TF_ZERO = tf.cast(0.0, dtype=dtype)
+    ramp = tf.exp(tf.complex(TF_ZERO, -2 * np.pi * (freq_y * shift_y + freq_x * shift_x)))
+
+    shifted = tf.math.real(tf.signal.ifft2d(tf.signal.fft2d(tf.complex(padded, TF_ZERO)) * ramp))
+
+    return shifted[..., pad_y : pad_y + ny, pad_x : pad_x + nx]
+
+
+def register_psf_bank(psf, rank=None):
+    """Registers a bank of PSFs to the detector center and optionally compresses the registered PSFs to a low-rank
+    basis.
+
+    Args:
+        `psf` (tf.float): PSF intensity at the nodes, of shape (num_wl, profile_batch, num_nodes, Ny, Nx).
+        `rank` (int, optional): Number of singular vectors kept for the registered PSFs. Defaults to None, in which
+            case the registered PSFs are stored directly.
+
+    Returns:
+        `dict`: PSF bank with the node centroids ("centroid", of shape (num_wl, profile_batch, num_nodes, 2)) and
+            either the registered PSFs ("registered", the same shape as psf) or the low-rank node coefficients
+            ("coefficients", of shape (num_wl, profile_batch, num_nodes, rank)) and basis ("basis", of shape
+            (num_wl, profile_batch, rank, Ny, Nx)).
+    """
+    centroid = psf_centroid(psf)
+    registered = shift_psf(psf, -centroid)
+    if rank is None:
+        return {"centroid": centroid, "registered": registered}
+
+    shape = registered.shape
+    s, u, v = tf.linalg.svd(tf.reshape(registered, [shape[0], shape[1], shape[2], -1]))
+    coefficients = u[..., :rank] * tf.expand_dims(s[..., :rank], -2)
+    basis = tf.reshape(tf.linalg.matrix_transpose(v[..., :rank]), [shape[0], shape[1], -1, shape[3], shape[4]])
+
+    return {"centroid": centroid, "coefficients": coefficients, "basis": basis}
+
+
+def interpolate_psf_bank(bank, weights):
+    """Interpolates a registered PSF bank: the registered PSFs (or low-rank coefficients) and the centroids are blended
+    with the given weights and the blended PSFs are shifted to the blended centroids.
+
+    Args:
+        `bank` (dict): PSF bank as returned by register_psf_bank().
+        `weights` (tf.float): Interpolation weights of shape (N, num_nodes).
+
+    Returns:
+        `tf.float`: Interpolated PSF intensity of shape (num_wl, profile_batch, N, Ny, Nx). Small negative values
+            from the sub-pixel shifts are clipped to zero.
+    """
+    centroid = tf.einsum("qn,lbnc->lbqc", weights, bank["centroid"])
+    if "registered" in bank:
+        psf = tf.einsum("qn,lbnyx->lbqyx", weights, bank["registered"])
+    else:
+        coefficients = tf.einsum("qn,lbnr->lbqr", weights, bank["coefficients"])
+        psf = tf.einsum("lbqr,lbryx->lbqyx", coefficients, bank["basis"])
+
+    return tf.maximum(shift_psf(psf, centroid), 0.0)
+
+
+def linear_weights(query_coordinates, nodes):
+    """Returns the linear interpolation weights of query coordinates on a sorted, possibly non-uniform, node axis.
+
+    Query coordinates outside of the node range are clipped to the boundary, i.e. the nodes are never extrapolated.
+
+    Args:
+        `query_coordinates` (np.float): Coordinates of the query points, of shape (N,).
+        `nodes` (np.float): Sorted node coordinates, of shape (num_nodes,).
+
+    Returns:
+        `np.float`: Weight matrix of shape (N, num_nodes).
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    query_coordinates = np.clip(np.asarray(query_coordinates, dtype=np.float64), nodes[0], nodes[-1])
+    num_query = query_coordinates.shape[0]
+    if len(nodes) == 1:
+        return np.ones((num_query, 1))
+
+    upper = np.clip(np.searchsorted(nodes, query_coordinates, side="right"), 1, len(nodes) - 1)
+    lower = upper - 1
+    fraction = (query_coordinates - nodes[lower]) / (nodes[upper] - nodes[lower])
+
+    weights = np.zeros((num_query, len(nodes)))
+    query_index = np.arange(num_query)
+    np.add.at(weights, (query_index, lower), 1 - fraction)
+    np.add.at(weights, (query_index, upper), fraction)
+
+    return weights
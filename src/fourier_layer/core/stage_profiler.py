@@ -0,0 +1,261 @@
+import contextlib
+import json
+import math
+import time
+import numpy as np
+import tensorflow as tf
+
+# Profile collecting the stages of the current layer call; None when profiling is disabled
+_active_profile = None
+
+
+class call_profile:
+    """Per-stage timing, FLOP estimate, and memory record of a single (eager) layer call.
+
+    Stages are recorded by the core calls through profile_stage() while the profile is active (see
+    collect_profile()). The wall time of a stage includes a device synchronization at its end so that asynchronous
+    GPU execution is attributed to the stage that launched it. The peak tensor bytes of a stage are the bytes of its
+    input and output tensors or, on GPU, the allocator peak during the stage if larger. Stages are also annotated as
+    TF profiler trace events, so they appear in a capture made with tf.profiler.experimental.start().
+
+    Attributes:
+        `name` (str): Name of the profiled call (e.g. the layer class).
+        `stages` (list): Stage records in call order, each a dictionary with keys "name", "detail", "start_s",
+            "wall_s", "flops", and "peak_bytes".
+        `total_s` (float): Wall time of the whole call.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.total_s = None
+        self.__start = time.perf_counter()
+        gpus = tf.config.list_logical_devices("GPU")
+        self.gpu_device = gpus[0].name if gpus else None
+
+    def elapsed(self):
+        """Returns the time since the start of the call, in seconds."""
+        return time.perf_counter() - self.__start
+
+    def finish(self):
+        """Records the wall time of the whole call."""
+        self.total_s = self.elapsed()
+
+    def summary(self):
+        """Returns the stage records aggregated by stage name, in order of first occurrence.
+
+        Returns:
+            `dict`: For each stage name, the number of calls ("calls"), the total wall time ("wall_s") and FLOP
+                estimate ("flops"), and the largest peak tensor bytes ("peak_bytes").
+        """
+        summary = {}
+        for stage in self.stages:
+            entry = summary.setdefault(stage["name"], {"calls": 0, "wall_s": 0.0, "flops": 0, "peak_bytes": 0})
+            entry["calls"] += 1
+            entry["wall_s"] += stage["wall_s"]
+            entry["flops"] += stage["flops"]
+            entry["peak_bytes"] = max(entry["peak_bytes"], stage["peak_bytes"])
+
+        return summary
+
+    def report(self):
+        """Returns the profile as a JSON-serializable dictionary with the call name, total wall time, the aggregated
+        stages (see summary), and the individual stage records."""
+        return {"name": self.name, "total_s": self.total_s, "stages": self.summary(), "records": list(self.stages)}
+
+    def export_trace(self, path):
+        """Writes the stage records as trace events (chrome trace JSON format), which may be opened in the trace viewer
+        of the TF profiler, chrome://tracing, or Perfetto.
+
+        Args:
+            `path` (str): Output file path.
+        """
+        events = [
+            {
+                "name": stage["name"],
+                "ph": "X",
+                "pid": 0,
+                "tid": 0,
+                "ts": stage["start_s"] * 1e6,
+                "dur": stage["wall_s"] * 1e6,
+                "args": {"detail": stage["detail"], "flops": stage["flops"], "peak_bytes": stage["peak_bytes"]},
+            }
+            for stage in self.stages
+        ]
+        if self.total_s is not None:
+            events.insert(0, {"name": self.name, "ph": "X", "pid": 0, "tid": 1, "ts": 0, "dur": self.total_s * 1e6})
+
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+        return
+
+    def __str__(self):
+        lines = ["{:<28}{:>8}{:>14}{:>14}{:>14}".format(self.name, "calls", "wall (ms)", "GFLOP", "peak (MB)")]
+        for name, entry in self.summary().items():
+            lines.append(
+                "{:<28}{:>8}{:>14.3f}{:>14.4f}{:>14.2f}".format(
+                    name, entry["calls"], entry["wall_s"] * 1e3, entry["flops"] / 1e9, entry["peak_bytes"] / 2 ** 20
+                )
+            )
+        if self.total_s is not None:
+            lines.append("{:<28}{:>8}{:>14.3f}".format("total", "", self.total_s * 1e3))
+
+        return "\n".join(lines)
+
+
+class stage_record:
+    # Handle yielded by profile_stage(); the stage outputs are registered for synchronization and memory accounting
+    def __init__(self):
+        self.tensors = []
+
+    def outputs(self, *tensors):
+        self.tensors.extend(tensor for tensor in tensors if tensor is not None)
+
+
+class disabled_stage_record:
+    # Handle yielded by profile_stage() when profiling is disabled
+    def outputs(self, *tensors):
+        return
+
+
+_DISABLED_STAGE = disabled_stage_record()
+
+
+@contextlib.contextmanager
+def collect_profile(enabled, name):
+    """Activates a call_profile for the stages run within the context, if enabled. Nested activations keep the
+    outermost profile.
+
+    Args:
+        `enabled` (bool): If False, nothing is recorded and None is yielded.
+        `name` (str): Name of the profiled call.
+
+    Yields:
+        `call_profile`: The active profile, or None if disabled, if an outer profile is already active, or if not
+            executing eagerly (e.g. while tracing a tf.function).
+    """
+    global _active_profile
+    if not enabled or _active_profile is not None or not tf.executing_eagerly():
+        yield None
+        return
+
+    profile = call_profile(name)
+    _active_profile = profile
+    try:
+        with tf.profiler.experimental.Trace(name):
+            yield profile
+    finally:
+        _active_profile = None
+        profile.finish()
+
+
+@contextlib.contextmanager
+def profile_stage(name, inputs=(), flops=None, detail=""):
+    """Records a stage of the active profile. When no profile is active, or when not executing eagerly, this is a
+    no-op; the FLOP estimate is then never evaluated.
+
+    Args:
+        `name` (str): Stage name.
+        `inputs` (list, optional): Input tensors of the stage, counted in the peak tensor bytes. Defaults to ().
+        `flops` (callable, optional): Function returning the FLOP estimate of the stage. Defaults to None.
+        `detail` (str, optional): Additional description of the stage (e.g. the transform used). Defaults to "".
+
+    Yields:
+        Stage handle; the stage output tensors are registered by calling its outputs(*tensors) method.
+    """
+    profile = _active_profile
+    if profile is None or not tf.executing_eagerly():
+        yield _DISABLED_STAGE
+        return
+
+    record = stage_record()
+    if profile.gpu_device is not None:
+        tf.config.experimental.reset_memory_stats(profile.gpu_device)
+    start_s = profile.elapsed()
+    with tf.profiler.experimental.Trace(name, detail=detail):
+        yield record
+        sync_stage_outputs(record.tensors)
+    wall_s = profile.elapsed() - start_s
+
+    peak_bytes = sum(tensor_bytes(tensor) for tensor in list(inputs) + record.tensors)
+    if profile.gpu_device is not None:
+        peak_bytes = max(peak_bytes, tf.config.experimental.get_memory_info(profile.gpu_device)["peak"])
+
+    profile.stages.append(
+        {
+            "name": name,
+            "detail": detail,
+            "start_s": start_s,
+            "wall_s": wall_s,
+            "flops": int(flops()) if flops is not None else 0,
+            "peak_bytes": int(peak_bytes),
+        }
+    )
+
+    return
+
+
+def sync_stage_outputs(tensors):
+    """Blocks until the devices have finished the work of a stage. Uses tf.test.experimental.sync_devices where 
+    available (TF >= 2.12); otherwise, reads back one element of each registered stage output.
+
+    Args:
+        `tensors` (list): Output tensors registered for the stage.
+    """
+    if hasattr(tf.test.experimental, "sync_devices"):
+        tf.test.experimental.sync_devices()
+        return
+
+    for tensor in tensors:
+        if isinstance(tensor, tf.Tensor) and tensor.shape.num_elements() != 0:
+            tf.reshape(tensor, [-1])[-1:].numpy()
+
+    return
+
+
+def tensor_bytes(tensor):
+    """Returns the size of a tensor (or array) in bytes."""
+    return int(np.prod(tensor.shape)) * tf.as_dtype(tensor.dtype).size
+
+
+def fft_flops(shape, num_transforms=1):
+    """Returns the conventional 5 N log2(N) FLOP estimate of complex FFTs over the last len(shape) dimensions.
+
+    Args:
+        `shape` (list): Transform lengths.
+        `num_transforms` (int, optional): Number of transforms (batch size). Defaults to 1.
+
+    Returns:
+        `float`: FLOP estimate.
+    """
+    length = float(np.prod(shape))
+    return 5 * length * math.log2(max(length, 1)) * num_transforms
+
+
+def matmul_flops(m, k, n, batch=1, is_complex=False):
+    """Returns the FLOP estimate of a batched (m x k) by (k x n) matrix product.
+
+    Args:
+        `m`, `k`, `n` (int): Matrix dimensions.
+        `batch` (int, optional): Number of products. Defaults to 1.
+        `is_complex` (bool, optional): If True, the operands are complex. Defaults to False.
+
+    Returns:
+        `float`: FLOP estimate.
+    """
+    return 2.0 * m * k * n * batch * (4 if is_complex else 1)
+
+
+def elementwise_flops(shape, ops_per_element=1, is_complex=False):
+    """Returns the FLOP estimate of elementwise operations on a tensor; complex elements count as two.
+
+    Args:
+        `shape` (list): Shape of the tensor operated on.
+        `ops_per_element` (int, optional): Number of operations per element. Defaults to 1.
+        `is_complex` (bool, optional): If True, the elements are complex. Defaults to False.
+
+    Returns:
+        `float`: FLOP estimate.
+    """
+    return float(np.prod(shape)) * ops_per_element * (2 if is_complex else 1)
@@ -1,7 +1,23 @@
 import tensorflow as tf
+import numpy as np
 from data_structure import prop_params
 from .core.field_aperture import gen_aperture_disk
 from .core.batched_FourierOpt import *
+from .core.propagation_plan import propagation_plan, validate_plan
+from .core.otf_compute import broadband_batched_otf_sensor
+from .core.stage_profiler import collect_profile
+from .core.focal_stack import focal_stack_terms, focal_stack_propagation
+from .core.cascade import cascade_gap_plans, cascaded_field_propagation
+from .psf_store import psf_store_key
+from .core.psf_interpolation import (
+    field_coordinates,
+    node_axis,
+    node_point_sources,
+    multilinear_weights,
+    register_psf_bank,
+    interpolate_psf_bank,
+    linear_weights,
+)
 
 
 def check_single_wavelength_parameters(parameters):
@@ -19,6 +35,38 @@ def check_broadband_wavelength_parameters(parameters):
     return
 
 
+def check_chunk_size(chunk_size):
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError("chunk_size must be None or a positive integer")
+    return
+
+
+def inference_call(inputs, training):
+    # Cached and stored results carry no gradient so they are only used when the caller requests inference explicitly
+    # or when no input is a TF tensor (a numpy input cannot be watched by a gradient tape)
+    if training is not None:
+        return not training
+    return not any(tf.is_tensor(data) for data in inputs)
+
+
+def check_cascade_parameters(parameters, element_gaps_m):
+    if not all(distance_m > 0 for distance_m in element_gaps_m):
+        raise ValueError("element_gaps_m must be positive")
+
+    if element_gaps_m and parameters["ms_upsampling"] == "cell_aperture":
+        raise ValueError("ms_upsampling 'cell_aperture' cannot be used for a cascade of elements")
+    return
+
+
+def check_focal_stack_distances(distances_m):
+    if len(distances_m) == 0:
+        raise ValueError("distances_m must contain at least one distance")
+
+    if not all(distance_m > 0 for distance_m in distances_m):
+        raise ValueError("distances_m must be positive")
+    return
+
+
 class PSF_Layer_Mono(tf.keras.layers.Layer):
     """Fourier optics-based, point-spread function computing instance (single prop_param setting configuration and 
     single wavelength). Computes the psf(s) of the optical system for different point-source(s), given metasurface 
@@ -29,24 +77,47 @@ class PSF_Layer_Mono(tf.keras.layers.Layer):
 
     Attributes:
         `parameters` (prop_params): Single settings object used during initialization of propagator.
+        `chunk_size` (int): Maximum number of fields propagated at once (None for a single pass).
+        `intensity_only` (bool): If True, the layer returns only the PSF intensity and never computes the phase.
+        `plan` (propagation_plan): Precomputed static tensors for the propagation, rebuilt if the parameters change.
         `aperture_trans` (tf.float64): Pre-metasurface field aperture used in calculation, of shape 
             (1, ms_samplesM["y"], ms_samplesM["x"]).
+        `profile` (bool): If True, each eager call records a per-stage profile.
+        `last_profile` (call_profile): Per-stage profile of the last profiled call (None until then).
+        `recompute` (bool): If True, intermediate tensors are recomputed during backpropagation instead of stored.
     """
 
-    def __init__(self, parameters):
+    def __init__(self, parameters, chunk_size=None, intensity_only=False, profile=False, recompute=False):
         """Fourier PSF Layer Initialization.
     
         Args:
             `parameters` (prop_param): Settings object defining field propagation details. Wavelength for calculation 
                 is set by parameters["wavelength_m"].
+            `chunk_size` (int, optional): Maximum number of fields (profile and point-source pairs) propagated at once.
+                Defaults to None, in which case all profiles and point-sources are computed in a single pass.
+            `intensity_only` (bool, optional): If True, only the PSF intensity is computed and returned; the phase is 
+                never computed, resampled, or stored. Defaults to False.
+            `profile` (bool, optional): If True, the wall time, FLOP estimate, and peak tensor bytes of each stage of
+                an eager call are recorded in last_profile (see stage_profiler). Defaults to False.
+            `recompute` (bool, optional): If True, the intermediate tensors of each chunk are discarded after the 
+                forward pass and recomputed during backpropagation, so that the memory of a gradient computation scales
+                with chunk_size rather than with the full stack. Defaults to False.
 
         Raises: 
             KeyError: parameters object must have 'wavelength_m' defined.
             ValueError: The 'wavelength_m' value must be a single float.
+            ValueError: chunk_size must be None or a positive integer.
         """
         super(PSF_Layer_Mono, self).__init__()
         self.parameters = parameters
+        self.chunk_size = chunk_size
+        self.intensity_only = intensity_only
+        self.profile = profile
+        self.last_profile = None
+        self.recompute = recompute
         check_single_wavelength_parameters(parameters)
+        check_chunk_size(chunk_size)
+        self.plan = propagation_plan(parameters)
 
         aperture_trans, sqrt_energy_illum = gen_aperture_disk(parameters)
         self.__sqrt_energy_illum = tf.convert_to_tensor(sqrt_energy_illum, dtype=parameters["dtype"])
@@ -73,7 +144,8 @@ class PSF_Layer_Mono(tf.keras.layers.Layer):
         Returns:
             `list`: List containing the detector measured PSF intensity in the first argument and the phase in the 
                 second argument, of shape 
-                (1, profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"])
+                (1, profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"]). If the layer
+                was initialized with intensity_only, only the intensity tensor is returned.
         """
         ms_trans = inputs[0]
         ms_phase = inputs[1]
@@ -97,7 +169,23 @@ class PSF_Layer_Mono(tf.keras.layers.Layer):
         # Apply the metasurface aperture
         ms_trans = ms_trans * self.aperture_trans
 
-        return batched_psf_measured(ms_trans, ms_phase, self.__sqrt_energy_illum, point_source_locs, self.parameters)
+        self.plan = validate_plan(self.plan, self.parameters)
+        with collect_profile(self.profile, "PSF_Layer_Mono") as profile:
+            psfs = batched_psf_measured(
+                ms_trans,
+                ms_phase,
+                self.__sqrt_energy_illum,
+                point_source_locs,
+                self.parameters,
+                self.chunk_size,
+                self.plan,
+                self.intensity_only,
+                self.recompute,
+            )
+        if profile is not None:
+            self.last_profile = profile
+
+        return psfs
 
 
 class PSF_Layer(tf.keras.layers.Layer):
@@ -111,37 +199,97 @@ class PSF_Layer(tf.keras.layers.Layer):
         `parameters` (prop_params): Single settings object used during initialization of propagator.
         `parameters_list` (list of prop_params objects): A list of prop_param configuration objects 
             initialized for each wavelength in the set.   
+        `chunk_size` (int): Maximum number of fields propagated at once per wavelength (None for a single pass).
+        `intensity_only` (bool): If True, the layer returns only the PSF intensity and never computes the phase.
+        `plans` (list of propagation_plan objects): Precomputed static tensors for each wavelength in the set, 
+            built once for parameters_list.
         `aperture_trans` (tf.float64): Pre-metasurface field aperture used in calculation, of shape 
             (1, ms_samplesM["y"], ms_samplesM["x"]).
+        `depth_cache` (dict): On-axis PSF intensity cached at depth nodes (see build_depth_cache); None until built.
+        `store` (psf_store): On-disk PSF store consulted by the layer call in inference mode (None if not used).
+        `profile` (bool): If True, each eager call records a per-stage profile.
+        `last_profile` (call_profile): Per-stage profile of the last profiled call (None until then).
+        `jit_compile` (bool): If True, the PSF computation is traced once per input signature and compiled with XLA.
+        `max_traces` (int): Maximum number of input signatures traced in compiled mode.
+        `traced_signatures` (list): Input signatures (shapes, dtypes, and intensity_only flag) traced so far.
+        `recompute` (bool): If True, intermediate tensors are recomputed during backpropagation instead of stored.
     """
 
-    def __init__(self, parameters):
+    def __init__(
+        self,
+        parameters,
+        chunk_size=None,
+        intensity_only=False,
+        store=None,
+        profile=False,
+        jit_compile=False,
+        max_traces=4,
+        recompute=False,
+    ):
         """Fourier PSF Layer Initialization.
 
         Args:
             `parameters` (prop_param): Settings object defining field propagation details. The set of wavelengths for 
                 the calculation is defined by key 'wavelength_set_m'.
+            `chunk_size` (int, optional): Maximum number of fields (profile and point-source pairs) propagated at once
+                for each wavelength channel. Defaults to None, in which case all profiles and point-sources are 
+                computed in a single pass.
+            `intensity_only` (bool, optional): If True, only the PSF intensity is computed and returned; the phase is 
+                never computed, resampled, or stored. Defaults to False.
+            `store` (psf_store, optional): On-disk PSF store; in inference mode, the layer call returns stored PSFs 
+                for previously evaluated profiles and point-sources and stores new results. Defaults to None.
+            `profile` (bool, optional): If True, the wall time, FLOP estimate, and peak tensor bytes of each stage of
+                an eager call are recorded in last_profile (see stage_profiler). Defaults to False.
+            `jit_compile` (bool, optional): If True, the full PSF computation (over all wavelengths) is traced once
+                per input signature as a tf.function and compiled with XLA, so repeated calls with inputs of the same
+                shape (e.g. in an optimization loop) pay no python overhead and the elementwise stages are fused.
+                Stages are not profiled in compiled mode. Defaults to False.
+            `max_traces` (int, optional): Maximum number of input signatures traced in compiled mode; a call with a
+                new signature beyond it raises an error rather than silently retracing. Defaults to 4.
+            `recompute` (bool, optional): If True, the intermediate tensors of each wavelength channel and chunk are
+                discarded after the forward pass and recomputed during backpropagation (gradient checkpointing), so
+                that the memory of a gradient computation scales with a single chunk rather than with the full
+                broadband stack. Defaults to False.
         
         Raises:
             KeyError: 'wavelength_set_m' must be defined in the parameters object.
+            ValueError: chunk_size must be None or a positive integer.
         """
         super(PSF_Layer, self).__init__()
         self.parameters = parameters
+        self.chunk_size = chunk_size
+        self.intensity_only = intensity_only
+        self.store = store
+        self.profile = profile
+        self.last_profile = None
+        self.jit_compile = jit_compile
+        self.max_traces = max_traces
+        self.traced_signatures = []
+        self.__compiled_psf = None
+        self.recompute = recompute
         check_broadband_wavelength_parameters(parameters)
+        check_chunk_size(chunk_size)
 
         # Generate the Fourier grids for each wavelength
         self.parameters_list = self.__generate_simParam_set()
+        self.plans = [propagation_plan(parameters) for parameters in self.parameters_list]
+        self.depth_cache = None
 
         aperture_trans, sqrt_energy_illum = gen_aperture_disk(parameters)
         self.__sqrt_energy_illum = tf.convert_to_tensor(sqrt_energy_illum, dtype=parameters["dtype"])
         self.aperture_trans = tf.convert_to_tensor(aperture_trans, dtype=parameters["dtype"])
 
-    def __call__(self, inputs, point_source_locs):
+    def __call__(self, inputs, point_source_locs, training=None):
         """The psf_broadband_layer call function. Computes the PSF, given a set of point_source_locs and a set of phase
         and transmittance profiles for each wavelength in the set. This call enables overloading, such that the
         metasurface profiles may be uniquely defined for each wavelength or assumed to be the same across wavelength 
         channels.
 
+        If the layer has a store, it is consulted in inference mode: results are keyed by the settings, profiles, and
+        point-sources, and previously stored PSFs are read back instead of being recomputed. Stored PSFs carry no 
+        gradient so the store is only consulted in eager calls with training=False, or with training=None if none of
+        the inputs is a TF tensor (e.g. numpy profiles and point-sources).
+
         For a polarization-sensitive metasurface, a stacked pair of phase and transmittance profiles may be passed in 
         at once, corresponding to the optical response on two orthogonal, polarization basis states for each wavelength
         channel in the set. The metasurface batch dimension may be more generally used to represent the phase and 
@@ -160,12 +308,155 @@ class PSF_Layer(tf.keras.layers.Layer):
                 same across wavelength, one may pass in phase of shape, (profile_batch, ms_samplesM['y'], ms_samplesM['x'])
                 or (profile_batch, 1, ms_samplesM['r']).
             `point_source_locs` (float): Tensor of point-source coordinates, of shape (N,3).
+            `training` (bool, optional): Flag indicating if the call is used for training. Defaults to None, in which 
+                case the call is treated as inference only if none of the inputs is a TF tensor.
 
         Returns:
             `list`: List containing the detector measured PSF intensity in the first argument and the phase in the 
                 second argument, of shape 
-                (len(wavelength_set_m), profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"])
+                (len(wavelength_set_m), profile_batch, num_point_sources, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+                If the layer was initialized with intensity_only, only the intensity tensor is returned.
         """
+        with collect_profile(self.profile, "PSF_Layer") as profile:
+            psfs = self.__stored_or_computed_psf(inputs, point_source_locs, training)
+        if profile is not None:
+            self.last_profile = profile
+
+        return psfs
+
+    def __stored_or_computed_psf(self, inputs, point_source_locs, training):
+        inference = inference_call(list(inputs) + [point_source_locs], training)
+        if self.store is None or not inference or not tf.executing_eagerly():
+            return self.__compute_psf(inputs, point_source_locs, self.intensity_only)
+
+        key = psf_store_key(self.parameters, inputs, point_source_locs)
+        stored = self.store.get(key, self.intensity_only)
+        if stored is not None:
+            stored = [tf.convert_to_tensor(psfs, dtype=self.parameters["dtype"]) for psfs in stored]
+            return stored[0] if self.intensity_only else stored
+
+        psfs = self.__compute_psf(inputs, point_source_locs, self.intensity_only)
+        if self.intensity_only:
+            self.store.put(key, psfs.numpy())
+        else:
+            self.store.put(key, psfs[0].numpy(), psfs[1].numpy())
+
+        return psfs
+
+    def build_depth_cache(self, inputs, depth_range_m, depth_samples, tolerance=None, max_depth_samples=65):
+        """Computes the on-axis PSF intensity at depth nodes spaced uniformly in inverse depth (1/z), over which 
+        defocus varies smoothly, for later interpolation by cached_psf.
+
+        If a tolerance is given, the nodes are refined adaptively: the PSF is computed at the midpoint (in 1/z) of 
+        every interval and, where it differs from the interpolated PSF by more than the tolerance, the midpoint is kept
+        as a new node and both halves are checked again.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles, as passed to the layer call.
+            `depth_range_m` (list): Nearest and farthest point-source depths [z_min, z_max], in units of m.
+            `depth_samples` (int): Number of initial depth nodes.
+            `tolerance` (float, optional): Maximum interpolation error relative to the PSF peak. Defaults to None, in 
+                which case the nodes are not refined.
+            `max_depth_samples` (int, optional): Maximum number of depth nodes after refinement. Defaults to 65.
+
+        Returns:
+            `dict`: Depth cache with the sorted inverse depth of the nodes ("inverse_depth"), the PSF intensity at the
+                nodes ("psf", of shape (len(wavelength_set_m), profile_batch, num_nodes, sensor_pixel_number["y"], 
+                sensor_pixel_number["x"])), and the profiles and settings used to build it.
+        """
+        inverse_depth = node_axis(1 / depth_range_m[1], 1 / depth_range_m[0], depth_samples)
+        psf = self.__depth_psf(inputs, inverse_depth)
+
+        # Check interval midpoints and keep those which are not well interpolated
+        intervals = [(idx, idx + 1) for idx in range(len(inverse_depth) - 1)]
+        while tolerance is not None and intervals and len(inverse_depth) < max_depth_samples:
+            intervals = intervals[: max_depth_samples - len(inverse_depth)]
+            midpoint = np.array([(inverse_depth[lower] + inverse_depth[upper]) / 2 for lower, upper in intervals])
+            midpoint_psf = self.__depth_psf(inputs, midpoint)
+            interpolated_psf = tf.stack([(psf[:, :, lower] + psf[:, :, upper]) / 2 for lower, upper in intervals], 2)
+            error = tf.reduce_max(tf.abs(midpoint_psf - interpolated_psf), axis=[-2, -1]) / tf.reduce_max(
+                midpoint_psf, axis=[-2, -1]
+            )
+            refine = np.max(error.numpy(), axis=(0, 1)) > tolerance
+            if not np.any(refine):
+                break
+
+            # Insert the refined midpoints and keep the nodes sorted
+            inverse_depth = np.concatenate([inverse_depth, midpoint[refine]])
+            psf = tf.concat([psf, tf.boolean_mask(midpoint_psf, refine, axis=2)], axis=2)
+            order = np.argsort(inverse_depth)
+            inverse_depth = inverse_depth[order]
+            psf = tf.gather(psf, order, axis=2)
+
+            refined = set(midpoint[refine])
+            intervals = [
+                (idx, idx + 1)
+                for idx in range(len(inverse_depth) - 1)
+                if inverse_depth[idx] in refined or inverse_depth[idx + 1] in refined
+            ]
+
+        self.depth_cache = {
+            "inverse_depth": inverse_depth,
+            "psf": psf,
+            "profiles": [tf.identity(tf.convert_to_tensor(profile, dtype=self.parameters["dtype"])) for profile in inputs],
+            "settings": (depth_range_m, depth_samples, tolerance, max_depth_samples),
+        }
+
+        return self.depth_cache
+
+    def cached_psf(self, inputs, depths_m, training=None):
+        """Returns the on-axis PSF intensity at arbitrary depths, linearly interpolated in inverse depth from the PSF 
+        at the depth nodes of the cache. Depths beyond the cached range use the nearest node.
+
+        The cached node PSFs carry no gradient, so the cache only short-circuits the computation in inference: in 
+        eager calls with training=False, or with training=None if none of the profiles is a TF tensor. The cache is 
+        then rebuilt (with the settings of the last build_depth_cache call) whenever the profiles differ from those it
+        was built with. Otherwise (e.g. under a gradient tape or in a tf.function), the node PSFs are recomputed from 
+        the given profiles at the cached nodes, so the result is differentiable with respect to the profiles and the 
+        cost is that of the node PSFs rather than of all requested depths.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles, as passed to the layer call.
+            `depths_m` (float): Point-source depths, of shape (N,), in units of m.
+            `training` (bool, optional): Flag indicating if the call is used for training. Defaults to None, in which 
+                case the call is treated as inference only if none of the profiles is a TF tensor.
+
+        Raises:
+            ValueError: build_depth_cache must be called before cached_psf.
+
+        Returns:
+            `tf.float`: PSF intensity of shape 
+                (len(wavelength_set_m), profile_batch, N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+        """
+        if self.depth_cache is None:
+            raise ValueError("PSF_Layer: build_depth_cache must be called before cached_psf")
+
+        if inference_call(inputs, training) and tf.executing_eagerly():
+            if not self.__depth_cache_matches(inputs):
+                self.build_depth_cache(inputs, *self.depth_cache["settings"])
+            psf = self.depth_cache["psf"]
+        else:
+            psf = self.__depth_psf(inputs, self.depth_cache["inverse_depth"])
+
+        weights = linear_weights(1 / np.asarray(depths_m, dtype=np.float64), self.depth_cache["inverse_depth"])
+        weights = tf.constant(weights, dtype=self.parameters["dtype"])
+
+        return tf.einsum("qn,lbnyx->lbqyx", weights, psf)
+
+    def __depth_psf(self, inputs, inverse_depth):
+        point_source_locs = np.stack(
+            [np.zeros_like(inverse_depth), np.zeros_like(inverse_depth), 1 / inverse_depth], axis=-1
+        )
+        return self.__compute_psf(inputs, point_source_locs, True)
+
+    def __depth_cache_matches(self, inputs):
+        for profile, cached_profile in zip(inputs, self.depth_cache["profiles"]):
+            profile = tf.convert_to_tensor(profile, dtype=self.parameters["dtype"])
+            if profile.shape != cached_profile.shape or not bool(tf.reduce_all(tf.equal(profile, cached_profile))):
+                return False
+        return True
+
+    def __compute_psf(self, inputs, point_source_locs, intensity_only):
         ms_trans = inputs[0]
         ms_phase = inputs[1]
 
@@ -179,15 +470,249 @@ class PSF_Layer(tf.keras.layers.Layer):
         if not tf.is_tensor(point_source_locs):
             point_source_locs = tf.convert_to_tensor(point_source_locs, dtype=self.parameters["dtype"])
 
+        if not self.jit_compile:
+            return self.__psf_graph(ms_trans, ms_phase, point_source_locs, intensity_only)
+
+        signature = (
+            tuple(ms_trans.shape),
+            tuple(ms_phase.shape),
+            tuple(point_source_locs.shape),
+            ms_trans.dtype.name,
+            ms_phase.dtype.name,
+            point_source_locs.dtype.name,
+            intensity_only,
+        )
+        if signature not in self.traced_signatures:
+            if len(self.traced_signatures) >= self.max_traces:
+                raise ValueError(
+                    "PSF_Layer: the compiled call has already been traced for max_traces input signatures; pass inputs "
+                    + "of fixed shape (e.g. a fixed number of point-sources) or increase max_traces."
+                )
+            self.traced_signatures.append(signature)
+        if self.__compiled_psf is None:
+            self.__compiled_psf = tf.function(self.__psf_graph, jit_compile=True, autograph=False)
+
+        return self.__compiled_psf(ms_trans, ms_phase, point_source_locs, intensity_only)
+
+    def __psf_graph(self, ms_trans, ms_phase, point_source_locs, intensity_only):
         # Apply the metasurface aperture
-        ms_rank = tf.shape(ms_trans).shape
+        ms_rank = len(ms_trans.shape)
         if ms_rank == 3:
             ms_trans = ms_trans * self.aperture_trans
         elif ms_rank == 4:
             ms_trans = ms_trans * tf.expand_dims(self.aperture_trans, 0)
 
         return broadband_batched_psf_measured(
-            ms_trans, ms_phase, self.__sqrt_energy_illum, point_source_locs, self.parameters_list
+            ms_trans,
+            ms_phase,
+            self.__sqrt_energy_illum,
+            point_source_locs,
+            self.parameters_list,
+            self.chunk_size,
+            self.plans,
+            intensity_only,
+            self.recompute,
+        )
+
+    def __generate_simParam_set(self):
+        wavelength_set_m = self.parameters["wavelength_set_m"]
+        parameters_list = []
+
+        for wavelength in wavelength_set_m:
+            setting_dict = self.parameters.get_dict()
+            del setting_dict["wavelength_set_m"]
+            setting_dict["wavelength_m"] = wavelength
+            parameters_list.append(prop_params(setting_dict))
+
+        return parameters_list
+
+
+class PSF_Field_Bank_Layer(tf.keras.layers.Layer):
+    """Shift-variant point-spread function model which interpolates PSFs across the field of view and depth from a 
+    coarse bank of PSFs computed by PSF_Layer.
+
+    The bank nodes are placed on a regular grid of field angle tangents (x/z and y/z) and inverse depth (1/z). Each node
+    PSF is registered to the detector center by its centroid; a PSF at an arbitrary point-source is then the 
+    multilinear blend of the registered node PSFs (optionally through a low-rank basis), shifted to the blended 
+    centroid. Only the PSF intensity is modeled. Once the bank is computed for a metasurface via compute_bank, any 
+    number of point-sources may be evaluated without further propagation. The bank is built from tensor operations so
+    that the interpolated PSFs are differentiable with respect to the metasurface if both calls are made under the 
+    same gradient tape.
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator.
+        `psf_layer` (PSF_Layer): Intensity-only layer used to compute the node PSFs.
+        `node_axes` (list): Node coordinates along the tan_x, tan_y, and 1/z axes, each a 1D array.
+        `node_locs` (np.float): Point-source coordinates of the nodes, of shape (num_nodes, 3).
+        `rank` (int): Number of singular vectors kept for the registered PSFs (None to keep the full bank).
+        `bank` (dict): Registered PSF bank (see register_psf_bank); None until compute_bank is called.
+    """
+
+    def __init__(
+        self, parameters, field_angle_rad, field_samples, depth_range_m, depth_samples, rank=None, chunk_size=None
+    ):
+        """PSF field bank initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. The set of wavelengths for 
+                the calculation is defined by key 'wavelength_set_m'.
+            `field_angle_rad` (dict): Maximum field half-angle along x and y, in radians, via dictionary 
+                {"x": float, "y": float}.
+            `field_samples` (dict): Number of nodes along the x and y field angles, via dictionary {"x": int, "y": int}.
+                An odd number places a node on the optical axis.
+            `depth_range_m` (list): Nearest and farthest point-source depths [z_min, z_max], in units of m.
+            `depth_samples` (int): Number of depth nodes, spaced uniformly in inverse depth.
+            `rank` (int, optional): Number of singular vectors kept for the registered node PSFs. Defaults to None, in
+                which case the full bank is blended.
+            `chunk_size` (int, optional): Maximum number of fields propagated at once when computing the bank. 
+                Defaults to None.
+
+        Raises:
+            KeyError: 'wavelength_set_m' must be defined in the parameters object.
+            ValueError: Off-axis field nodes require radial_symmetry to be False.
+        """
+        super(PSF_Field_Bank_Layer, self).__init__()
+        self.parameters = parameters
+        check_broadband_wavelength_parameters(parameters)
+        if parameters["radial_symmetry"] and (field_samples["x"] > 1 or field_samples["y"] > 1):
+            raise ValueError("PSF_Field_Bank_Layer: off-axis field nodes require radial_symmetry to be False")
+
+        self.psf_layer = PSF_Layer(parameters, chunk_size=chunk_size, intensity_only=True)
+        self.rank = rank
+        self.node_axes = [
+            node_axis(-np.tan(field_angle_rad["x"]), np.tan(field_angle_rad["x"]), field_samples["x"]),
+            node_axis(-np.tan(field_angle_rad["y"]), np.tan(field_angle_rad["y"]), field_samples["y"]),
+            node_axis(1 / depth_range_m[1], 1 / depth_range_m[0], depth_samples),
+        ]
+        self.node_locs = node_point_sources(self.node_axes)
+        self.bank = None
+
+    def compute_bank(self, inputs):
+        """Computes and registers the node PSFs for a set of metasurface profiles.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles, as passed to PSF_Layer.
+
+        Returns:
+            `dict`: Registered PSF bank (see register_psf_bank).
+        """
+        node_psf = self.psf_layer(inputs, self.node_locs)
+        self.bank = register_psf_bank(node_psf, self.rank)
+
+        return self.bank
+
+    def __call__(self, point_source_locs):
+        """Interpolates the PSF intensity at a set of point-sources from the bank. Point-sources beyond the node range
+        use the PSF at the nearest boundary of the bank.
+
+        Args:
+            `point_source_locs` (float): Point-source coordinates, of shape (N,3).
+
+        Raises:
+            ValueError: compute_bank must be called before the layer.
+
+        Returns:
+            `tf.float`: Interpolated PSF intensity of shape 
+                (len(wavelength_set_m), profile_batch, N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+        """
+        if self.bank is None:
+            raise ValueError("PSF_Field_Bank_Layer: compute_bank must be called before the layer")
+
+        weights = multilinear_weights(field_coordinates(point_source_locs), self.node_axes)
+        weights = tf.constant(weights, dtype=self.parameters["dtype"])
+
+        return interpolate_psf_bank(self.bank, weights)
+
+    def interpolation_error(self, inputs, point_source_locs):
+        """Estimates the interpolation error of the bank by comparing against exact PSFs at a set of point-sources.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles used to compute the bank.
+            `point_source_locs` (float): Point-source coordinates at which the error is evaluated, of shape (N,3).
+
+        Returns:
+            `dict`: Maximum absolute error relative to the exact PSF peak ("max_error") and the relative L2 error 
+                ("relative_l2_error"), each of shape (len(wavelength_set_m), profile_batch, N).
+        """
+        exact_psf = self.psf_layer(inputs, point_source_locs)
+        error = self(point_source_locs) - exact_psf
+
+        return {
+            "max_error": tf.reduce_max(tf.abs(error), axis=[-2, -1]) / tf.reduce_max(exact_psf, axis=[-2, -1]),
+            "relative_l2_error": tf.norm(error, axis=[-2, -1]) / tf.norm(exact_psf, axis=[-2, -1]),
+        }
+
+
+class OTF_Layer(tf.keras.layers.Layer):
+    """Optical transfer function computing instance, using the linear, translationally invariant (paraxial) model of
+    the optical system. Computes the OTF at a fixed set of sensor-plane frequencies (e.g. MTF slices) for a batch of
+    metasurface profiles, on-axis point-source depths, and wavelengths in a single call, without computing the PSFs on
+    the detector. The finite pixel size is not taken into account.
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator.
+        `parameters_list` (list of prop_params objects): A list of prop_param configuration objects initialized for
+            each wavelength in the set.
+        `frequencies` (dict): Sensor-plane frequency samples in cycles per m via dictionary {"x": np.float,
+            "y": np.float}.
+        `method` (str): OTF computation method, either "autocorrelation" or "rfft2" (see batched_otf_sensor).
+        `chunk_size` (int): Maximum number of pupil functions transformed at once (None for a single pass).
+    """
+
+    def __init__(self, parameters, frequencies, method="autocorrelation", chunk_size=None):
+        """OTF layer initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. The set of wavelengths for
+                the calculation is defined by key 'wavelength_set_m'.
+            `frequencies` (dict): Sensor-plane frequency samples in cycles per m via dictionary {"x": np.float,
+                "y": np.float}, each of shape (J,); see otf_slice_frequencies.
+            `method` (str, optional): Either "autocorrelation" (exact, zero-padded pupil autocorrelation) or "rfft2"
+                (interpolated rfft2 of the PSF intensity). Defaults to "autocorrelation".
+            `chunk_size` (int, optional): Maximum number of pupil functions (profile and point-source pairs)
+                transformed at once. Defaults to None.
+
+        Raises:
+            KeyError: 'wavelength_set_m' must be defined in the parameters object.
+            ValueError: chunk_size must be None or a positive integer.
+        """
+        super(OTF_Layer, self).__init__()
+        self.parameters = parameters
+        check_broadband_wavelength_parameters(parameters)
+        check_chunk_size(chunk_size)
+        self.parameters_list = self.__generate_simParam_set()
+        self.frequencies = frequencies
+        self.method = method
+        self.chunk_size = chunk_size
+
+    def __call__(self, inputs, point_source_locs):
+        """Computes the OTF at the layer frequencies.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles, as passed to PSF_Layer.
+            `point_source_locs` (float): Point-source coordinates, of shape (N,3); only the depths are used.
+
+        Returns:
+            `tf.complex`: OTF normalized to unity at zero frequency, of shape (len(wavelength_set_m), profile_batch, N,
+                J). The MTF is its magnitude.
+        """
+        ms_trans = inputs[0]
+        ms_phase = inputs[1]
+        if not tf.is_tensor(ms_trans):
+            ms_trans = tf.convert_to_tensor(ms_trans, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(ms_phase):
+            ms_phase = tf.convert_to_tensor(ms_phase, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(point_source_locs):
+            point_source_locs = tf.convert_to_tensor(point_source_locs, dtype=self.parameters["dtype"])
+
+        return broadband_batched_otf_sensor(
+            point_source_locs,
+            ms_trans,
+            ms_phase,
+            self.parameters_list,
+            self.frequencies,
+            self.method,
+            self.chunk_size,
         )
 
     def __generate_simParam_set(self):
@@ -218,14 +743,19 @@ class Propagate_Planes_Layer_Mono(tf.keras.layers.Layer):
 
     Attributes:
         `parameters` (prop_params): Single settings object used during initialization of propagator. 
+        `plan` (propagation_plan): Precomputed static tensors for the propagation, rebuilt if the parameters change.
+        `profile` (bool): If True, each eager call records a per-stage profile.
+        `last_profile` (call_profile): Per-stage profile of the last profiled call (None until then).
     """
 
-    def __init__(self, parameters):
+    def __init__(self, parameters, profile=False):
         """propagate_plane_layer initialization. 
 
         Args:
             `parameters` (prop_param): Settings object defining field propagation details. Wavelength for calculation
                 is set by parameters["wavelength_m"].
+            `profile` (bool, optional): If True, the wall time, FLOP estimate, and peak tensor bytes of each stage of
+                an eager call are recorded in last_profile (see stage_profiler). Defaults to False.
 
         Raises: 
             KeyError: parameters object must have 'wavelength_m' defined.
@@ -233,7 +763,10 @@ class Propagate_Planes_Layer_Mono(tf.keras.layers.Layer):
         """
         super(Propagate_Planes_Layer_Mono, self).__init__()
         self.parameters = parameters
+        self.profile = profile
+        self.last_profile = None
         check_single_wavelength_parameters(parameters)
+        self.plan = propagation_plan(parameters)
 
     def __call__(self, inputs):
         """propagate_planes_layer call function. Computes the field amplitude and phase at a parallel plane a distance
@@ -263,7 +796,13 @@ class Propagate_Planes_Layer_Mono(tf.keras.layers.Layer):
         if not tf.is_tensor(field_phase):
             field_phase = tf.convert_to_tensor(field_phase, dtype=self.parameters["dtype"])
 
-        return field_propagation(field_amplitude, field_phase, self.parameters)
+        self.plan = validate_plan(self.plan, self.parameters)
+        with collect_profile(self.profile, "Propagate_Planes_Layer_Mono") as profile:
+            fields = field_propagation(field_amplitude, field_phase, self.parameters, self.plan)
+        if profile is not None:
+            self.last_profile = profile
+
+        return fields
 
 
 class Propagate_Planes_Layer(tf.keras.layers.Layer):
@@ -283,24 +822,33 @@ class Propagate_Planes_Layer(tf.keras.layers.Layer):
         `parameters` (prop_params): Single settings object used during initialization of propagator. 
         `parameters_list` (list of prop_params objects): A list of prop_param configuration objects initialized for 
             each wavelength in the set.   
+        `plans` (list of propagation_plan objects): Precomputed static tensors for each wavelength in the set, 
+            built once for parameters_list.
+        `profile` (bool): If True, each eager call records a per-stage profile.
+        `last_profile` (call_profile): Per-stage profile of the last profiled call (None until then).
     """
 
-    def __init__(self, parameters):
+    def __init__(self, parameters, profile=False):
         """propagate_plane_layer initialization. 
 
         Args:
             `parameters` (prop_param): Settings object defining field propagation details. Wavelength set for 
                 calculation is defined by parameters["wavelength_set_m"].
+            `profile` (bool, optional): If True, the wall time, FLOP estimate, and peak tensor bytes of each stage of
+                an eager call are recorded in last_profile (see stage_profiler). Defaults to False.
 
         Raises: 
             KeyError: parameters object must have 'wavelength_set_m' defined.
         """
         super(Propagate_Planes_Layer, self).__init__()
         self.parameters = parameters
+        self.profile = profile
+        self.last_profile = None
         check_broadband_wavelength_parameters(parameters)
 
         # Generate the fourier grids for each wavelength
         self.parameters_list = self.__generate_simParam_set()
+        self.plans = [propagation_plan(parameters) for parameters in self.parameters_list]
 
     def __call__(self, inputs):
         """propagate_planes_broadband_layer call function. Computes the field amplitude and phase at a parallel plane a
@@ -336,7 +884,12 @@ class Propagate_Planes_Layer(tf.keras.layers.Layer):
         if not tf.is_tensor(field_phase):
             field_phase = tf.convert_to_tensor(field_phase, dtype=self.parameters["dtype"])
 
-        return broadband_batched_propagation(field_amplitude, field_phase, self.parameters_list)
+        with collect_profile(self.profile, "Propagate_Planes_Layer") as profile:
+            fields = broadband_batched_propagation(field_amplitude, field_phase, self.parameters_list, self.plans)
+        if profile is not None:
+            self.last_profile = profile
+
+        return fields
 
     def __generate_simParam_set(self):
         wavelength_set_m = self.parameters["wavelength_set_m"]
@@ -350,3 +903,388 @@ class Propagate_Planes_Layer(tf.keras.layers.Layer):
 
         return parameters_list
 
+
+class Propagate_Focal_Stack_Layer_Mono(tf.keras.layers.Layer):
+    """Fourier optics-based focal stack propagator instance. Computes the output field(s) on a stack of parallel planes
+    at different distances from an initial plane, given a set of input field(s) of a single wavelength.
+
+    The input field is regularized and transformed to its angular spectrum once per call; the precomputed transfer 
+    function of each plane is then applied in a batched product and inverse transform, over all planes at once or in 
+    chunks of chunk_size planes. The angular spectrum 
+    engines ("ASM_fourier", "ASM_bandlimited", "ASM_scaled") are supported since only for these do all planes share 
+    the input spectrum and the output grid.
+    - Plane distances are given by distances_m; parameters["sensor_distance_m"] is not used. 
+    - The calculation grid is defined for the closest plane, which requires the finest sampling, and is shared by all
+        planes.
+    - The input grid is defined by parameters["ms_samplesM"] and parameters["ms_dx_m"]. 
+    - The output grid is defined by parameters["sensor_dx_m"] and parameters["sensor_pixel_number"].
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator. 
+        `distances_m` (list): Distances of the output planes from the initial plane, in units of m.
+        `grid_parameters` (prop_params): Settings object defining the calculation grid shared by all planes.
+        `plan` (propagation_plan): Precomputed static tensors for the detector measurement.
+        `stack_terms` (tuple): Precomputed grid, stacked transfer functions, and output transform terms (see 
+            focal_stack_terms).
+        `chunk_size` (int): Maximum number of planes propagated at once (None for a single pass).
+    """
+
+    def __init__(self, parameters, distances_m, chunk_size=None):
+        """Propagate_Focal_Stack_Layer_Mono initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. Wavelength for calculation
+                is set by parameters["wavelength_m"].
+            `distances_m` (list): Distances of the output planes from the initial plane, in units of m.
+            `chunk_size` (int, optional): Maximum number of planes propagated at once. Large stacks of planes may be
+                split into chunks to bound the memory of the padded spectra. Defaults to None (all planes at once).
+
+        Raises: 
+            KeyError: parameters object must have 'wavelength_m' defined.
+            ValueError: The 'wavelength_m' value must be a single float.
+            ValueError: distances_m must be a non-empty list of positive distances.
+            ValueError: The diffraction engine must be an angular spectrum engine.
+            ValueError: chunk_size must be None or a positive integer.
+        """
+        super(Propagate_Focal_Stack_Layer_Mono, self).__init__()
+        self.parameters = parameters
+        self.distances_m = [float(distance_m) for distance_m in distances_m]
+        self.chunk_size = chunk_size
+        check_single_wavelength_parameters(parameters)
+        check_focal_stack_distances(self.distances_m)
+        check_chunk_size(chunk_size)
+
+        setting_dict = parameters.get_dict()
+        setting_dict["sensor_distance_m"] = min(self.distances_m)
+        self.grid_parameters = prop_params(setting_dict)
+        self.stack_terms = focal_stack_terms(self.grid_parameters, self.distances_m)
+        self.plan = propagation_plan(self.grid_parameters)
+
+    def __call__(self, inputs):
+        """Propagate_Focal_Stack_Layer_Mono call function. Computes the field amplitude and phase on each plane of the
+        focal stack, for a single wavelength. 
+
+        Args:
+            `field_amplitude` (tf.float64): Amplitude(s) at the initial plane, in shape of 
+                (batch_size, ms_samplesM["y"], ms_samplesM["x"]) or (batch_size, 1, ms_samplesM["r"])
+            `field_phase` (tf.float64): Phase(s) at the initial plane, in shape of 
+                (batch_size, ms_samplesM["y"], ms_samplesM["x"]) or (batch_size, 1, ms_samplesM["r"])
+
+        Returns:
+            `list`: List of field amplitude(s) in the first argument and phase(s) in the second arg on the planes.
+                The shape of each is given via (len(distances_m), batch_size, sensor_pixel_number["y"], 
+                sensor_pixel_number["x"]) or (len(distances_m), batch_size, 1, sensor_pixel_number["r"]).
+        """
+        field_amplitude = inputs[0]
+        field_phase = inputs[1]
+
+        # Allow for tensor conversion when non-tensor is passed as input
+        if not tf.is_tensor(field_amplitude):
+            field_amplitude = tf.convert_to_tensor(field_amplitude, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(field_phase):
+            field_phase = tf.convert_to_tensor(field_phase, dtype=self.parameters["dtype"])
+
+        return focal_stack_propagation(
+            field_amplitude, field_phase, self.grid_parameters, self.stack_terms, self.plan, self.chunk_size
+        )
+
+
+class Propagate_Focal_Stack_Layer(tf.keras.layers.Layer):
+    """Fourier optics-based focal stack propagator instance. Computes the output field(s) on a stack of parallel planes
+    at different distances from an initial plane, given the fields on a set of wavelength channels. 
+
+    For each wavelength, the input field is transformed to its angular spectrum once and all planes are computed in a
+    batched product and inverse transform, optionally in chunks of planes (see Propagate_Focal_Stack_Layer_Mono). 
+    Only the angular spectrum engines are supported.
+    - Plane distances are given by distances_m; parameters["sensor_distance_m"] is not used. 
+    - The input grid is defined by parameters["ms_samplesM"] and parameters["ms_dx_m"]. 
+    - The output grid is defined by parameters["sensor_dx_m"] and parameters["sensor_pixel_number"].
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator. 
+        `distances_m` (list): Distances of the output planes from the initial plane, in units of m.
+        `parameters_list` (list of prop_params objects): Settings objects defining the calculation grid shared by all
+            planes, for each wavelength in the set.   
+        `plans` (list of propagation_plan objects): Precomputed static tensors for the detector measurement, for each
+            wavelength in the set.
+        `stack_terms` (list): Precomputed grid, stacked transfer functions, and output transform terms (see 
+            focal_stack_terms), for each wavelength in the set.
+        `chunk_size` (int): Maximum number of planes propagated at once per wavelength (None for a single pass).
+    """
+
+    def __init__(self, parameters, distances_m, chunk_size=None):
+        """Propagate_Focal_Stack_Layer initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. Wavelength set for 
+                calculation is defined by parameters["wavelength_set_m"].
+            `distances_m` (list): Distances of the output planes from the initial plane, in units of m.
+            `chunk_size` (int, optional): Maximum number of planes propagated at once per wavelength (see 
+                Propagate_Focal_Stack_Layer_Mono). Defaults to None (all planes at once).
+
+        Raises: 
+            KeyError: parameters object must have 'wavelength_set_m' defined.
+            ValueError: distances_m must be a non-empty list of positive distances.
+            ValueError: The diffraction engine must be an angular spectrum engine.
+            ValueError: chunk_size must be None or a positive integer.
+        """
+        super(Propagate_Focal_Stack_Layer, self).__init__()
+        self.parameters = parameters
+        self.distances_m = [float(distance_m) for distance_m in distances_m]
+        self.chunk_size = chunk_size
+        check_broadband_wavelength_parameters(parameters)
+        check_focal_stack_distances(self.distances_m)
+        check_chunk_size(chunk_size)
+
+        self.parameters_list = self.__generate_simParam_set()
+        self.stack_terms = [focal_stack_terms(parameters, self.distances_m) for parameters in self.parameters_list]
+        self.plans = [propagation_plan(parameters) for parameters in self.parameters_list]
+
+    def __call__(self, inputs):
+        """Propagate_Focal_Stack_Layer call function. Computes the field amplitude and phase on each plane of the focal
+        stack, for multiple wavelength channels. 
+
+        Args:
+            `field_amplitude` (tf.float64): Amplitude(s) at the initial plane, in shape of 
+                (len(wavelength_set_m), profile_batch, ms_samplesM["y"], ms_samplesM["x"]) or
+                (len(wavelength_set_m), profile_batch, 1, ms_samplesM["r"]). Alternatively, if the field amplitude
+                is the same across wavelength channels, shape may be (profile_batch, ms_samplesM["y"], ms_samplesM["x"])
+                or (profile_batch, 1, ms_samplesM["r"]).
+            `field_phase` (tf.float64): Phase(s) at the initial plane, in the same shape as field_amplitude.
+                
+        Returns:
+            `list`: List of field amplitude(s) in the first argument and phase(s) in the second arg on the planes.
+            The shape of each is given via (len(wavelength_set_m), len(distances_m), profile_batch, 
+            sensor_pixel_number["y"], sensor_pixel_number["x"]) or (len(wavelength_set_m), len(distances_m), 
+            profile_batch, 1, sensor_pixel_number["r"]).
+        """
+        field_amplitude = inputs[0]
+        field_phase = inputs[1]
+
+        # Allow for tensor conversion when non-tensor is passed as input
+        if not tf.is_tensor(field_amplitude):
+            field_amplitude = tf.convert_to_tensor(field_amplitude, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(field_phase):
+            field_phase = tf.convert_to_tensor(field_phase, dtype=self.parameters["dtype"])
+
+        # The fields may be the same across wavelength channels or defined for each channel
+        shared_fields = len(field_amplitude.shape) == 3
+        hold_ampl = []
+        hold_phase = []
+        for idx, parameters in enumerate(self.parameters_list):
+            ampl, phase = focal_stack_propagation(
+                field_amplitude if shared_fields else field_amplitude[idx],
+                field_phase if shared_fields else field_phase[idx],
+                parameters,
+                self.stack_terms[idx],
+                self.plans[idx],
+                self.chunk_size,
+            )
+            hold_ampl.append(ampl)
+            hold_phase.append(phase)
+
+        return tf.stack(hold_ampl, 0), tf.stack(hold_phase, 0)
+
+    def __generate_simParam_set(self):
+        # All planes share the calculation grid of the closest plane, which requires the finest sampling
+        wavelength_set_m = self.parameters["wavelength_set_m"]
+        parameters_list = []
+
+        for wavelength in wavelength_set_m:
+            setting_dict = self.parameters.get_dict()
+            del setting_dict["wavelength_set_m"]
+            setting_dict["wavelength_m"] = wavelength
+            setting_dict["sensor_distance_m"] = min(self.distances_m)
+            parameters_list.append(prop_params(setting_dict))
+
+        return parameters_list
+
+
+class Propagate_Cascade_Layer_Mono(tf.keras.layers.Layer):
+    """Fourier optics-based propagator for a cascade of modulation planes (elements), e.g. metasurface doublets or 
+    stacks. Computes the output field(s) after a sequence of elements separated by free-space gaps, given the 
+    modulation of each element, for a single wavelength.
+
+    The field is kept on the calculation grid of the prop_params configuration between elements. Each element is 
+    resampled onto the grid and applied to the incident field; each gap is a band-limited angular spectrum propagation
+    with a precomputed (cached) transfer function. Only the field at the output plane is resampled to the output grid, 
+    so the cascade costs one propagation per gap. With a single element, the layer computes the same output as 
+    Propagate_Planes_Layer_Mono.
+    - The first element is the field just after the first plane; later elements multiply the field incident on them.
+    - Gap distances between consecutive elements are given by element_gaps_m; the distance from the last element to the
+        output plane is parameters["sensor_distance_m"] and uses the configured diffraction engine.
+    - All elements are defined on the input grid, parameters["ms_samplesM"] and parameters["ms_dx_m"], and are opaque
+        outside of it. The field is truncated to the calculation grid, which should therefore span the field between 
+        elements.
+    - The output grid is defined by parameters["sensor_dx_m"] and parameters["sensor_pixel_number"].
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator. 
+        `element_gaps_m` (list): Distances between consecutive elements, in units of m.
+        `plan` (propagation_plan): Precomputed static tensors for the propagation after the last element, rebuilt if 
+            the parameters change.
+        `gap_plans` (list of gap_plan objects): Precomputed transfer functions for each gap.
+    """
+
+    def __init__(self, parameters, element_gaps_m):
+        """Propagate_Cascade_Layer_Mono initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. Wavelength for calculation
+                is set by parameters["wavelength_m"].
+            `element_gaps_m` (list): Distances between consecutive elements, in units of m (one less than the number
+                of elements).
+
+        Raises: 
+            KeyError: parameters object must have 'wavelength_m' defined.
+            ValueError: The 'wavelength_m' value must be a single float.
+            ValueError: element_gaps_m must be positive and ms_upsampling must not be 'cell_aperture'.
+        """
+        super(Propagate_Cascade_Layer_Mono, self).__init__()
+        self.parameters = parameters
+        self.element_gaps_m = [float(distance_m) for distance_m in element_gaps_m]
+        check_single_wavelength_parameters(parameters)
+        check_cascade_parameters(parameters, self.element_gaps_m)
+        self.plan = propagation_plan(parameters)
+        self.gap_plans = cascade_gap_plans(parameters, self.element_gaps_m)
+
+    def __call__(self, inputs):
+        """Propagate_Cascade_Layer_Mono call function. Computes the field amplitude and phase at the output plane 
+        after the cascade of elements, for a single wavelength.
+
+        Args:
+            `element_amplitude` (tf.float64): Amplitude modulation of each element, in shape of 
+                (len(element_gaps_m) + 1, batch_size, ms_samplesM["y"], ms_samplesM["x"]) or 
+                (len(element_gaps_m) + 1, batch_size, 1, ms_samplesM["r"])
+            `element_phase` (tf.float64): Phase modulation of each element, in the same shape as element_amplitude.
+
+        Raises:
+            ValueError: The number of elements must be one more than the number of gaps.
+
+        Returns:
+            `list`: List of field amplitude(s) in the first argument and phase(s) in the second arg at the output plane.
+                The shape of each is given via (batch_size, sensor_pixel_number["y"], sensor_pixel_number["x"]) 
+                or (batch_size, 1, sensor_pixel_number["r"]).
+        """
+        element_amplitude = inputs[0]
+        element_phase = inputs[1]
+
+        # Allow for tensor conversion when non-tensor is passed as input
+        if not tf.is_tensor(element_amplitude):
+            element_amplitude = tf.convert_to_tensor(element_amplitude, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(element_phase):
+            element_phase = tf.convert_to_tensor(element_phase, dtype=self.parameters["dtype"])
+
+        if element_amplitude.shape[0] != len(self.gap_plans) + 1:
+            raise ValueError("The number of elements must be one more than the number of element gaps")
+
+        self.plan = validate_plan(self.plan, self.parameters)
+
+        return cascaded_field_propagation(element_amplitude, element_phase, self.parameters, self.gap_plans, self.plan)
+
+
+class Propagate_Cascade_Layer(tf.keras.layers.Layer):
+    """Fourier optics-based propagator for a cascade of modulation planes (elements), e.g. metasurface doublets or 
+    stacks. Computes the output field(s) after a sequence of elements separated by free-space gaps, given the 
+    modulation of each element on a set of wavelength channels (see Propagate_Cascade_Layer_Mono).
+    - Gap distances between consecutive elements are given by element_gaps_m; the distance from the last element to the
+        output plane is parameters["sensor_distance_m"].
+    - All elements are defined on the input grid, parameters["ms_samplesM"] and parameters["ms_dx_m"].
+    - The output grid is defined by parameters["sensor_dx_m"] and parameters["sensor_pixel_number"].
+
+    Attributes:
+        `parameters` (prop_params): Single settings object used during initialization of propagator. 
+        `element_gaps_m` (list): Distances between consecutive elements, in units of m.
+        `parameters_list` (list of prop_params objects): A list of prop_param configuration objects initialized for 
+            each wavelength in the set.   
+        `plans` (list of propagation_plan objects): Precomputed static tensors for the propagation after the last 
+            element, for each wavelength in the set, built once for parameters_list.
+        `gap_plans` (list): Precomputed transfer functions for each gap (list of gap_plan objects), for each 
+            wavelength in the set.
+    """
+
+    def __init__(self, parameters, element_gaps_m):
+        """Propagate_Cascade_Layer initialization.
+
+        Args:
+            `parameters` (prop_param): Settings object defining field propagation details. Wavelength set for 
+                calculation is defined by parameters["wavelength_set_m"].
+            `element_gaps_m` (list): Distances between consecutive elements, in units of m (one less than the number
+                of elements).
+
+        Raises: 
+            KeyError: parameters object must have 'wavelength_set_m' defined.
+            ValueError: element_gaps_m must be positive and ms_upsampling must not be 'cell_aperture'.
+        """
+        super(Propagate_Cascade_Layer, self).__init__()
+        self.parameters = parameters
+        self.element_gaps_m = [float(distance_m) for distance_m in element_gaps_m]
+        check_broadband_wavelength_parameters(parameters)
+        check_cascade_parameters(parameters, self.element_gaps_m)
+
+        self.parameters_list = self.__generate_simParam_set()
+        self.plans = [propagation_plan(parameters) for parameters in self.parameters_list]
+        self.gap_plans = [cascade_gap_plans(parameters, self.element_gaps_m) for parameters in self.parameters_list]
+
+    def __call__(self, inputs):
+        """Propagate_Cascade_Layer call function. Computes the field amplitude and phase at the output plane after the
+        cascade of elements, for multiple wavelength channels.
+
+        Args:
+            `element_amplitude` (tf.float64): Amplitude modulation of each element, in shape of 
+                (len(wavelength_set_m), len(element_gaps_m) + 1, profile_batch, ms_samplesM["y"], ms_samplesM["x"]) 
+                or (len(wavelength_set_m), len(element_gaps_m) + 1, profile_batch, 1, ms_samplesM["r"]). 
+                Alternatively, if the modulations are the same across wavelength channels, shape may be 
+                (len(element_gaps_m) + 1, profile_batch, ms_samplesM["y"], ms_samplesM["x"]) or 
+                (len(element_gaps_m) + 1, profile_batch, 1, ms_samplesM["r"]).
+            `element_phase` (tf.float64): Phase modulation of each element, in the same shape as element_amplitude.
+
+        Raises:
+            ValueError: The number of elements must be one more than the number of gaps.
+
+        Returns:
+            `list`: List of field amplitude(s) in the first argument and phase(s) in the second arg at the output plane.
+            The shape of each is given via (len(wavelength_set_m), profile_batch, sensor_pixel_number["y"], 
+            sensor_pixel_number["x"]) or (len(wavelength_set_m), profile_batch, 1, sensor_pixel_number["r"]).
+        """
+        element_amplitude = inputs[0]
+        element_phase = inputs[1]
+
+        # Allow for tensor conversion when non-tensor is passed as input
+        if not tf.is_tensor(element_amplitude):
+            element_amplitude = tf.convert_to_tensor(element_amplitude, dtype=self.parameters["dtype"])
+        if not tf.is_tensor(element_phase):
+            element_phase = tf.convert_to_tensor(element_phase, dtype=self.parameters["dtype"])
+
+        # The modulations may be the same across wavelength channels or defined for each channel
+        shared_elements = len(element_amplitude.shape) == 4
+        num_elements = element_amplitude.shape[0] if shared_elements else element_amplitude.shape[1]
+        if num_elements != len(self.element_gaps_m) + 1:
+            raise ValueError("The number of elements must be one more than the number of element gaps")
+
+        hold_ampl = []
+        hold_phase = []
+        for idx, parameters in enumerate(self.parameters_list):
+            ampl, phase = cascaded_field_propagation(
+                element_amplitude if shared_elements else element_amplitude[idx],
+                element_phase if shared_elements else element_phase[idx],
+                parameters,
+                self.gap_plans[idx],
+                self.plans[idx],
+            )
+            hold_ampl.append(ampl)
+            hold_phase.append(phase)
+
+        return tf.stack(hold_ampl, 0), tf.stack(hold_phase, 0)
+
+    def __generate_simParam_set(self):
+        wavelength_set_m = self.parameters["wavelength_set_m"]
+        parameters_list = []
+
+        for wavelength in wavelength_set_m:
+            setting_dict = self.parameters.get_dict()
+            del setting_dict["wavelength_set_m"]
+            setting_dict["wavelength_m"] = wavelength
+            parameters_list.append(prop_params(setting_dict))
+
+        return parameters_list
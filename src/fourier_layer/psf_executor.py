@@ -0,0 +1,238 @@
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import tensorflow as tf
+
+from data_structure import prop_params
+from .fourier_layers import PSF_Layer_Mono, check_broadband_wavelength_parameters
+
+# State of each worker process, set by the pool initializer
+_worker_state = {}
+
+
+class PSF_Executor:
+    """Forward-only, multi-process PSF evaluation. The (wavelength x profile x point-source) work items of a PSF_Layer
+    call are sharded across a pool of worker processes, each holding its own single-wavelength PSF layers (and
+    propagation plans) for the lifetime of the pool.
+
+    The metasurface profiles, point-sources, and the standard 5-D outputs are exchanged through shared memory blocks so
+    that no large arrays are pickled between processes; each worker writes its PSFs directly into the output blocks.
+    Results are returned as numpy arrays, i.e. no gradients are recorded. Intra-op threading within each worker is
+    restricted (threads_per_worker) so that the pool, rather than TF, distributes the work across cores.
+
+    The workers are started with the "spawn" method so scripts using the executor must guard their entry point with
+    `if __name__ == "__main__":`. The pool is released by close() or by using the executor as a context manager.
+
+    Attributes:
+        `parameters` (prop_params): Settings object defining field propagation details (broadband).
+        `parameters_list` (list of prop_params objects): Single wavelength settings for each wavelength in the set.
+        `num_workers` (int): Number of worker processes.
+        `intensity_only` (bool): If True, only the PSF intensity is computed and returned.
+    """
+
+    def __init__(self, parameters, num_workers=None, threads_per_worker=1, chunk_size=None, intensity_only=False):
+        """PSF executor initialization.
+
+        Args:
+            `parameters` (prop_params): Settings object defining field propagation details. The set of wavelengths for
+                the calculation is defined by key 'wavelength_set_m'.
+            `num_workers` (int, optional): Number of worker processes. Defaults to None, in which case one worker is
+                started per CPU core.
+            `threads_per_worker` (int, optional): Number of intra-op and inter-op threads used by TF in each worker.
+                Defaults to 1.
+            `chunk_size` (int, optional): Maximum number of fields propagated at once by a worker (see PSF_Layer).
+                Defaults to None.
+            `intensity_only` (bool, optional): If True, only the PSF intensity is computed and returned (e.g. for
+                dataset generation). Defaults to False.
+
+        Raises:
+            KeyError: 'wavelength_set_m' must be defined in the parameters object.
+        """
+        check_broadband_wavelength_parameters(parameters)
+        self.parameters = parameters
+        self.intensity_only = intensity_only
+        self.num_workers = multiprocessing.cpu_count() if num_workers is None else num_workers
+
+        # The workers rebuild the single wavelength settings from the same dictionaries
+        settings_list = []
+        for wavelength in parameters["wavelength_set_m"]:
+            setting_dict = parameters.get_dict()
+            del setting_dict["wavelength_set_m"]
+            setting_dict["wavelength_m"] = wavelength
+            settings_list.append(setting_dict)
+        self.parameters_list = [prop_params(setting_dict) for setting_dict in settings_list]
+
+        self.__pool = multiprocessing.get_context("spawn").Pool(
+            self.num_workers,
+            initializer=init_worker,
+            initargs=(settings_list, threads_per_worker, chunk_size, intensity_only),
+        )
+
+    def __call__(self, inputs, point_source_locs, sources_per_item=None):
+        """Computes the PSFs for a set of metasurface profiles and point-sources, as returned by PSF_Layer.
+
+        Args:
+            `inputs` (list): Metasurface transmittance and phase profiles, of shape
+                (len(wavelength_set_m), profile_batch, ms_samplesM['y'], ms_samplesM['x']) or
+                (profile_batch, ms_samplesM['y'], ms_samplesM['x']) (radial profiles of shape (..., 1, ms_samplesM['r'])).
+            `point_source_locs` (float): Point-source coordinates, of shape (N,3).
+            `sources_per_item` (int, optional): Number of point-sources in each work item. Defaults to None, in which
+                case the point-sources are split so that there are at least four work items per worker.
+
+        Returns:
+            `np.float`: PSF intensity of shape
+                (len(wavelength_set_m), profile_batch, N, sensor_pixel_number["y"], sensor_pixel_number["x"]).
+            `np.float`: PSF phase of the same shape. Not returned if intensity_only is True.
+        """
+        dtype = self.parameters["dtype"].as_numpy_dtype
+        ms_trans = np.asarray(inputs[0], dtype=dtype)
+        ms_phase = np.asarray(inputs[1], dtype=dtype)
+        point_source_locs = np.asarray(point_source_locs, dtype=dtype)
+
+        num_wl = len(self.parameters_list)
+        num_profiles = ms_trans.shape[-3]
+        num_sources = point_source_locs.shape[0]
+        sensor_pixel_number = self.parameters["sensor_pixel_number"]
+        output_shape = (num_wl, num_profiles, num_sources, sensor_pixel_number["y"], sensor_pixel_number["x"])
+
+        if sources_per_item is None:
+            source_splits = math.ceil(4 * self.num_workers / (num_wl * num_profiles))
+            sources_per_item = math.ceil(num_sources / min(max(source_splits, 1), num_sources))
+
+        blocks = {}
+        try:
+            blocks["trans"] = create_shared_array(ms_trans)
+            blocks["phase"] = create_shared_array(ms_phase)
+            blocks["locs"] = create_shared_array(point_source_locs)
+            blocks["out_int"] = create_shared_array(np.zeros(output_shape, dtype=dtype))
+            if not self.intensity_only:
+                blocks["out_phase"] = create_shared_array(np.zeros(output_shape, dtype=dtype))
+            descriptors = {key: block[1] for key, block in blocks.items()}
+
+            tasks = [
+                (descriptors, wl_idx, profile_idx, source_start, min(source_start + sources_per_item, num_sources))
+                for wl_idx in range(num_wl)
+                for profile_idx in range(num_profiles)
+                for source_start in range(0, num_sources, sources_per_item)
+            ]
+            for _ in self.__pool.imap_unordered(evaluate_work_item, tasks):
+                pass
+
+            psf_intensity = np.array(blocks["out_int"][2])
+            if self.intensity_only:
+                return psf_intensity
+            return psf_intensity, np.array(blocks["out_phase"][2])
+
+        finally:
+            # Array views must be released before the blocks can be closed
+            shms = [block[0] for block in blocks.values()]
+            blocks.clear()
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+    def close(self):
+        """Stops the worker processes."""
+        self.__pool.close()
+        self.__pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def create_shared_array(data):
+    """Copies an array into a new shared memory block.
+
+    Args:
+        `data` (np.ndarray): Array to share.
+
+    Returns:
+        `SharedMemory`: Shared memory block (to be closed and unlinked by the caller).
+        `tuple`: Descriptor (name, shape, dtype) used to attach to the block.
+        `np.ndarray`: Array view of the block.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    array = np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
+    array[...] = data
+
+    return shm, (shm.name, data.shape, data.dtype.str), array
+
+
+def attach_shared_array(descriptor):
+    """Attaches to a shared memory block created by create_shared_array (from a worker process).
+
+    Args:
+        `descriptor` (tuple): Descriptor (name, shape, dtype) of the block.
+
+    Returns:
+        `SharedMemory`: Shared memory block (to be closed, but not unlinked, by the caller).
+        `np.ndarray`: Array view of the block.
+    """
+    name, shape, dtype = descriptor
+    # Spawned workers share the resource tracker of the parent, which unlinks the block once it is released
+    shm = shared_memory.SharedMemory(name=name)
+
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def init_worker(settings_list, threads_per_worker, chunk_size, intensity_only):
+    # Pool initializer: restrict TF threading in the worker; the PSF layers are built on first use of each wavelength
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+        tf.config.threading.set_inter_op_parallelism_threads(threads_per_worker)
+    except RuntimeError:
+        pass
+
+    _worker_state["settings_list"] = settings_list
+    _worker_state["chunk_size"] = chunk_size
+    _worker_state["intensity_only"] = intensity_only
+    _worker_state["layers"] = {}
+
+
+def evaluate_work_item(task):
+    # Computes the PSFs of one profile on one wavelength for a slice of point-sources and writes them to the outputs
+    descriptors, wl_idx, profile_idx, source_start, source_stop = task
+
+    layers = _worker_state["layers"]
+    if wl_idx not in layers:
+        layers[wl_idx] = PSF_Layer_Mono(
+            prop_params(_worker_state["settings_list"][wl_idx]),
+            chunk_size=_worker_state["chunk_size"],
+            intensity_only=_worker_state["intensity_only"],
+        )
+
+    shms = {}
+    arrays = {}
+    for key, descriptor in descriptors.items():
+        shms[key], arrays[key] = attach_shared_array(descriptor)
+    try:
+        write_work_item(layers[wl_idx], arrays, wl_idx, profile_idx, source_start, source_stop)
+    finally:
+        # Array views must be released before the blocks can be closed
+        arrays.clear()
+        for shm in shms.values():
+            shm.close()
+
+    return
+
+
+def write_work_item(layer, arrays, wl_idx, profile_idx, source_start, source_stop):
+    ms_trans = arrays["trans"]
+    ms_phase = arrays["phase"]
+    if ms_trans.ndim == 4:
+        ms_trans, ms_phase = ms_trans[wl_idx], ms_phase[wl_idx]
+    profile = slice(profile_idx, profile_idx + 1)
+    sources = slice(source_start, source_stop)
+
+    psfs = layer([ms_trans[profile], ms_phase[profile]], arrays["locs"][sources])
+    if _worker_state["intensity_only"]:
+        arrays["out_int"][wl_idx, profile_idx, sources] = psfs[0, 0].numpy()
+    else:
+        arrays["out_int"][wl_idx, profile_idx, sources] = psfs[0][0, 0].numpy()
+        arrays["out_phase"][wl_idx, profile_idx, sources] = psfs[1][0, 0].numpy()
+
+    return
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import uuid
+import numpy as np
+
+# Version of the key and shard layout; bump to invalidate stores written by older versions
+STORE_VERSION = "psf_store_v1"
+
+
+def stable_repr(value):
+    """Returns a deterministic string representation of a (nested) settings value, with dictionaries sorted by key.
+
+    Args:
+        `value`: Settings value (dict, list, tuple, array, or scalar).
+
+    Returns:
+        `str`: Representation of the value that is stable across processes and sessions.
+    """
+    if isinstance(value, dict):
+        return "{" + ", ".join(repr(key) + ": " + stable_repr(value[key]) for key in sorted(value.keys())) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(stable_repr(item) for item in value) + "]"
+    if isinstance(value, np.ndarray):
+        return stable_repr(value.tolist())
+
+    return repr(value)
+
+
+def psf_store_key(parameters, inputs, point_source_locs):
+    """Returns the content address of a PSF_Layer result: a hash of the settings, the metasurface profiles, and the
+    point-source coordinates.
+
+    Args:
+        `parameters` (prop_params): Settings object defining field propagation details.
+        `inputs` (list): Metasurface transmittance and phase profiles, as passed to PSF_Layer.
+        `point_source_locs` (float): Point-source coordinates, of shape (N,3).
+
+    Returns:
+        `str`: Hexadecimal SHA-256 digest.
+    """
+    dtype = parameters["dtype"].as_numpy_dtype
+    settings = {key: value for key, value in parameters.get_dict().items() if not key.startswith("_")}
+
+    digest = hashlib.sha256()
+    digest.update((STORE_VERSION + stable_repr(settings)).encode())
+    for data in [inputs[0], inputs[1], point_source_locs]:
+        data = np.ascontiguousarray(np.asarray(data, dtype=dtype))
+        digest.update(repr(data.shape).encode())
+        digest.update(data.tobytes())
+
+    return digest.hexdigest()
+
+
+class psf_store:
+    """Content-addressed, on-disk store of PSF_Layer results with a size-bounded, least-recently-used eviction policy.
+
+    Each entry is a directory named by its key (see psf_store_key) holding the PSF intensity and, optionally, the phase
+    as .npy shards which are memory-mapped when read. The modification time of an entry directory records its last use
+    so the store may be shared between processes and sessions without an index. Entries are written to a temporary
+    directory and renamed into place so that a partially written entry is never read.
+
+    Attributes:
+        `directory` (str): Root directory of the store.
+        `max_size_bytes` (int): Maximum total size of the stored shards; the least recently used entries are evicted
+            beyond it.
+    """
+
+    def __init__(self, directory, max_size_bytes=2 ** 30):
+        """PSF store initialization.
+
+        Args:
+            `directory` (str): Root directory of the store (created if it does not exist).
+            `max_size_bytes` (int, optional): Maximum total size of the stored shards, in bytes. Defaults to 1 GiB.
+        """
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key, intensity_only=False):
+        """Returns the stored PSFs for a key and marks the entry as recently used.
+
+        Args:
+            `key` (str): Entry key.
+            `intensity_only` (bool, optional): If True, only the intensity is required. Defaults to False.
+
+        Returns:
+            `list`: Memory-mapped intensity (and phase, unless intensity_only) arrays, or None if the entry is not
+                stored (or was stored without the phase when it is required).
+        """
+        entry = os.path.join(self.directory, key)
+        shards = ["intensity.npy"] if intensity_only else ["intensity.npy", "phase.npy"]
+        try:
+            psfs = [np.load(os.path.join(entry, shard), mmap_mode="r") for shard in shards]
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+
+        return psfs
+
+    def put(self, key, psf_intensity, psf_phase=None):
+        """Stores the PSFs for a key and evicts the least recently used entries beyond the size bound.
+
+        Args:
+            `key` (str): Entry key.
+            `psf_intensity` (np.float): PSF intensity.
+            `psf_phase` (np.float, optional): PSF phase. Defaults to None.
+        """
+        entry = os.path.join(self.directory, key)
+        temporary = os.path.join(self.directory, ".tmp-" + uuid.uuid4().hex)
+        os.makedirs(temporary)
+        np.save(os.path.join(temporary, "intensity.npy"), np.asarray(psf_intensity))
+        if psf_phase is not None:
+            np.save(os.path.join(temporary, "phase.npy"), np.asarray(psf_phase))
+
+        # An existing entry (e.g. intensity only, or written concurrently) is replaced
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+        self.evict()
+
+        return
+
+    def evict(self):
+        """Removes the least recently used entries until the store is within max_size_bytes."""
+        entries = []
+        for key in os.listdir(self.directory):
+            entry = os.path.join(self.directory, key)
+            if key.startswith(".tmp-") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(entry_file.stat().st_size for entry_file in os.scandir(entry))
+                entries.append((os.stat(entry).st_mtime, size, entry))
+            except FileNotFoundError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+        return
+
+    def size(self):
+        """Returns the total size of the stored shards, in bytes."""
+        return sum(
+            entry_file.stat().st_size
+            for entry in os.scandir(self.directory)
+            if entry.is_dir() and not entry.name.startswith(".tmp-")
+            for entry_file in os.scandir(entry.path)
+        )
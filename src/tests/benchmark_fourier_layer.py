@@ -0,0 +1,314 @@
+import sys
+import os
+import re
+import json
+import time
+import argparse
+import platform
+import resource
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+
+sys.path.append(".")
+
+from fourier_layer import PSF_Layer, PSF_Layer_Mono, Propagate_Planes_Layer
+from fourier_layer.ms_initialization_utilities import focus_lens_init
+from data_structure import prop_params
+from data_structure.params_class import diffractionEngines
+
+### Benchmark harness for the fourier propagation stack. Run from the src directory, e.g.
+###     python tests/benchmark_fourier_layer.py --output benchmark.json
+###     python tests/benchmark_fourier_layer.py --output new.json --baseline benchmark.json
+### Each case is a sweep of one setting (lens size, sensor pixel number, number of wavelengths, or number of
+### point-sources) away from the base case, for every component, engine, and radial/2D configuration. The process exits
+### with status 1 if any case regresses against the baseline.
+
+COMPONENTS = ["PSF_Layer", "PSF_Layer_Mono", "Propagate_Planes_Layer"]
+ENGINES = ["fresnel_fourier", "ASM_fourier"]
+BASE_CASE = {"lens_length_m": 30e-6, "pixel_number": 41, "num_wavelengths": 2, "num_point_sources": 3}
+SWEEPS = {
+    "quick": {
+        "lens_length_m": [60e-6],
+        "pixel_number": [81],
+        "num_wavelengths": [4],
+        "num_point_sources": [12],
+    },
+    "full": {
+        "lens_length_m": [15e-6, 60e-6, 120e-6],
+        "pixel_number": [21, 81, 161],
+        "num_wavelengths": [1, 4, 8],
+        "num_point_sources": [1, 12, 48],
+    },
+}
+
+
+def case_name(case):
+    return "{}/{}/{}/lens{:g}um/pixels{}/wl{}/sources{}".format(
+        case["component"],
+        case["engine"],
+        "radial" if case["radial_symmetry"] else "2D",
+        case["lens_length_m"] * 1e6,
+        case["pixel_number"],
+        case["num_wavelengths"],
+        case["num_point_sources"],
+    )
+
+
+def benchmark_cases(components, engines, sweep):
+    ### Returns the list of benchmark cases: the base case and one-at-a-time sweeps of each setting
+    cases = []
+    for component in components:
+        for engine in engines:
+            for radial_symmetry in [False, True]:
+                variations = [{}] + [{key: value} for key, values in SWEEPS[sweep].items() for value in values]
+                for variation in variations:
+                    case = dict(BASE_CASE, component=component, engine=engine, radial_symmetry=radial_symmetry)
+                    case.update(variation)
+                    # The single wavelength layer and the plane propagation do not depend on some of the settings
+                    if component == "PSF_Layer_Mono":
+                        case["num_wavelengths"] = 1
+                    if component == "Propagate_Planes_Layer":
+                        case["num_point_sources"] = 0
+                    case["name"] = case_name(case)
+                    cases.append(case)
+
+    # Drop the duplicates created by the settings that are fixed for a component
+    unique_cases = {case["name"]: case for case in cases}
+
+    return list(unique_cases.values())
+
+
+def case_settings(case):
+    ### The sensor distance scales with the lens so that all cases have the same f-number
+    lens_length_m = case["lens_length_m"]
+    settings = {
+        "ms_length_m": {"x": lens_length_m, "y": lens_length_m},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": lens_length_m / 2.01,
+        "sensor_distance_m": 2 * lens_length_m,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": case["pixel_number"], "y": case["pixel_number"]},
+        "radial_symmetry": case["radial_symmetry"],
+        "diffractionEngine": case["engine"],
+        "accurate_measurement": True,
+    }
+    if case["component"] == "PSF_Layer_Mono":
+        settings["wavelength_m"] = 550e-9
+    else:
+        settings["wavelength_set_m"] = list(np.linspace(450e-9, 650e-9, case["num_wavelengths"]))
+
+    return settings
+
+
+def build_case(case):
+    ### Returns a function which builds the layer and a function which calls it
+    parameters = prop_params(case_settings(case), verbose=False)
+    if case["component"] == "PSF_Layer_Mono":
+        wavelength_set_m = [parameters["wavelength_m"]]
+    else:
+        wavelength_set_m = parameters["wavelength_set_m"]
+    lens_trans, lens_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+
+    num_sources = case["num_point_sources"]
+    point_source_locs = np.stack(
+        [np.linspace(0, 2e-6, num_sources), np.zeros(num_sources), np.geomspace(1e6, 1e-3, num_sources)], axis=-1
+    )
+
+    if case["component"] == "PSF_Layer_Mono":
+        inputs = [lens_trans, lens_phase]
+        build = lambda: PSF_Layer_Mono(parameters)
+        call = lambda layer: layer(inputs, point_source_locs)
+    elif case["component"] == "PSF_Layer":
+        # Use each lens only on its design wavelength
+        inputs = [np.expand_dims(lens_trans, 1), np.expand_dims(lens_phase, 1)]
+        build = lambda: PSF_Layer(parameters)
+        call = lambda layer: layer(inputs, point_source_locs)
+    else:
+        inputs = [np.expand_dims(lens_trans, 1), np.expand_dims(lens_phase, 1)]
+        build = lambda: Propagate_Planes_Layer(parameters)
+        call = lambda layer: layer(inputs)
+
+    return build, call
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run_case(case, repeats):
+    ### Times the layer initialization, the first call (which includes any tracing), and repeated calls
+    build, call = build_case(case)
+    gpu_available = len(tf.config.list_physical_devices("GPU")) > 0
+    if gpu_available:
+        tf.config.experimental.reset_memory_stats("GPU:0")
+    start_rss_mb = peak_rss_mb()
+
+    start = time.perf_counter()
+    layer = build()
+    init_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    call(layer)
+    first_call_s = time.perf_counter() - start
+
+    call_s = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call(layer)
+        call_s.append(time.perf_counter() - start)
+
+    result = dict(case)
+    result.update(
+        {
+            "init_s": init_s,
+            "first_call_s": first_call_s,
+            "median_s": float(np.median(call_s)),
+            "min_s": float(np.min(call_s)),
+            # Growth of the process high-water mark, i.e. exact only when each case runs in a fresh process
+            "peak_memory_mb": peak_rss_mb() - start_rss_mb,
+        }
+    )
+    if gpu_available:
+        result["peak_gpu_memory_mb"] = tf.config.experimental.get_memory_info("GPU:0")["peak"] / 2 ** 20
+
+    return result
+
+
+def run_case_isolated(arguments):
+    return run_case(*arguments)
+
+
+def compare_to_baseline(results, baseline, time_tolerance, memory_tolerance, min_memory_mb=1.0):
+    """Compares benchmark results against a baseline run.
+
+    Args:
+        `results` (list): Case results of the current run.
+        `baseline` (list): Case results of the baseline run; cases are matched by name.
+        `time_tolerance` (float): Allowed fractional increase of the median call time.
+        `memory_tolerance` (float): Allowed fractional increase of the peak memory.
+        `min_memory_mb` (float, optional): Memory changes smaller than this are ignored as noise. Defaults to 1.0.
+
+    Returns:
+        `list`: Regressions, each a dictionary with the case name, the metric, the baseline and current values, and
+            their ratio.
+    """
+    baseline = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        if result["name"] not in baseline:
+            continue
+        reference = baseline[result["name"]]
+        checks = [("median_s", time_tolerance, 0.0), ("peak_memory_mb", memory_tolerance, min_memory_mb)]
+        for metric, tolerance, noise in checks:
+            if metric not in reference or metric not in result:
+                continue
+            increase = result[metric] - reference[metric]
+            if increase > noise and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "name": result["name"],
+                        "metric": metric,
+                        "baseline": reference[metric],
+                        "current": result[metric],
+                        "ratio": result[metric] / max(reference[metric], 1e-12),
+                    }
+                )
+
+    return regressions
+
+
+def run_benchmarks(args):
+    cases = benchmark_cases(args.components, args.engines, args.sweep)
+    if args.filter:
+        cases = [case for case in cases if re.search(args.filter, case["name"])]
+
+    results = []
+    if args.in_process:
+        for case in cases:
+            results.append(run_case(case, args.repeats))
+            print_result(results[-1])
+    else:
+        # A fresh process per case gives an exact peak memory and no state shared between cases
+        with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(run_case_isolated, [(case, args.repeats) for case in cases]):
+                results.append(result)
+                print_result(result)
+
+    report = {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "tensorflow": tf.__version__,
+            "numpy": np.__version__,
+            "gpu": [device.name for device in tf.config.list_physical_devices("GPU")],
+            "repeats": args.repeats,
+            "sweep": args.sweep,
+            "isolated": not args.in_process,
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(
+            results, baseline["results"], args.time_tolerance, args.memory_tolerance, args.min_memory_mb
+        )
+        report["baseline"] = {"file": args.baseline, "metadata": baseline["metadata"], "regressions": regressions}
+        for regression in regressions:
+            print(
+                "REGRESSION {}: {} {:.4g} -> {:.4g} (x{:.2f})".format(
+                    regression["name"],
+                    regression["metric"],
+                    regression["baseline"],
+                    regression["current"],
+                    regression["ratio"],
+                )
+            )
+        print(len(regressions), "regression(s) against", args.baseline)
+        exit_code = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    return exit_code
+
+
+def print_result(result):
+    print(
+        "{:<75} init {:8.3f} s  first {:8.3f} s  median {:8.4f} s  memory {:8.1f} MB".format(
+            result["name"], result["init_s"], result["first_call_s"], result["median_s"], result["peak_memory_mb"]
+        )
+    )
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory benchmarks of the fourier propagation layers.")
+    parser.add_argument("--output", default="benchmark_fourier_layer.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--sweep", default="quick", choices=list(SWEEPS.keys()), help="Size of the settings sweep")
+    parser.add_argument("--components", nargs="+", default=COMPONENTS, choices=COMPONENTS)
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=diffractionEngines)
+    parser.add_argument("--filter", default=None, help="Regular expression selecting the case names to run")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed calls after the first call")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Allowed fractional slow-down")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed fractional memory increase")
+    parser.add_argument("--min-memory-mb", type=float, default=1.0, help="Memory changes ignored as noise")
+    parser.add_argument("--in-process", action="store_true", help="Run all cases in this process (faster setup)")
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmarks(parse_arguments()))
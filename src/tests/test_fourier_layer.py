@@ -3,12 +3,33 @@ import numpy as np
 import matplotlib.pyplot as plt
 import tensorflow as tf
 import pickle
+import time
+import tempfile
+import shutil
 import scipy.io as sio
+from scipy.special import erf
 
 sys.path.append(".")
 
-from fourier_layer import PSF_Layer, Propagate_Planes_Layer, Propagate_Planes_Layer_Mono
+from fourier_layer import (
+    PSF_Layer,
+    PSF_Field_Bank_Layer,
+    OTF_Layer,
+    PSF_Executor,
+    psf_store,
+    Propagate_Planes_Layer,
+    Propagate_Planes_Layer_Mono,
+    Propagate_Focal_Stack_Layer_Mono,
+    Propagate_Cascade_Layer_Mono,
+)
 from fourier_layer.ms_initialization_utilities import focus_lens_init, getCoordinates_vector
+from fourier_layer.core import hankel
+from fourier_layer.core.hankel import qdht, fht
+from fourier_layer.core.psf_compute import sensor_window_work_estimate
+from fourier_layer.core.otf_compute import otf_sensor, atf_sensor, otf_slice_frequencies
+from fourier_layer.core.fresnel_integral_method import fresnel_diffraction_fft
+from fourier_layer.core.angular_spectrum_method import transfer_function_diffraction
+from fourier_layer.core.detectorResampling import area_overlap_matrix, resample_area_overlap, resample_intensity_sensor
 from data_structure import prop_params
 import tools.graphFunc as gF
 from tools.diff_limited_psf import airy_disk
@@ -235,9 +256,1205 @@ def heart_singularity(inputs):
     return
 
 
+def hankel_transform_accuracy(inputs):
+    ### Compare the fast (FFTLog) Hankel transform against the QDHT and the analytic transform of a Gaussian
+    num_samples = inputs[0]
+    dx = 100e-9
+    radial_grid = np.arange(num_samples) * dx
+    max_radius = radial_grid[-1]
+    width = max_radius / 4
+    fields = {
+        "Gaussian": np.exp(-((radial_grid / width) ** 2)),
+        "Lens": np.where(
+            radial_grid < max_radius * 0.9,
+            np.exp(-1j * 2 * np.pi / 532e-9 * (np.sqrt(radial_grid ** 2 + (5 * max_radius) ** 2) - 5 * max_radius)),
+            0,
+        ),
+    }
+
+    fig = plt.figure(figsize=(10, 5 * len(fields)))
+    ax = gF.addAxis(fig, len(fields), 2)
+    axcounter = 0
+    for name, field in fields.items():
+        field = tf.constant(np.expand_dims(field, (0, 1)), dtype=tf.complex128)
+        kr, qdht_transform = qdht(tf.constant(radial_grid), field)
+        fht_transform = fht(field, tf.constant(kr), num_samples, max_radius)
+        qdht_transform = qdht_transform.numpy()[0, 0, :]
+        fht_transform = fht_transform.numpy()[0, 0, :]
+        norm = np.max(np.abs(qdht_transform))
+        print(name, "max |fht - qdht| / max |qdht|: ", np.max(np.abs(fht_transform - qdht_transform)) / norm)
+
+        ax[axcounter].plot(kr, np.abs(qdht_transform), "b-", label="QDHT")
+        ax[axcounter].plot(kr, np.abs(fht_transform), "rx--", label="FHT")
+        if name == "Gaussian":
+            analytic = np.pi * width ** 2 * np.exp(-((kr * width) ** 2) / 4)
+            ax[axcounter].plot(kr, analytic, "k:", label="Analytic")
+            print(name, "max |fht - analytic| / max |analytic|: ", np.max(np.abs(fht_transform - analytic)) / norm)
+        ax[axcounter + 1].semilogy(kr, np.abs(fht_transform - qdht_transform) / norm, "k-")
+        gF.formatPlots(fig, ax[axcounter], None, xlabel="kr", ylabel="|F(kr)|", title=name, addlegend=True)
+        gF.formatPlots(fig, ax[axcounter + 1], None, xlabel="kr", ylabel="Relative difference", title=name)
+        axcounter = axcounter + 2
+
+    plt.savefig(savepath + "Hankel_accuracy__samples" + str(num_samples))
+    plt.close()
+
+    return
+
+
+def single_precision_accuracy(inputs):
+    ### Compare the PSFs computed with dtype tf.float32 (complex64 fields) against the default tf.float64 path
+    # Measured on this configuration, the float32 intensity differs from float64 by less than 1e-5 relative to the peak 
+    # for both engines (2D and radial). Where the intensity is above 10% of the peak, the phase differs by less than 
+    # ~1.5e-3 rad once a constant (piston) offset is removed; this offset, of up to ~2e-3 rad per point-source, comes 
+    # from representing the source depth itself in float32 (k * z * 2^-24)
+    radial_symmetry = inputs[0]
+    engine = inputs[1]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": engine,
+        "accurate_measurement": True,
+    }
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+    psfs = {}
+    for dtype in [tf.float64, tf.float32]:
+        simulationSettings["dtype"] = dtype
+        parameters = prop_params(simulationSettings, verbose=False)
+        wavelength_set_m = parameters["wavelength_set_m"]
+        ms_trans, ms_phase, _, _ = focus_lens_init(
+            parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+        )
+        psf_layer = PSF_Layer(parameters)
+        psf_intensity, psf_phase = psf_layer([ms_trans, ms_phase], point_source_locs)
+        psfs[dtype.name] = (psf_intensity.numpy().astype(np.float64), psf_phase.numpy().astype(np.float64))
+
+    intensity64, phase64 = psfs["float64"]
+    intensity32, phase32 = psfs["float32"]
+    intensity_error = np.abs(intensity32 - intensity64) / np.max(intensity64, axis=(-2, -1), keepdims=True)
+    phase_error = np.angle(np.exp(1j * (phase32 - phase64)))
+    phase_error = phase_error - np.median(phase_error, axis=(-2, -1), keepdims=True)
+    phase_error = np.abs(phase_error) * (intensity64 > 1e-1 * np.max(intensity64, axis=(-2, -1), keepdims=True))
+    print(engine, "radial", radial_symmetry, "max float32 intensity error / peak: ", np.max(intensity_error))
+    print(engine, "radial", radial_symmetry, "max float32 phase error (piston removed): ", np.max(phase_error))
+
+    # The LTI path (with the magnification dependent sensor-plane phase) also runs in float32
+    if engine == "fresnel_fourier":
+        atfs = {}
+        for dtype in [tf.float64, tf.float32]:
+            mono_settings = dict(simulationSettings)
+            mono_settings["wavelength_m"] = mono_settings.pop("wavelength_set_m")[0]
+            mono_settings["dtype"] = dtype
+            mono_parameters = prop_params(mono_settings, verbose=False)
+            ms_trans, ms_phase, _, _ = focus_lens_init(
+                mono_parameters, [mono_settings["wavelength_m"]], [1e6], [{"x": 0, "y": 0}]
+            )
+            atf_ampl, _ = atf_sensor(
+                tf.constant([[0.0, 0.0, 1e6], [0.0, 0.0, 5e-3]], dtype=dtype),
+                tf.constant(ms_trans, dtype=dtype),
+                tf.constant(ms_phase, dtype=dtype),
+                mono_parameters,
+            )
+            atfs[dtype.name] = atf_ampl.numpy().astype(np.float64)
+        atf_error = np.abs(atfs["float32"] - atfs["float64"]) / np.max(atfs["float64"], axis=(-2, -1), keepdims=True)
+        print(engine, "radial", radial_symmetry, "max float32 atf amplitude error / peak: ", np.max(atf_error))
+
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    cidx = intensity64.shape[-1] // 2
+    ax[0].plot(intensity64[0, 0, 0, cidx, :], "b-", label="float64")
+    ax[0].plot(intensity32[0, 0, 0, cidx, :], "rx--", label="float32")
+    ax[1].imshow(np.log10(intensity_error[0, 0, 0] + 1e-12))
+    ax[2].imshow(phase_error[0, 0, 0])
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, title="log10 intensity error / peak")
+    gF.formatPlots(fig, ax[2], None, title="Phase error (rad)")
+    plt.savefig(savepath + "Single_precision_accuracy__radial" + str(radial_symmetry) + "__engine" + engine)
+    plt.close()
+
+    return
+
+
+def intensity_only_psf(inputs):
+    ### Check that the intensity-only PSF mode returns the same intensity as the default mode and compare run times
+    radial_symmetry = inputs[0]
+    engine = inputs[1]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": engine,
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+    psf_layer = PSF_Layer(parameters)
+    psf_layer_intensity = PSF_Layer(parameters, intensity_only=True)
+    psf_layer([ms_trans, ms_phase], point_source_locs)
+    psf_layer_intensity([ms_trans, ms_phase], point_source_locs)
+
+    start = time.time()
+    psf_intensity, _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+    time_full = time.time() - start
+    start = time.time()
+    psf_intensity_only = psf_layer_intensity([ms_trans, ms_phase], point_source_locs)
+    time_intensity = time.time() - start
+
+    intensity_error = np.abs(psf_intensity_only.numpy() - psf_intensity.numpy()) / np.max(psf_intensity.numpy())
+    print(engine, "radial", radial_symmetry, "max intensity-only error / peak: ", np.max(intensity_error))
+    print(engine, "radial", radial_symmetry, "call time (s), default: ", time_full, " intensity-only: ", time_intensity)
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    cidx = psf_intensity.shape[-1] // 2
+    ax[0].plot(psf_intensity[0, 0, 0, cidx, :], "b-", label="default")
+    ax[0].plot(psf_intensity_only[0, 0, 0, cidx, :], "rx--", label="intensity_only")
+    ax[1].imshow(intensity_error[0, 0, 0])
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, title="Intensity error / peak")
+    plt.savefig(savepath + "Intensity_only_psf__radial" + str(radial_symmetry) + "__engine" + engine)
+    plt.close()
+
+    return
+
+
+def detector_resampling_accuracy(inputs):
+    ### Integrate a gaussian intensity over detector pixels whose size is a fractional multiple of the grid pitch and
+    # compare the area-overlap resampler and the rounded-ratio box filter against the analytic pixel integrals
+    pixel_ratio = inputs[0]
+    calc_number = 401
+    pixel_number = 41
+    calc_dx = 1.0
+    pixel_dx = pixel_ratio * calc_dx
+    sigma = 4.0 * calc_dx
+
+    # Intensity samples hold the energy of each grid cell, as returned by psf_sensor
+    calc_x = (np.arange(calc_number) - (calc_number - 1) / 2) * calc_dx
+    gauss_x = np.exp(-(calc_x ** 2) / 2 / sigma ** 2) / np.sqrt(2 * np.pi) / sigma * calc_dx
+    intensity = tf.constant(gauss_x[None, :, None] * gauss_x[None, None, :])
+
+    pixel_x = (np.arange(pixel_number) - (pixel_number - 1) / 2) * pixel_dx
+    edge_cdf = lambda edge: erf(edge / np.sqrt(2) / sigma) / 2
+    pixel_energy_x = edge_cdf(pixel_x + pixel_dx / 2) - edge_cdf(pixel_x - pixel_dx / 2)
+    analytic = pixel_energy_x[:, None] * pixel_energy_x[None, :]
+
+    overlap = area_overlap_matrix(calc_number, calc_dx, pixel_number, pixel_dx, tf.float64)
+    area_measured = resample_area_overlap(intensity, {"y": overlap, "x": overlap}).numpy()[0]
+
+    round_ratio = int(np.round(pixel_ratio))
+    box_measured = resample_intensity_sensor(
+        tf.expand_dims(intensity, -1), {"x": calc_number, "y": calc_number}, {"x": round_ratio, "y": round_ratio}
+    )
+    box_measured = tf.image.resize_with_crop_or_pad(box_measured, pixel_number, pixel_number).numpy()[0, :, :, 0]
+
+    area_error = np.abs(area_measured - analytic) / np.max(analytic)
+    box_error = np.abs(box_measured - analytic) / np.max(analytic)
+    print("pixel ratio", pixel_ratio, "max error / peak, area-overlap: ", np.max(area_error))
+    print("pixel ratio", pixel_ratio, "max error / peak, rounded box filter: ", np.max(box_error))
+
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    cidx = pixel_number // 2
+    ax[0].plot(analytic[cidx, :], "k-", label="analytic")
+    ax[0].plot(area_measured[cidx, :], "bx--", label="area-overlap")
+    ax[0].plot(box_measured[cidx, :], "r.--", label="rounded box")
+    ax[1].imshow(area_error)
+    ax[2].imshow(box_error)
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Energy", title="Detector slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, title="Area-overlap error / peak")
+    gF.formatPlots(fig, ax[2], None, title="Rounded box error / peak")
+    plt.savefig(savepath + "Detector_resampling_accuracy__ratio" + str(pixel_ratio).replace(".", "p"))
+    plt.close()
+
+    return
+
+
+def czt_fresnel_engine(inputs):
+    ### Compare the chirp-z fresnel engine, evaluated directly on the requested sensor grid, against the FFT fresnel
+    # engine and compare run times
+    radial_symmetry = inputs[0]
+
+    psf_intensity = {}
+    call_time = {}
+    for engine in ["fresnel_fourier", "fresnel_czt"]:
+        simulationSettings = {
+            "wavelength_set_m": [450e-9, 650e-9],
+            "ms_length_m": {"x": 30e-6, "y": 30e-6},
+            "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+            "radius_m": 30e-6 / 2.01,
+            "sensor_distance_m": 60e-6,
+            "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+            "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+            "sensor_pixel_number": {"x": 41, "y": 41},
+            "radial_symmetry": radial_symmetry,
+            "diffractionEngine": engine,
+            "accurate_measurement": True,
+        }
+        parameters = prop_params(simulationSettings, verbose=False)
+        wavelength_set_m = parameters["wavelength_set_m"]
+        ms_trans, ms_phase, _, _ = focus_lens_init(
+            parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+        )
+        point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+        psf_layer = PSF_Layer(parameters)
+        psf_layer([ms_trans, ms_phase], point_source_locs)
+        start = time.time()
+        psf_intensity[engine], _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+        call_time[engine] = time.time() - start
+
+    psf_fft = psf_intensity["fresnel_fourier"].numpy()
+    psf_czt = psf_intensity["fresnel_czt"].numpy()
+    czt_error = np.abs(psf_czt - psf_fft) / np.max(psf_fft)
+    print("radial", radial_symmetry, "max fresnel_czt error / peak: ", np.max(czt_error))
+    print(
+        "radial",
+        radial_symmetry,
+        "call time (s), fresnel_fourier: ",
+        call_time["fresnel_fourier"],
+        " fresnel_czt: ",
+        call_time["fresnel_czt"],
+    )
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    cidx = psf_fft.shape[-1] // 2
+    ax[0].plot(psf_fft[0, 0, 0, cidx, :], "b-", label="fresnel_fourier")
+    ax[0].plot(psf_czt[0, 0, 0, cidx, :], "rx--", label="fresnel_czt")
+    ax[1].imshow(czt_error[0, 0, 0])
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, title="fresnel_czt error / peak")
+    plt.savefig(savepath + "Czt_fresnel_engine__radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def bandlimited_asm_engine(inputs):
+    ### Compare the band-limited (and scaled-output) angular spectrum engines, with minimal padding, against the
+    # ASM_fourier engine and compare run times. The lens is given at a fine pitch so that all engines sample it alike
+    radial_symmetry = inputs[0]
+
+    engines = ["ASM_fourier", "ASM_bandlimited", "ASM_scaled"]
+    psf_intensity = {}
+    call_time = {}
+    for engine in engines:
+        simulationSettings = {
+            "wavelength_set_m": [450e-9, 650e-9],
+            "ms_length_m": {"x": 30e-6, "y": 30e-6},
+            "ms_dx_m": {"x": 100e-9, "y": 100e-9},
+            "radius_m": 30e-6 / 2.01,
+            "sensor_distance_m": 60e-6,
+            "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+            "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+            "sensor_pixel_number": {"x": 41, "y": 41},
+            "radial_symmetry": radial_symmetry,
+            "diffractionEngine": engine,
+            "accurate_measurement": True,
+        }
+        parameters = prop_params(simulationSettings, verbose=False)
+        wavelength_set_m = parameters["wavelength_set_m"]
+        ms_trans, ms_phase, _, _ = focus_lens_init(
+            parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+        )
+        point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+        psf_layer = PSF_Layer(parameters)
+        psf_layer([ms_trans, ms_phase], point_source_locs)
+        start = time.time()
+        psf_intensity[engine], _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+        call_time[engine] = time.time() - start
+
+    psf_ref = psf_intensity["ASM_fourier"].numpy()
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    cidx = psf_ref.shape[-1] // 2
+    ax[0].plot(psf_ref[0, 0, 0, cidx, :], "k-", label="ASM_fourier")
+    for idx, engine in enumerate(engines[1:]):
+        psf_engine = psf_intensity[engine].numpy()
+        engine_error = np.abs(psf_engine - psf_ref) / np.max(psf_ref)
+        print("radial", radial_symmetry, engine, "max error / peak: ", np.max(engine_error))
+        print(
+            "radial",
+            radial_symmetry,
+            engine,
+            "call time (s): ",
+            call_time[engine],
+            " ASM_fourier: ",
+            call_time["ASM_fourier"],
+        )
+        ax[0].plot(psf_engine[0, 0, 0, cidx, :], ["bx--", "r.--"][idx], label=engine)
+        ax[idx + 1].imshow(engine_error[0, 0, 0])
+        gF.formatPlots(fig, ax[idx + 1], None, title=engine + " error / peak")
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    plt.savefig(savepath + "Bandlimited_asm_engine__radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def roi_propagation_psf(inputs):
+    ### Compare the PSFs computed with and without roi_propagation (sensor window only) and report the work saved
+    radial_symmetry = inputs[0]
+    diffractionEngine = inputs[1]
+
+    psf_intensity = {}
+    call_time = {}
+    for roi_propagation in [False, True]:
+        simulationSettings = {
+            "wavelength_set_m": [450e-9, 650e-9],
+            "ms_length_m": {"x": 30e-6, "y": 30e-6},
+            "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+            "radius_m": 30e-6 / 2.01,
+            "sensor_distance_m": 60e-6,
+            "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+            "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+            "sensor_pixel_number": {"x": 41, "y": 41},
+            "radial_symmetry": radial_symmetry,
+            "diffractionEngine": diffractionEngine,
+            "accurate_measurement": True,
+            "roi_propagation": roi_propagation,
+        }
+        parameters = prop_params(simulationSettings, verbose=False)
+        wavelength_set_m = parameters["wavelength_set_m"]
+        ms_trans, ms_phase, _, _ = focus_lens_init(
+            parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+        )
+        point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+        psf_layer = PSF_Layer(parameters)
+        psf_layer([ms_trans, ms_phase], point_source_locs)
+        start = time.time()
+        psf_intensity[roi_propagation], _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+        call_time[roi_propagation] = time.time() - start
+
+    simulationSettings["wavelength_m"] = simulationSettings.pop("wavelength_set_m")[0]
+    print("work estimate: ", sensor_window_work_estimate(prop_params(simulationSettings, verbose=False)))
+
+    psf_full = psf_intensity[False].numpy()
+    psf_roi = psf_intensity[True].numpy()
+    roi_error = np.abs(psf_roi - psf_full) / np.max(psf_full)
+    print("radial", radial_symmetry, diffractionEngine, "roi max error / peak: ", np.max(roi_error))
+    print("call time (s): ", call_time[True], " full grid: ", call_time[False])
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    cidx = psf_full.shape[-1] // 2
+    ax[0].plot(psf_full[0, 0, 0, cidx, :], "k-", label="full grid")
+    ax[0].plot(psf_roi[0, 0, 0, cidx, :], "bx--", label="roi_propagation")
+    ax[1].imshow(roi_error[0, 0, 0])
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, title="error / peak")
+    plt.savefig(savepath + "Roi_propagation_psf_" + diffractionEngine + "_radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def psf_field_bank(inputs):
+    ### Compare PSFs interpolated from a coarse field-of-view and depth bank against exact PSFs at random point-sources
+    rank = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": False,
+        "diffractionEngine": "fresnel_czt",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    # Use each lens only on its design wavelength
+    ms_trans, ms_phase = np.expand_dims(ms_trans, 1), np.expand_dims(ms_phase, 1)
+
+    psf_bank = PSF_Field_Bank_Layer(parameters, {"x": 0.08, "y": 0.08}, {"x": 5, "y": 5}, [2e-3, 1e6], 3, rank=rank)
+    psf_bank.compute_bank([ms_trans, ms_phase])
+
+    rng = np.random.default_rng(0)
+    depth = 1 / rng.uniform(1e-6, 1 / 2e-3, 20)
+    point_source_locs = np.stack(
+        [rng.uniform(-0.08, 0.08, 20) * depth, rng.uniform(-0.08, 0.08, 20) * depth, depth], axis=-1
+    )
+    psf_interp = psf_bank(point_source_locs).numpy()
+    psf_exact = psf_bank.psf_layer([ms_trans, ms_phase], point_source_locs).numpy()
+    bank_error = psf_bank.interpolation_error([ms_trans, ms_phase], point_source_locs)
+    print("bank nodes: ", psf_bank.node_locs.shape[0], " rank: ", rank)
+    print("max error / peak: ", np.max(bank_error["max_error"]))
+    print("relative l2 error: ", np.max(bank_error["relative_l2_error"]))
+
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    ax[0].imshow(psf_exact[0, 0, 0])
+    ax[1].imshow(psf_interp[0, 0, 0])
+    ax[2].imshow(np.abs(psf_interp[0, 0, 0] - psf_exact[0, 0, 0]) / np.max(psf_exact[0, 0, 0]))
+    gF.formatPlots(fig, ax[0], None, title="exact")
+    gF.formatPlots(fig, ax[1], None, title="interpolated")
+    gF.formatPlots(fig, ax[2], None, title="error / peak")
+    plt.savefig(savepath + "Psf_field_bank_rank" + str(rank))
+    plt.close()
+
+    return
+
+
+def depth_psf_cache(inputs):
+    ### Compare on-axis PSFs interpolated from the adaptively refined depth cache against exact PSFs
+    tolerance = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": False,
+        "diffractionEngine": "fresnel_czt",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    ms_trans, ms_phase = np.expand_dims(ms_trans, 1), np.expand_dims(ms_phase, 1)
+
+    psf_layer = PSF_Layer(parameters)
+    depth_cache = psf_layer.build_depth_cache([ms_trans, ms_phase], [2e-4, 1e6], 3, tolerance=tolerance)
+    depths_m = 1 / np.linspace(1e-6, 5e3, 41)
+    psf_cached = psf_layer.cached_psf([ms_trans, ms_phase], depths_m).numpy()
+    point_source_locs = np.stack([np.zeros_like(depths_m), np.zeros_like(depths_m), depths_m], axis=-1)
+    psf_exact = psf_layer([ms_trans, ms_phase], point_source_locs)[0].numpy()
+    cache_error = np.max(np.abs(psf_cached - psf_exact), axis=(-2, -1)) / np.max(psf_exact, axis=(-2, -1))
+    print("depth nodes: ", len(depth_cache["inverse_depth"]), " tolerance: ", tolerance)
+    print("max error / peak: ", np.max(cache_error))
+
+    # Under a gradient tape (cache built outside of it) and in a tf.function, the node PSFs are recomputed from the
+    # profiles; at the node depths the gradients then equal those of the exact PSFs
+    ms_variable = tf.Variable(ms_phase)
+    node_depths_m = 1 / depth_cache["inverse_depth"]
+    node_locs = np.stack([np.zeros_like(node_depths_m), np.zeros_like(node_depths_m), node_depths_m], axis=-1)
+    cached_loss = lambda: tf.reduce_sum(psf_layer.cached_psf([ms_trans, ms_variable], node_depths_m)[:, :, :, 20, 20])
+    exact_loss = lambda: tf.reduce_sum(psf_layer([ms_trans, ms_variable], node_locs)[0][:, :, :, 20, 20])
+    gradients = []
+    for loss_function in [cached_loss, tf.function(cached_loss, autograph=False), exact_loss]:
+        with tf.GradientTape() as tape:
+            loss = loss_function()
+        gradients.append(tape.gradient(loss, ms_variable).numpy())
+    print(
+        "max gradient difference (eager, tf.function) / max gradient: ",
+        [np.max(np.abs(gradient - gradients[-1])) / np.max(np.abs(gradients[-1])) for gradient in gradients[:2]],
+    )
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    ax[0].plot(1 / depths_m, psf_exact[0, 0, :, 20, 20], "k-", label="exact")
+    ax[0].plot(1 / depths_m, psf_cached[0, 0, :, 20, 20], "bx", label="cached")
+    ax[0].plot(depth_cache["inverse_depth"], depth_cache["psf"].numpy()[0, 0, :, 20, 20], "ro", label="nodes")
+    ax[1].plot(1 / depths_m, cache_error[0, 0], "k-")
+    gF.formatPlots(fig, ax[0], None, xlabel="1/z (1/m)", ylabel="PSF peak", title="On-axis PSF", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, xlabel="1/z (1/m)", ylabel="error / peak", title="Cache error")
+    plt.savefig(savepath + "Depth_psf_cache")
+    plt.close()
+
+    return
+
+
+def psf_executor_sharding(inputs):
+    ### Compare PSFs computed by the multi-process executor against a single PSF_Layer call and compare run times
+    num_workers = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": False,
+        "diffractionEngine": "fresnel_fourier",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    rng = np.random.default_rng(0)
+    depth = 1 / rng.uniform(1e-6, 1e3, 16)
+    point_source_locs = np.stack(
+        [rng.uniform(-0.05, 0.05, 16) * depth, rng.uniform(-0.05, 0.05, 16) * depth, depth], axis=-1
+    )
+
+    psf_layer = PSF_Layer(parameters)
+    start = time.time()
+    psf_intensity, psf_phase = psf_layer([ms_trans, ms_phase], point_source_locs)
+    layer_time = time.time() - start
+
+    with PSF_Executor(parameters, num_workers=num_workers) as executor:
+        executor([ms_trans, ms_phase], point_source_locs[:1])
+        start = time.time()
+        executor_intensity, executor_phase = executor([ms_trans, ms_phase], point_source_locs)
+        executor_time = time.time() - start
+
+    print("executor max intensity error: ", np.max(np.abs(executor_intensity - psf_intensity.numpy())))
+    print("executor max phase error: ", np.max(np.abs(executor_phase - psf_phase.numpy())))
+    print("workers: ", num_workers, " executor time (s): ", executor_time, " PSF_Layer time (s): ", layer_time)
+
+    return
+
+
+def psf_store_sweep(inputs):
+    ### Repeat a PSF evaluation through an on-disk PSF store and compare the run times of computed and stored results
+    max_size_bytes = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": False,
+        "diffractionEngine": "fresnel_fourier",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3], [0.0, 1e-6, 1e-3]])
+
+    store_directory = tempfile.mkdtemp()
+    store = psf_store(store_directory, max_size_bytes)
+    psf_layer = PSF_Layer(parameters, store=store)
+    start = time.time()
+    psf_intensity, psf_phase = psf_layer([ms_trans, ms_phase], point_source_locs)
+    compute_time = time.time() - start
+    start = time.time()
+    stored_intensity, stored_phase = psf_layer([ms_trans, ms_phase], point_source_locs)
+    stored_time = time.time() - start
+
+    print("stored max intensity error: ", np.max(np.abs(stored_intensity.numpy() - psf_intensity.numpy())))
+    print("stored max phase error: ", np.max(np.abs(stored_phase.numpy() - psf_phase.numpy())))
+    print("computed (s): ", compute_time, " stored (s): ", stored_time, " store size (bytes): ", store.size())
+
+    # Profiles derived from a variable are tensors so the store is bypassed and gradients survive repeated epochs
+    ms_variable = tf.Variable(ms_phase)
+    for epoch in range(2):
+        with tf.GradientTape() as tape:
+            epoch_intensity, _ = psf_layer([ms_trans, tf.math.floormod(ms_variable, 2 * np.pi)], point_source_locs)
+            loss = tf.reduce_sum(epoch_intensity[:, :, :, 20, 20])
+        print("epoch", epoch, "gradient is None: ", tape.gradient(loss, ms_variable) is None)
+    shutil.rmtree(store_directory)
+
+    return
+
+
+def batched_mtf_slices(inputs):
+    ### Compare MTF slices from the batched pupil autocorrelation against the full-grid OTF and across methods
+    radial_symmetry = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": "fresnel_fourier",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    # Use each lens only on its design wavelength
+    ms_trans, ms_phase = np.expand_dims(ms_trans, 1), np.expand_dims(ms_phase, 1)
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [0.0, 0.0, 5e-3], [0.0, 0.0, 1e-3]])
+
+    # Slices up to the detector nyquist frequency along x and along the diagonal
+    nyquist = 1 / 2 / parameters["sensor_pixel_size_m"]["x"]
+    slice_x = otf_slice_frequencies(nyquist, 64)
+    slice_diagonal = otf_slice_frequencies(nyquist, 64, np.pi / 4)
+    frequencies = {key: np.concatenate([slice_x[key], slice_diagonal[key]]) for key in ["x", "y"]}
+    otf_layer = OTF_Layer(parameters, frequencies, chunk_size=2)
+    mtf_autocorrelation = np.abs(otf_layer([ms_trans, ms_phase], point_source_locs))
+    otf_layer = OTF_Layer(parameters, frequencies, "rfft2")
+    mtf_rfft2 = np.abs(otf_layer([ms_trans, ms_phase], point_source_locs))
+    print("max mtf difference, autocorrelation vs rfft2: ", np.max(np.abs(mtf_autocorrelation - mtf_rfft2)))
+
+    # On the calculation grid, the x-slice must match the full-grid OTF of the first wavelength in 2D
+    if not radial_symmetry:
+        mono_settings = parameters.get_dict()
+        mono_settings["wavelength_m"] = mono_settings.pop("wavelength_set_m")[0]
+        mono_parameters = prop_params(mono_settings, verbose=False)
+        lambda_distance = mono_parameters["wavelength_m"] * mono_parameters["sensor_distance_m"]
+        frequency_dx = mono_parameters["calc_ms_dx_m"]["x"] / lambda_distance
+        samples = np.arange(32)
+        grid_slice = {"x": samples * frequency_dx, "y": 0 * samples}
+        otf_grid = OTF_Layer(parameters, grid_slice)([ms_trans, ms_phase], point_source_locs)[0, 0]
+        otf_ampl, _ = otf_sensor(point_source_locs, ms_trans[0], ms_phase[0], mono_parameters)
+        center = otf_ampl.shape[-1] // 2
+        print("max error vs otf_sensor: ", np.max(np.abs(np.abs(otf_grid) - otf_ampl[:, center, center : center + 32])))
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    for idx in range(point_source_locs.shape[0]):
+        ax[0].plot(slice_x["x"] * 1e-3, mtf_autocorrelation[0, 0, idx, :64], label=str(point_source_locs[idx, 2]))
+        ax[0].plot(slice_x["x"] * 1e-3, mtf_rfft2[0, 0, idx, :64], "k--")
+        ax[1].plot(slice_x["x"] * 1e-3, mtf_autocorrelation[-1, 0, idx, 64:])
+    gF.formatPlots(fig, ax[0], None, xlabel="frequency (cycles/mm)", ylabel="MTF", title="x slice", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, xlabel="frequency (cycles/mm)", ylabel="MTF", title="diagonal slice")
+    plt.savefig(savepath + "Batched_mtf_slices_radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def stage_profile_report(inputs):
+    ### Profile the stages of a PSF_Layer and a Propagate_Planes_Layer call and compare against unprofiled calls
+    radial_symmetry = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": "fresnel_fourier",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    ms_trans, ms_phase = np.expand_dims(ms_trans, 1), np.expand_dims(ms_phase, 1)
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [1e-6, 0.0, 5e-3], [0.0, 0.0, 1e-3]])
+
+    psf_layer = PSF_Layer(parameters)
+    propagation_layer = Propagate_Planes_Layer(parameters, profile=True)
+    psf_reference = psf_layer([ms_trans, ms_phase], point_source_locs)
+    fields = propagation_layer([ms_trans, ms_phase])
+    print(propagation_layer.last_profile)
+
+    # Profiling must not change the result and should cost little compared to the call itself
+    start = time.time()
+    psf_layer([ms_trans, ms_phase], point_source_locs)
+    disabled_s = time.time() - start
+    psf_layer.profile = True
+    psf_intensity, _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+    profile = psf_layer.last_profile
+    print(profile)
+    print("max profiled psf difference: ", np.max(np.abs(psf_intensity - psf_reference[0])))
+    print("call time without and with profiling (s): ", disabled_s, profile.total_s)
+    print("unaccounted call time (s): ", profile.total_s - sum(stage["wall_s"] for stage in profile.stages))
+    profile.export_trace(savepath + "Stage_profile_radial" + str(radial_symmetry) + ".json")
+
+    summary = profile.summary()
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    ax[0].bar(range(len(summary)), [entry["wall_s"] * 1e3 for entry in summary.values()])
+    ax[1].bar(range(len(summary)), [entry["flops"] / 1e9 for entry in summary.values()])
+    for axis in ax:
+        axis.set_xticks(range(len(summary)))
+        axis.set_xticklabels(list(summary.keys()), rotation=45, ha="right")
+    gF.formatPlots(fig, ax[0], None, ylabel="wall time (ms)", title="PSF_Layer stages")
+    gF.formatPlots(fig, ax[1], None, ylabel="GFLOP estimate", title="PSF_Layer stages")
+    plt.tight_layout()
+    plt.savefig(savepath + "Stage_profile_radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def compiled_psf_layer(inputs):
+    ### Compare the XLA-compiled PSF_Layer call against the eager call, for the PSFs and their gradients. The compiled
+    # call runs first on empty hankel caches so that the cached tensors created while tracing are then used eagerly
+    radial_symmetry = inputs[0]
+    engine = inputs[1]
+    hankel_method = inputs[2]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": engine,
+        "hankel_method": hankel_method,
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    ms_trans = tf.constant(np.expand_dims(ms_trans, 1))
+    ms_phase = tf.Variable(np.expand_dims(ms_phase, 1))
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [1e-6, 0.0, 5e-3], [0.0, 0.0, 1e-3]])
+
+    for cached_function in [
+        hankel.radial_2d_gather_indices,
+        hankel.qdht_transform_matrix,
+        hankel.quadrature_hankel_matrix,
+        hankel.fht_matrices,
+    ]:
+        cached_function.cache_clear()
+    eager_layer = PSF_Layer(parameters)
+    compiled_layer = PSF_Layer(parameters, jit_compile=True, max_traces=2)
+
+    def psf_and_gradient(layer):
+        with tf.GradientTape() as tape:
+            psf_intensity, psf_phase = layer([ms_trans, ms_phase], point_source_locs)
+            loss = tf.reduce_sum(psf_intensity[:, :, :, 20, 20])
+        return psf_intensity.numpy(), psf_phase.numpy(), tape.gradient(loss, ms_phase).numpy()
+
+    call_s = {}
+    for name, layer in [("compiled", compiled_layer), ("eager", eager_layer)]:
+        start = time.time()
+        psf_and_gradient(layer)
+        first_s = time.time() - start
+        start = time.time()
+        for _ in range(5):
+            psf_intensity, psf_phase, gradient = psf_and_gradient(layer)
+        call_s[name] = (psf_intensity, gradient, (time.time() - start) / 5)
+        print(engine, hankel_method, name, "first call (s): ", first_s, "repeated call (s): ", call_s[name][2])
+
+    eager_intensity, eager_gradient, _ = call_s["eager"]
+    compiled_intensity, compiled_gradient, _ = call_s["compiled"]
+    print("max compiled psf difference: ", np.max(np.abs(compiled_intensity - eager_intensity)))
+    print("max compiled gradient difference: ", np.max(np.abs(compiled_gradient - eager_gradient)))
+    print("nan gradients: ", np.sum(np.isnan(compiled_gradient)))
+
+    # A second signature is traced; a third one exceeds max_traces
+    compiled_layer([ms_trans, ms_phase], point_source_locs[:1])
+    print("traced signatures: ", len(compiled_layer.traced_signatures))
+    try:
+        compiled_layer([ms_trans, ms_phase], point_source_locs[:2])
+        print("max_traces was not enforced")
+    except ValueError as error:
+        print("max_traces enforced: ", error)
+
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    ax[0].imshow(eager_intensity[0, 0, 0])
+    ax[1].imshow(compiled_intensity[0, 0, 0])
+    ax[2].imshow(np.abs(compiled_intensity[0, 0, 0] - eager_intensity[0, 0, 0]))
+    gF.formatPlots(fig, ax[0], None, title="eager")
+    gF.formatPlots(fig, ax[1], None, title="compiled")
+    gF.formatPlots(fig, ax[2], None, title="difference")
+    plt.tight_layout()
+    plt.savefig(savepath + "Compiled_psf_radial" + str(radial_symmetry) + "_" + engine + "_" + hankel_method)
+    plt.close()
+
+    return
+
+
+def recompute_psf_gradients(inputs):
+    ### Compare the gradients of a PSF_Layer with and without recomputation of the intermediate tensors
+    radial_symmetry = inputs[0]
+
+    simulationSettings = {
+        "wavelength_set_m": [450e-9, 550e-9, 650e-9],
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": "fresnel_fourier",
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    wavelength_set_m = parameters["wavelength_set_m"]
+    ms_trans, ms_phase, _, _ = focus_lens_init(
+        parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+    )
+    ms_trans = tf.constant(np.expand_dims(ms_trans, 1))
+    ms_phase = tf.Variable(np.expand_dims(ms_phase, 1))
+    point_source_locs = np.array([[0.0, 0.0, 1e6], [1e-6, 0.0, 5e-3], [0.0, 0.0, 1e-3], [2e-6, 0.0, 1e-2]])
+    gpu_device = tf.config.list_logical_devices("GPU")
+    gpu_device = gpu_device[0].name if gpu_device else None
+
+    results = {}
+    for recompute in [False, True]:
+        layer = PSF_Layer(parameters, chunk_size=2, intensity_only=True, recompute=recompute)
+        if gpu_device is not None:
+            tf.config.experimental.reset_memory_stats(gpu_device)
+        start = time.time()
+        with tf.GradientTape() as tape:
+            psf_intensity = layer([ms_trans, ms_phase], point_source_locs)
+            loss = tf.reduce_sum(psf_intensity[:, :, :, 20, 20])
+        gradient = tape.gradient(loss, ms_phase).numpy()
+        call_s = time.time() - start
+        peak_mb = tf.config.experimental.get_memory_info(gpu_device)["peak"] / 2 ** 20 if gpu_device else np.nan
+        results[recompute] = gradient
+        print("recompute", recompute, "forward and backward time (s): ", call_s, "peak GPU memory (MB): ", peak_mb)
+
+    print("max recomputed gradient difference: ", np.max(np.abs(results[True] - results[False])))
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    ax[0].imshow(results[False][1, 0], aspect="auto")
+    ax[1].imshow(results[True][1, 0], aspect="auto")
+    gF.formatPlots(fig, ax[0], None, title="stored intermediates")
+    gF.formatPlots(fig, ax[1], None, title="recomputed intermediates")
+    plt.tight_layout()
+    plt.savefig(savepath + "Recompute_gradient_radial" + str(radial_symmetry))
+    plt.close()
+
+    return
+
+
+def adjoint_propagation_gradients(inputs):
+    ### Compare the adjoint gradients of the 2D fresnel and ASM propagators against central finite differences
+    num_samples = inputs[0]
+
+    rng = np.random.default_rng(0)
+    pixel_number = {"x": 64, "y": 48}
+    ampl = tf.Variable(rng.uniform(0.5, 1.0, (2, pixel_number["y"], pixel_number["x"])))
+    phase = tf.Variable(rng.uniform(-np.pi, np.pi, (2, pixel_number["y"], pixel_number["x"])))
+    weights = tf.constant(rng.uniform(0.0, 1.0, (2, pixel_number["y"], pixel_number["x"])))
+
+    fig = plt.figure(figsize=(10, 10))
+    ax = gF.addAxis(fig, 2, 2)
+    for idx, (name, propagator) in enumerate(
+        [("fresnel", fresnel_diffraction_fft), ("ASM", transfer_function_diffraction)]
+    ):
+
+        def loss():
+            out_ampl, out_phase = propagator(
+                ampl,
+                phase,
+                1e-6,
+                50e-6,
+                {"x": 0.5e-6, "y": 0.5e-6},
+                pixel_number,
+                {"x": 0.4e-6, "y": 0.4e-6},
+                tf.float64,
+                False,
+            )
+            return tf.reduce_sum(weights * out_ampl ** 2) + tf.reduce_sum(weights * tf.math.cos(out_phase))
+
+        with tf.GradientTape() as tape:
+            loss_value = loss()
+        gradients = [gradient.numpy() for gradient in tape.gradient(loss_value, [ampl, phase])]
+
+        relative_error = []
+        for variable, gradient in zip([ampl, phase], gradients):
+            for _ in range(num_samples):
+                pixel = tuple(rng.integers(0, dim) for dim in variable.shape)
+                step = np.zeros(variable.shape)
+                step[pixel] = 1e-6
+                variable.assign_add(step)
+                loss_plus = loss().numpy()
+                variable.assign_sub(2 * step)
+                loss_minus = loss().numpy()
+                variable.assign_add(step)
+                finite_difference = (loss_plus - loss_minus) / 2e-6
+                relative_error.append(np.abs(finite_difference - gradient[pixel]) / np.abs(finite_difference))
+        print(name, "max relative error against finite differences: ", np.max(relative_error))
+
+        ax[2 * idx].imshow(gradients[0][0])
+        ax[2 * idx + 1].imshow(gradients[1][0])
+        gF.formatPlots(fig, ax[2 * idx], None, title=name + " amplitude gradient")
+        gF.formatPlots(fig, ax[2 * idx + 1], None, title=name + " phase gradient")
+
+    plt.tight_layout()
+    plt.savefig(savepath + "Adjoint_propagation_gradients")
+    plt.close()
+
+    return
+
+
+def ms_upsampling_modes(inputs):
+    ### Compare the metasurface upsampling modes against a finely (integer) upsampled reference, with the calculation
+    # grid sizes and run times
+    engine = inputs[0]
+
+    def compute_psf(ms_upsampling, initial_sensor_dx_m):
+        simulationSettings = {
+            "wavelength_set_m": [450e-9, 650e-9],
+            "ms_length_m": {"x": 30e-6, "y": 30e-6},
+            "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+            "radius_m": 30e-6 / 2.01,
+            "sensor_distance_m": 60e-6,
+            "initial_sensor_dx_m": {"x": initial_sensor_dx_m, "y": initial_sensor_dx_m},
+            "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+            "sensor_pixel_number": {"x": 41, "y": 41},
+            "radial_symmetry": False,
+            "diffractionEngine": engine,
+            "accurate_measurement": True,
+            "ms_upsampling": ms_upsampling,
+        }
+        parameters = prop_params(simulationSettings, verbose=False)
+        wavelength_set_m = parameters["wavelength_set_m"]
+        ms_trans, ms_phase, _, _ = focus_lens_init(
+            parameters, wavelength_set_m, [1e6 for _ in wavelength_set_m], [{"x": 0, "y": 0} for _ in wavelength_set_m]
+        )
+        point_source_locs = np.array([[0.0, 0.0, 1e6], [2e-6, -1e-6, 5e-3]])
+
+        psf_layer = PSF_Layer(parameters)
+        psf_layer([ms_trans, ms_phase], point_source_locs)
+        start = time.time()
+        psf_intensity, _ = psf_layer([ms_trans, ms_phase], point_source_locs)
+        call_time = time.time() - start
+
+        return psf_intensity.numpy(), call_time, psf_layer.parameters_list[0]["calc_samplesN"]
+
+    psf_ref, _, _ = compute_psf("integer", 40e-9)
+    modes = ["nearest", "integer", "cell_aperture"]
+    fig = plt.figure(figsize=(20, 5))
+    ax = gF.addAxis(fig, 1, 4)
+    cidx = psf_ref.shape[-1] // 2
+    ax[0].plot(psf_ref[0, 0, 0, cidx, :], "k-", label="reference")
+    for idx, mode in enumerate(modes):
+        psf_intensity, call_time, calc_samplesN = compute_psf(mode, 150e-9)
+        mode_error = np.abs(psf_intensity - psf_ref) / np.max(psf_ref)
+        print(
+            engine,
+            mode,
+            "calc grid: ",
+            calc_samplesN["x"],
+            "x",
+            calc_samplesN["y"],
+            " call time (s): ",
+            call_time,
+            " max error / peak: ",
+            np.max(mode_error),
+        )
+        ax[0].plot(psf_intensity[0, 0, 0, cidx, :], ["bx--", "r.--", "g+--"][idx], label=mode)
+        ax[idx + 1].imshow(mode_error[0, 0, 0])
+        gF.formatPlots(fig, ax[idx + 1], None, title=mode + " error / peak")
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Intensity", title="PSF slice", addlegend=True)
+    plt.savefig(savepath + "Ms_upsampling_modes__" + engine)
+    plt.close()
+
+    return
+
+
+def focal_stack_layer(inputs):
+    ### Compare a focal stack against propagating to each plane with its own Propagate_Planes_Layer_Mono (on the same
+    # calculation grid), with run times
+    radial_symmetry = inputs[0]
+    engine = inputs[1]
+    num_planes = inputs[2]
+
+    distances_m = list(np.linspace(40e-6, 90e-6, num_planes))
+    simulationSettings = {
+        "wavelength_m": 550e-9,
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 100e-9, "y": 100e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": engine,
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    ms_trans, ms_phase, _, _ = focus_lens_init(parameters, [550e-9], [60e-6], [{"x": 0, "y": 0}])
+
+    stack_layer = Propagate_Focal_Stack_Layer_Mono(parameters, distances_m)
+    stack_layer([ms_trans, ms_phase])
+    start = time.time()
+    stack_ampl, _ = stack_layer([ms_trans, ms_phase])
+    stack_time = time.time() - start
+
+    plane_layers = []
+    for distance_m in distances_m:
+        simulationSettings["sensor_distance_m"] = distance_m
+        plane_layers.append(Propagate_Planes_Layer_Mono(prop_params(simulationSettings, verbose=False)))
+    [plane_layer([ms_trans, ms_phase]) for plane_layer in plane_layers]
+    start = time.time()
+    plane_ampl = [plane_layer([ms_trans, ms_phase])[0] for plane_layer in plane_layers]
+    plane_time = time.time() - start
+
+    # Chunks of planes match the single pass, in value and gradient
+    ms_phase = tf.Variable(ms_phase)
+    chunked_layer = Propagate_Focal_Stack_Layer_Mono(parameters, distances_m, chunk_size=2)
+    stack_gradients = []
+    for layer in [stack_layer, chunked_layer]:
+        with tf.GradientTape() as tape:
+            ampl, _ = layer([ms_trans, ms_phase])
+            loss = tf.reduce_sum(ampl[:, :, ampl.shape[2] // 2, ampl.shape[3] // 2] ** 2)
+        stack_gradients.append(tape.gradient(loss, ms_phase).numpy())
+    chunked_ampl = ampl.numpy()
+
+    stack_ampl = stack_ampl.numpy()
+    plane_ampl = np.stack([ampl.numpy() for ampl in plane_ampl])
+    print("radial", radial_symmetry, engine, "stack output shape: ", stack_ampl.shape)
+    print("max chunked difference: ", np.max(np.abs(chunked_ampl - stack_ampl)))
+    print("max chunked gradient difference: ", np.max(np.abs(stack_gradients[1] - stack_gradients[0])))
+    print("max difference / peak: ", np.max(np.abs(stack_ampl - plane_ampl)) / np.max(plane_ampl))
+    print("focal stack time (s): ", stack_time, " per-plane layers time (s): ", plane_time)
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = gF.addAxis(fig, 1, 2)
+    ax[0].imshow(stack_ampl[:, 0, stack_ampl.shape[2] // 2, :].T, aspect="auto")
+    ax[1].plot(np.max(stack_ampl[:, 0], axis=(-2, -1)), "k-", label="focal stack")
+    ax[1].plot(np.max(plane_ampl[:, 0], axis=(-2, -1)), "rx", label="per-plane layers")
+    gF.formatPlots(fig, ax[0], None, xlabel="plane", ylabel="pixel", title="Axial scan")
+    gF.formatPlots(fig, ax[1], None, xlabel="plane", ylabel="Peak amplitude", title="Peak amplitude", addlegend=True)
+    plt.savefig(savepath + "Focal_stack_propagation__radial" + str(radial_symmetry) + "_" + engine)
+    plt.close()
+
+    return
+
+
+def cascaded_elements(inputs):
+    ### Compare a cascade of a lens and a transparent element against propagating the lens field directly to the output
+    # plane (over the summed distance), then compute the focal spot of a doublet of two lenses, with run times. The lens
+    # is apodized since the elements are opaque outside of the lens grid (edge diffraction beyond it is clipped)
+    radial_symmetry = inputs[0]
+    engine = inputs[1]
+
+    gap_m = 20e-6
+    simulationSettings = {
+        "wavelength_m": 550e-9,
+        "ms_length_m": {"x": 30e-6, "y": 30e-6},
+        "ms_dx_m": {"x": 350e-9, "y": 350e-9},
+        "radius_m": 30e-6 / 2.01,
+        "sensor_distance_m": 60e-6,
+        "initial_sensor_dx_m": {"x": 150e-9, "y": 150e-9},
+        "sensor_pixel_size_m": {"x": 300e-9, "y": 300e-9},
+        "sensor_pixel_number": {"x": 41, "y": 41},
+        "radial_symmetry": radial_symmetry,
+        "diffractionEngine": engine,
+        "accurate_measurement": True,
+    }
+    parameters = prop_params(simulationSettings, verbose=False)
+    ms_trans, ms_phase, _, _ = focus_lens_init(parameters, [550e-9], [60e-6], [{"x": 0, "y": 0}])
+    ms_samplesM = parameters["ms_samplesM"]
+    if radial_symmetry:
+        radius_sq = (np.arange(ms_samplesM["r"]) * parameters["ms_dx_m"]["x"])[None, None, :] ** 2
+    else:
+        x = (np.arange(ms_samplesM["x"]) - ms_samplesM["x"] // 2) * parameters["ms_dx_m"]["x"]
+        radius_sq = (x[None, :] ** 2 + x[:, None] ** 2)[None]
+    ms_trans = ms_trans * np.exp(-radius_sq / (7e-6) ** 2)
+    direct_ampl, _ = Propagate_Planes_Layer_Mono(parameters)([ms_trans, ms_phase])
+
+    simulationSettings["sensor_distance_m"] = 60e-6 - gap_m
+    cascade_parameters = prop_params(simulationSettings, verbose=False)
+    cascade_layer = Propagate_Cascade_Layer_Mono(cascade_parameters, [gap_m])
+    start = time.time()
+    cascade_ampl, _ = cascade_layer([np.stack([ms_trans, np.ones_like(ms_trans)]), np.stack([ms_phase, 0 * ms_phase])])
+    cascade_time = time.time() - start
+
+    # A doublet of two lenses, each of twice the focal length, focusing near the same plane
+    lens_trans, lens_phase, _, _ = focus_lens_init(parameters, [550e-9], [120e-6], [{"x": 0, "y": 0}])
+    doublet_ampl, _ = cascade_layer([np.stack([lens_trans, lens_trans]), np.stack([lens_phase, lens_phase])])
+
+    direct_ampl = direct_ampl.numpy()
+    cascade_ampl = cascade_ampl.numpy()
+    doublet_ampl = doublet_ampl.numpy()
+    print("radial", radial_symmetry, engine, "cascade output shape: ", cascade_ampl.shape)
+    print("max difference / peak: ", np.max(np.abs(cascade_ampl - direct_ampl)) / np.max(direct_ampl))
+    print("cascade time (s): ", cascade_time)
+
+    fig = plt.figure(figsize=(15, 5))
+    ax = gF.addAxis(fig, 1, 3)
+    ax[0].plot(direct_ampl[0, direct_ampl.shape[1] // 2, :], "k-", label="direct")
+    ax[0].plot(cascade_ampl[0, cascade_ampl.shape[1] // 2, :], "rx", label="cascade")
+    ax[1].plot(np.abs(cascade_ampl - direct_ampl)[0, cascade_ampl.shape[1] // 2, :], "k-")
+    ax[2].plot(doublet_ampl[0, doublet_ampl.shape[1] // 2, :], "b-")
+    gF.formatPlots(fig, ax[0], None, xlabel="pixel", ylabel="Amplitude", title="Lens and clear element", addlegend=True)
+    gF.formatPlots(fig, ax[1], None, xlabel="pixel", ylabel="Absolute difference", title="Difference")
+    gF.formatPlots(fig, ax[2], None, xlabel="pixel", ylabel="Amplitude", title="Doublet")
+    plt.savefig(savepath + "Cascaded_elements__radial" + str(radial_symmetry) + "_" + engine)
+    plt.close()
+
+    return
+
+
 def run_all_tests():
     fun = [
         diff_limited_psfs,
+        hankel_transform_accuracy,
+        single_precision_accuracy,
+        single_precision_accuracy,
+        intensity_only_psf,
+        detector_resampling_accuracy,
+        czt_fresnel_engine,
+        czt_fresnel_engine,
+        bandlimited_asm_engine,
+        bandlimited_asm_engine,
+        roi_propagation_psf,
+        roi_propagation_psf,
+        psf_field_bank,
+        depth_psf_cache,
+        psf_executor_sharding,
+        psf_store_sweep,
+        batched_mtf_slices,
+        batched_mtf_slices,
+        stage_profile_report,
+        stage_profile_report,
+        compiled_psf_layer,
+        compiled_psf_layer,
+        compiled_psf_layer,
+        compiled_psf_layer,
+        recompute_psf_gradients,
+        recompute_psf_gradients,
+        adjoint_propagation_gradients,
+        ms_upsampling_modes,
+        ms_upsampling_modes,
+        focal_stack_layer,
+        focal_stack_layer,
+        cascaded_elements,
+        cascaded_elements,
         # diff_limited_psfs,
         # diff_limited_psfs,
         # diff_limited_psfs,
@@ -246,6 +1463,38 @@ def run_all_tests():
     ]
     arguments = [
         [True, "fresnel_fourier"],
+        [2001],
+        [False, "fresnel_fourier"],
+        [True, "ASM_fourier"],
+        [False, "ASM_fourier"],
+        [2.37],
+        [False],
+        [True],
+        [False],
+        [True],
+        [False, "fresnel_fourier"],
+        [True, "ASM_bandlimited"],
+        [None],
+        [0.01],
+        [4],
+        [2 ** 30],
+        [False],
+        [True],
+        [False],
+        [True],
+        [False, "fresnel_fourier", "qdht"],
+        [True, "fresnel_fourier", "qdht"],
+        [True, "ASM_fourier", "fht"],
+        [True, "fresnel_czt", "qdht"],
+        [False],
+        [True],
+        [10],
+        ["ASM_bandlimited"],
+        ["fresnel_fourier"],
+        [False, "ASM_fourier", 32],
+        [True, "ASM_bandlimited", 32],
+        [False, "ASM_bandlimited"],
+        [True, "ASM_fourier"],
         # [True, "ASM_fourier"],
         # [False, "fresnel_fourier"],
         # [False, "ASM_fourier"],